@@ -0,0 +1,218 @@
+#!/usr/bin/env python3
+"""
+端到端检测延迟跟踪 - 从网站变化到通知送达
+
+每个变化事件在第一次被抓取到时记录 first_observed，并记下限定它的两个量：
+- poll_interval：上一次成功抓取到本次抓取开始的时间（变化最早可能在这之前就已出现），不含本次抓取耗时
+- fetch_seconds：本次抓取（打开页面、等待、提取）耗时
+通知送达后按渠道写一行记录到 logs/alert_latency.jsonl：
+- pipeline_seconds：first_observed → delivered（对比、积攒、发送的耗时）
+- worst_case_seconds：pipeline + poll_interval + fetch_seconds（网站变化到送达的上限）
+
+查看各渠道 p50/p95：python3 alert_latency.py report --days 7
+"""
+
+import os
+import json
+import logging
+from datetime import datetime, timedelta
+
+from atomic_io import read_json, write_json
+from change_events import iter_change_events, product_key
+
+logger = logging.getLogger(__name__)
+
+PENDING_FILE = os.path.join('data', 'alert_latency_pending.json')
+LATENCY_LOG = os.path.join('logs', 'alert_latency.jsonl')
+
+# 超过这个时间仍未送达的事件（例如被去重抑制）不再跟踪
+PENDING_MAX_AGE = timedelta(days=7)
+
+
+def event_id(event):
+    """事件标识：商品 + 事件类型"""
+    return f"{product_key(event['product'])}|{event['type']}"
+
+
+class LatencyTracker:
+    """记录事件的首次发现和送达时间"""
+
+    def __init__(self, pending_file=PENDING_FILE, log_file=LATENCY_LOG):
+        self.pending_file = pending_file
+        self.log_file = log_file
+        self.pending = self._load()
+        self._delivered = set()
+
+    def _load(self):
+        try:
+            return read_json(self.pending_file, {})
+        except Exception as e:
+            logger.warning(f"加载延迟跟踪数据失败: {e}")
+            return {}
+
+    def observe(self, changes, observed_at=None, poll_interval=None, fetch_seconds=None):
+        """记录本次发现的事件；已在跟踪中的事件保留最早的发现时间"""
+        observed_at = observed_at or datetime.now()
+        for event in iter_change_events(changes):
+            self.pending.setdefault(event_id(event), {
+                'first_observed': observed_at.isoformat(),
+                'poll_interval': poll_interval,
+                'fetch_seconds': fetch_seconds,
+            })
+
+    def delivered(self, changes, channel, delivered_at=None):
+        """记录某个渠道已送达这些事件"""
+        delivered_at = delivered_at or datetime.now()
+        records = []
+        for event in iter_change_events(changes):
+            eid = event_id(event)
+            observed = self.pending.get(eid)
+            if not observed:
+                continue
+
+            first_observed = datetime.fromisoformat(observed['first_observed'])
+            pipeline = (delivered_at - first_observed).total_seconds()
+            bound = pipeline + (observed.get('poll_interval') or 0) + (observed.get('fetch_seconds') or 0)
+            records.append({
+                'event': event['type'],
+                'product': product_key(event['product']),
+                'channel': channel,
+                'first_observed': observed['first_observed'],
+                'delivered': delivered_at.isoformat(),
+                'poll_interval': observed.get('poll_interval'),
+                'fetch_seconds': observed.get('fetch_seconds'),
+                'pipeline_seconds': round(pipeline, 3),
+                'worst_case_seconds': round(bound, 3),
+            })
+            self._delivered.add(eid)
+
+        if records:
+            try:
+                os.makedirs(os.path.dirname(self.log_file) or '.', exist_ok=True)
+                with open(self.log_file, 'a', encoding='utf-8') as f:
+                    for record in records:
+                        f.write(json.dumps(record, ensure_ascii=False) + '\n')
+            except Exception as e:
+                logger.warning(f"写入延迟记录失败: {e}")
+
+    def save(self, now=None):
+        """移除已送达和过期的事件后保存"""
+        now = now or datetime.now()
+        for eid in list(self.pending):
+            if eid in self._delivered:
+                del self.pending[eid]
+                continue
+            try:
+                if now - datetime.fromisoformat(self.pending[eid]['first_observed']) > PENDING_MAX_AGE:
+                    del self.pending[eid]
+            except (KeyError, ValueError):
+                del self.pending[eid]
+        self._delivered = set()
+
+        try:
+            write_json(self.pending_file, self.pending)
+        except Exception as e:
+            logger.error(f"保存延迟跟踪数据失败: {e}")
+
+
+def seconds_since_mtime(path, now=None):
+    """距文件最后修改的秒数（用来估算上一次成功抓取的时间），文件不存在返回 None"""
+    if not os.path.exists(path):
+        return None
+    now = now or datetime.now()
+    return round(now.timestamp() - os.path.getmtime(path), 3)
+
+
+def percentile(values, q):
+    """线性插值百分位数"""
+    if not values:
+        return None
+    values = sorted(values)
+    pos = (len(values) - 1) * q
+    lower = int(pos)
+    upper = min(lower + 1, len(values) - 1)
+    return values[lower] + (values[upper] - values[lower]) * (pos - lower)
+
+
+def load_records(log_file=LATENCY_LOG, days=None):
+    """读取延迟记录，可只保留最近几天"""
+    if not os.path.exists(log_file):
+        return []
+    since = datetime.now() - timedelta(days=days) if days else None
+    records = []
+    with open(log_file, 'r', encoding='utf-8') as f:
+        for line in f:
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if since and datetime.fromisoformat(record['delivered']) < since:
+                continue
+            records.append(record)
+    return records
+
+
+def build_report(records, group_by='channel'):
+    """按渠道（或其他字段）汇总 p50/p95"""
+    groups = {}
+    for record in records:
+        key = record.get(group_by)
+        # 轮询间隔按分钟分桶，便于对比不同的调度配置
+        if group_by == 'poll_interval' and key is not None:
+            key = f"{round(key / 60)}m"
+        groups.setdefault(str(key), []).append(record)
+
+    report = {}
+    for key, items in sorted(groups.items()):
+        pipeline = [r['pipeline_seconds'] for r in items]
+        worst = [r['worst_case_seconds'] for r in items]
+        fetch = [r['fetch_seconds'] for r in items if r.get('fetch_seconds') is not None]
+        poll = [r['poll_interval'] for r in items if r.get('poll_interval') is not None]
+        report[key] = {
+            'count': len(items),
+            'pipeline_p50': percentile(pipeline, 0.5),
+            'pipeline_p95': percentile(pipeline, 0.95),
+            'worst_case_p50': percentile(worst, 0.5),
+            'worst_case_p95': percentile(worst, 0.95),
+            'fetch_p50': percentile(fetch, 0.5),
+            'poll_interval_p50': percentile(poll, 0.5),
+        }
+    return report
+
+
+def _fmt(seconds):
+    if seconds is None:
+        return '-'
+    if seconds >= 120:
+        return f"{seconds / 60:.1f}m"
+    return f"{seconds:.1f}s"
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description='通知延迟报告')
+    parser.add_argument('command', nargs='?', default='report', choices=['report'])
+    parser.add_argument('--days', type=float, default=None, help='只统计最近几天')
+    parser.add_argument('--by', default='channel', choices=['channel', 'event', 'poll_interval'],
+                        help='分组字段，默认按渠道')
+    parser.add_argument('--log-file', default=LATENCY_LOG)
+    args = parser.parse_args()
+
+    records = load_records(args.log_file, args.days)
+    if not records:
+        print("还没有送达记录")
+        return
+
+    report = build_report(records, args.by)
+    print(f"{args.by:<20} {'数量':>6} {'流程p50':>9} {'流程p95':>9} {'上限p50':>9} {'上限p95':>9} {'抓取p50':>9} {'间隔p50':>9}")
+    for key, row in report.items():
+        print(f"{key:<20} {row['count']:>6} {_fmt(row['pipeline_p50']):>9} {_fmt(row['pipeline_p95']):>9} "
+              f"{_fmt(row['worst_case_p50']):>9} {_fmt(row['worst_case_p95']):>9} "
+              f"{_fmt(row['fetch_p50']):>9} {_fmt(row['poll_interval_p50']):>9}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+"""
+通知去重账本 - 抑制懒加载截断导致的"下架/新品"反复通知
+
+- 冷却期：同一 (商品, 事件类型, 值) 发出后在 TTL 内只通知一次
+- 迟滞：商品连续 N 次运行都缺失才算下架；期间重新出现则视为闪烁，不发"新品"
+"""
+
+import os
+import logging
+from datetime import datetime, timedelta
+
+from atomic_io import read_json, write_json
+from change_events import (
+    EVENT_ADDED, EVENT_REMOVED, EVENT_PRICE_CHANGE,
+    iter_change_events, events_to_changes, product_key,
+)
+
+logger = logging.getLogger(__name__)
+
+LEDGER_FILE = os.path.join('data', 'notification_ledger.json')
+
+# 默认冷却 24 小时，连续缺失 3 次才确认下架
+DEFAULT_COOLDOWN_HOURS = float(os.getenv('ALERT_COOLDOWN_HOURS', '24'))
+DEFAULT_REMOVAL_CONFIRM_RUNS = int(os.getenv('REMOVAL_CONFIRM_RUNS', '3'))
+
+
+class NotificationLedger:
+    """持久化的通知账本"""
+
+    def __init__(self, filename=LEDGER_FILE, cooldown_hours=DEFAULT_COOLDOWN_HOURS,
+                 removal_confirm_runs=DEFAULT_REMOVAL_CONFIRM_RUNS):
+        self.filename = filename
+        self.cooldown = timedelta(hours=cooldown_hours)
+        self.removal_confirm_runs = max(1, removal_confirm_runs)
+        self.state = self._load()
+
+    def _load(self):
+        """加载账本，损坏或不存在时从空账本开始"""
+        state = {'sent': {}, 'missing': {}}
+        try:
+            state.update(read_json(self.filename, {}))
+        except Exception as e:
+            logger.warning(f"加载通知账本失败，将重新开始: {e}")
+        return state
+
+    def save(self):
+        """保存账本"""
+        try:
+            write_json(self.filename, self.state)
+        except Exception as e:
+            logger.error(f"保存通知账本失败: {e}")
+
+    @staticmethod
+    def _event_key(event):
+        """账本键：商品 + 事件类型 + 值（价格）"""
+        if event['type'] == EVENT_REMOVED:
+            value = ''
+        elif event['type'] == EVENT_PRICE_CHANGE:
+            value = event.get('new_price') or ''
+        else:
+            value = event['product'].get('price') or ''
+        return f"{product_key(event['product'])}|{event['type']}|{value}"
+
+    def _in_cooldown(self, key, now):
+        sent_at = self.state['sent'].get(key)
+        if not sent_at:
+            return False
+        try:
+            return now - datetime.fromisoformat(sent_at) < self.cooldown
+        except ValueError:
+            return False
+
+    def filter_changes(self, changes, current_products, now=None):
+        """过滤本次变化，返回真正需要通知的变化（monitor.py 格式）
+
+        current_products 为本次抓到的完整商品列表，用来判断待确认下架的商品
+        是否仍然缺失。这里只过滤，不记为已发送：实际发出后调用 record_sent()，
+        否则积攒中或发送失败的事件会在整个冷却期内被抑制。确认下架的商品也留在待确认列表中，
+        直到 record_sent() 确认通知已发出，发送失败时下次运行会再次产生下架事件。
+        调用后需要 save() 才会持久化。
+        """
+        now = now or datetime.now()
+        missing = self.state['missing']
+        current_keys = {product_key(p) for p in current_products}
+
+        events = []
+        recovered = set()
+        suppressed = 0
+
+        # 之前缺失的商品：重新出现则视为闪烁并取消，仍缺失则累加计数
+        for pid in list(missing):
+            if pid in current_keys:
+                # 已确认下架（但还没发出）的商品重新出现时照常发"新品"，与队列中的下架事件抵消
+                if missing.pop(pid)['count'] < self.removal_confirm_runs:
+                    recovered.add(pid)
+                continue
+            missing[pid]['count'] += 1
+            if missing[pid]['count'] >= self.removal_confirm_runs:
+                events.append({'type': EVENT_REMOVED, 'product': missing[pid]['product']})
+
+        for event in iter_change_events(changes):
+            pid = product_key(event['product'])
+
+            if event['type'] == EVENT_REMOVED:
+                if self.removal_confirm_runs <= 1:
+                    events.append(event)
+                else:
+                    missing[pid] = {'count': 1, 'product': event['product'],
+                                    'first_missing': now.isoformat()}
+                    suppressed += 1
+                continue
+
+            if event['type'] == EVENT_ADDED and pid in recovered:
+                suppressed += 1
+                continue
+
+            events.append(event)
+
+        # 冷却期内的重复事件不再通知
+        result = []
+        for event in events:
+            key = self._event_key(event)
+            if self._in_cooldown(key, now):
+                if event['type'] == EVENT_REMOVED:
+                    missing.pop(product_key(event['product']), None)
+                suppressed += 1
+                continue
+            result.append(event)
+
+        self._prune(now)
+        if suppressed:
+            logger.info(f"通知去重: 抑制 {suppressed} 条事件，发送 {len(result)} 条")
+        return events_to_changes(result)
+
+    def record_sent(self, changes, now=None):
+        """把已经发出的变化记入冷却期，已发出的下架事件不再待确认"""
+        now = now or datetime.now()
+        for event in iter_change_events(changes):
+            self.state['sent'][self._event_key(event)] = now.isoformat()
+            if event['type'] == EVENT_REMOVED:
+                self.state['missing'].pop(product_key(event['product']), None)
+
+    def _prune(self, now):
+        """清理过期的冷却记录"""
+        sent = self.state['sent']
+        for key in list(sent):
+            try:
+                if now - datetime.fromisoformat(sent[key]) >= self.cooldown:
+                    del sent[key]
+            except ValueError:
+                del sent[key]
@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""
+Arc'teryx Outlet 监控工具 - 统一入口
+
+只在需要时才导入对应的模块：HTTP 版和通知不会加载 Selenium，
+所以 `arcmon.py run lite`、`arcmon.py notify` 的启动时间不受浏览器依赖影响。
+
+用法：
+  python3 arcmon.py run                  # 默认 undetected-chromedriver 版（monitor.py）
+  python3 arcmon.py run optimized --profile mem
+  python3 arcmon.py run lite             # 纯 HTTP 版
+  python3 arcmon.py run auto             # 自动选择最便宜的可用抓取方式（fetch_backends.py）
+  python3 arcmon.py notify --email --webhook URL
+  python3 arcmon.py metrics show -n 5
+  python3 arcmon.py latency report --days 7
+"""
+
+import sys
+import runpy
+import argparse
+
+# 后端名称 → 模块（按需导入）
+BACKENDS = {
+    'monitor': 'monitor',
+    'final': 'monitor_final',
+    'json': 'monitor_json',
+    'optimized': 'monitor_optimized',
+    'selenium': 'monitor_selenium',
+    'lite': 'monitor_lite',
+    'auto': 'fetch_backends',
+}
+
+# 子命令 → (模块, 说明)
+COMMANDS = {
+    'notify': ('send_notification', '发送变化通知（邮件 / Webhook / SNS）'),
+    'metrics': ('run_metrics', '查看运行指标或暴露 Prometheus 指标'),
+    'latency': ('alert_latency', '通知延迟报告'),
+    'profile': ('profiling', '查看或对比剖析结果'),
+    'bench': ('bench_startup', '启动时间基准测试'),
+}
+
+
+def run_module(module, argv):
+    """以脚本方式运行模块，等价于 python3 <module>.py <argv>"""
+    sys.argv = [f'{module}.py'] + list(argv)
+    runpy.run_module(module, run_name='__main__', alter_sys=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Arc'teryx Outlet 监控工具",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog='\n'.join(
+            [f"  run [{'|'.join(BACKENDS)}]  运行一次监控（默认 monitor）"] +
+            [f"  {name:<10} {help_text}" for name, (_, help_text) in COMMANDS.items()]
+        ),
+    )
+    parser.add_argument('command', choices=['run'] + list(COMMANDS), help='子命令')
+    parser.add_argument('args', nargs=argparse.REMAINDER, help='传给子命令的参数')
+    args = parser.parse_args(argv)
+
+    if args.command == 'run':
+        rest = args.args
+        backend = 'monitor'
+        if rest and rest[0] in BACKENDS:
+            backend, rest = rest[0], rest[1:]
+        run_module(BACKENDS[backend], rest)
+    else:
+        run_module(COMMANDS[args.command][0], args.args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,306 @@
+#!/usr/bin/env python3
+"""
+数据文件的原子写入和损坏恢复
+
+以前 save_data / save_current_data / save_changes 直接用 'w' 打开目标文件写 JSON，
+写到一半被 OOM 杀掉或断电就留下半截的 baseline.json，下一次运行把它当成首次运行，
+重新建立基准，期间的变化全部丢失。现在所有数据文件都经过这里：
+- 先写独立的临时文件，再用 os.replace 原子替换，主文件在任何时刻都存在
+- 替换前用硬链接（不支持时复制）把旧文件保留为 <文件>.bak；旧文件本身已损坏时保留原来的 .bak
+- 写完后在 <文件>.sha256 记录校验和和大小；校验和文件是提交点，
+  写入中途崩溃时读者看到的不一致会按损坏处理并回退到 .bak
+- 同一进程内的读写互斥，读者只会看到完整的旧文件或新文件
+- read_json() 校验失败或解析失败时使用 .bak，不再重新建立基准；
+  主文件由下一次写入替换，或用 check --repair 立即修复
+
+fsync 策略（环境变量 DATA_DURABILITY）：
+- always：每次写入都 fsync 文件和目录，最安全也最慢
+- batch（默认）：写入只做原子替换，进程退出时对本次写过的文件统一 fsync 一次；
+  断电丢失的最多是本次运行的写入，读者能通过校验和发现并回退到 .bak
+- none：从不 fsync，交给操作系统
+"""
+
+import os
+import json
+import atexit
+import shutil
+import hashlib
+import logging
+import tempfile
+import threading
+
+import run_metrics
+
+logger = logging.getLogger(__name__)
+
+DURABILITY_ALWAYS = 'always'
+DURABILITY_BATCH = 'batch'
+DURABILITY_NONE = 'none'
+
+DATA_DURABILITY = os.getenv('DATA_DURABILITY', DURABILITY_BATCH)
+if DATA_DURABILITY not in (DURABILITY_ALWAYS, DURABILITY_BATCH, DURABILITY_NONE):
+    logger.warning(f"未知的 DATA_DURABILITY={DATA_DURABILITY}，使用 {DURABILITY_BATCH}")
+    DATA_DURABILITY = DURABILITY_BATCH
+
+BACKUP_SUFFIX = '.bak'
+CHECKSUM_SUFFIX = '.sha256'
+
+# batch 模式下等待统一 fsync 的文件
+_pending = set()
+_pending_lock = threading.Lock()
+
+# 同一进程内对数据文件的写入和读取串行进行：
+# 写入分两步替换数据和校验和，读者不会看到两者不一致的中间状态
+_file_lock = threading.RLock()
+
+
+class CorruptFileError(ValueError):
+    """文件内容与校验和不符或无法解析"""
+
+
+def _checksum_path(path):
+    return path + CHECKSUM_SUFFIX
+
+
+def _fsync_file(path):
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def _fsync_dir(directory):
+    # Windows 不支持打开目录
+    try:
+        _fsync_file(directory or '.')
+    except OSError:
+        pass
+
+
+def _temp_name(path):
+    """在目标目录中创建临时文件（每次写入独立，并发写入不会互相覆盖）"""
+    fd, tmp_file = tempfile.mkstemp(prefix=os.path.basename(path) + '.', suffix='.tmp',
+                                    dir=os.path.dirname(path) or '.')
+    os.close(fd)
+    return tmp_file
+
+
+def _write_file(path, data, durability):
+    """写入临时文件后原子替换 path"""
+    tmp_file = _temp_name(path)
+    try:
+        with open(tmp_file, 'wb') as f:
+            f.write(data)
+            if durability == DURABILITY_ALWAYS:
+                f.flush()
+                os.fsync(f.fileno())
+        # mkstemp 创建的文件只有属主可读，保持与原文件相同的权限
+        try:
+            mode = os.stat(path).st_mode & 0o777
+        except FileNotFoundError:
+            mode = 0o644
+        os.chmod(tmp_file, mode)
+        os.replace(tmp_file, path)
+    except BaseException:
+        try:
+            os.remove(tmp_file)
+        except OSError:
+            pass
+        raise
+
+
+def _link_file(source, target):
+    """把 source 原子地复制为 target（优先硬链接），source 本身保持不动"""
+    tmp_file = _temp_name(target)
+    try:
+        try:
+            os.remove(tmp_file)
+            os.link(source, tmp_file)
+        except OSError:
+            # 不支持硬链接的文件系统
+            shutil.copyfile(source, tmp_file)
+        os.replace(tmp_file, target)
+    except BaseException:
+        try:
+            os.remove(tmp_file)
+        except OSError:
+            pass
+        raise
+
+
+def _commit(path, data, durability):
+    """写入数据和校验和；校验和写完后这次写入才算完成"""
+    directory = os.path.dirname(path)
+    _write_file(path, data, durability)
+    digest = hashlib.sha256(data).hexdigest()
+    _write_file(_checksum_path(path), f"{digest} {len(data)}\n".encode('ascii'), durability)
+
+    if durability == DURABILITY_ALWAYS:
+        _fsync_dir(directory)
+    elif durability == DURABILITY_BATCH:
+        with _pending_lock:
+            _pending.update((path, _checksum_path(path)))
+
+
+def _backup(path):
+    """把当前文件保留为 .bak；当前文件损坏时保留原来的 .bak，不把损坏的文件轮换进去"""
+    try:
+        verify(path)
+    except FileNotFoundError:
+        return
+    except (OSError, CorruptFileError) as e:
+        logger.warning(f"⚠️  {e}，保留原来的备份")
+        return
+    backup = path + BACKUP_SUFFIX
+    if os.path.exists(_checksum_path(path)):
+        _link_file(path, backup)
+        _link_file(_checksum_path(path), _checksum_path(backup))
+    else:
+        # 旧版本写的文件没有校验和，备份也不能带着上一轮的校验和
+        _link_file(path, backup)
+        try:
+            os.remove(_checksum_path(backup))
+        except FileNotFoundError:
+            pass
+
+
+def write_bytes(path, data, durability=None, backup=True):
+    """原子写入字节；backup 为 True 时把旧文件保留为 .bak
+
+    旧文件通过硬链接（或复制）保留，主文件在任何时刻都存在。
+    """
+    durability = durability or DATA_DURABILITY
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with _file_lock:
+        if backup:
+            _backup(path)
+        _commit(path, data, durability)
+
+
+def write_json(path, data, indent=2, durability=None, backup=True):
+    """原子写入 JSON（格式与以前的 json.dump(..., ensure_ascii=False, indent=2) 相同）"""
+    text = json.dumps(data, ensure_ascii=False, indent=indent)
+    write_bytes(path, text.encode('utf-8'), durability, backup)
+
+
+def verify(path):
+    """读取并校验文件，返回字节；没有校验和文件时（旧版本写的文件）不校验"""
+    with open(path, 'rb') as f:
+        data = f.read()
+    checksum_file = _checksum_path(path)
+    if os.path.exists(checksum_file):
+        with open(checksum_file, 'r', encoding='ascii') as f:
+            parts = f.read().split()
+        if len(parts) != 2 or parts[1] != str(len(data)) or parts[0] != hashlib.sha256(data).hexdigest():
+            raise CorruptFileError(f"{path} 校验和不符（{len(data)} 字节）")
+    return data
+
+
+def _parse(path):
+    data = verify(path)
+    try:
+        return json.loads(data.decode('utf-8'))
+    except ValueError as e:
+        raise CorruptFileError(f"{path} 无法解析: {e}") from e
+
+
+def read_json(path, default=None):
+    """读取 JSON；主文件损坏时回退到 .bak，都不可用时返回 default
+
+    不在这里修复主文件（可能与写入者竞争），下一次写入会替换损坏的主文件并保留 .bak；
+    需要立即修复时运行 atomic_io.py check --repair。
+    """
+    backup = path + BACKUP_SUFFIX
+    with _file_lock:
+        if not os.path.exists(path) and not os.path.exists(backup):
+            return default
+
+        try:
+            return _parse(path)
+        except FileNotFoundError:
+            error = f"{path} 不存在"
+        except (OSError, CorruptFileError) as e:
+            error = e
+
+        run_metrics.current().add('data_corrupt', 1, file=os.path.basename(path))
+        try:
+            data = _parse(backup)
+        except (OSError, CorruptFileError) as e:
+            logger.error(f"✗ {error}，备份也不可用（{e}）")
+            return default
+
+    logger.warning(f"⚠️  {error}，已使用 {os.path.basename(backup)}")
+    run_metrics.current().add('data_recovered', 1, file=os.path.basename(path))
+    return data
+
+
+def repair(path):
+    """用 .bak 覆盖损坏的主文件，返回是否修复"""
+    backup = path + BACKUP_SUFFIX
+    with _file_lock:
+        try:
+            _parse(path)
+            return True
+        except (OSError, CorruptFileError):
+            pass
+        try:
+            data = verify(backup)
+            _parse(backup)
+        except (OSError, CorruptFileError):
+            return False
+        write_bytes(path, data, backup=False)
+        return True
+
+
+def sync():
+    """batch 模式：对本次写过的文件和所在目录统一 fsync"""
+    with _pending_lock:
+        paths = sorted(_pending)
+        _pending.clear()
+    directories = set()
+    for path in paths:
+        try:
+            _fsync_file(path)
+        except OSError:
+            # 文件可能已被下一次写入替换或删除
+            continue
+        directories.add(os.path.dirname(path))
+    for directory in directories:
+        _fsync_dir(directory)
+    return len(paths)
+
+
+atexit.register(sync)
+
+
+def main():
+    import argparse
+    import glob
+
+    parser = argparse.ArgumentParser(description='检查数据文件的完整性')
+    sub = parser.add_subparsers(dest='command')
+    check_parser = sub.add_parser('check', help='校验数据文件，默认检查 data/*.json')
+    check_parser.add_argument('files', nargs='*')
+    check_parser.add_argument('--repair', action='store_true', help='损坏时从 .bak 恢复')
+    args = parser.parse_args()
+
+    if args.command == 'check':
+        files = args.files or sorted(glob.glob(os.path.join('data', '*.json')))
+        bad = 0
+        for path in files:
+            try:
+                _parse(path)
+                print(f"✓ {path}")
+            except (OSError, CorruptFileError) as e:
+                bad += 1
+                print(f"✗ {e}")
+                if args.repair:
+                    restored = repair(path)
+                    print(f"  {'已从备份恢复' if restored else '备份也不可用'}")
+        raise SystemExit(1 if bad else 0)
+    parser.print_help()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""
+启动时间基准测试 - 基于 python -X importtime
+
+对每个场景多次冷启动解释器并导入对应模块，记录：
+- 中位数耗时（包括解释器本身的启动）
+- 导入最慢的顶层模块
+- 不应出现的重量级依赖（例如通知路径加载了 Selenium）
+
+结果追加到 logs/startup_bench.jsonl，可用来跟踪启动时间的变化：
+  python3 bench_startup.py            # 所有场景，各运行 5 次
+  python3 bench_startup.py -n 10 notify http
+"""
+
+import os
+import sys
+import json
+import time
+import statistics
+import subprocess
+from datetime import datetime
+
+BENCH_LOG = os.path.join('logs', 'startup_bench.jsonl')
+
+# 场景 → (导入语句, 启动预算毫秒数, 不应加载的模块)
+SCENARIOS = {
+    'python': ('pass', None, ()),
+    'cli': ('import arcmon', 200, ('selenium', 'undetected_chromedriver', 'requests')),
+    'notify': ('import send_notification', 200, ('selenium', 'undetected_chromedriver', 'requests')),
+    'http': ('import monitor_lite', 200, ('selenium', 'undetected_chromedriver')),
+    'monitor': ('import monitor', None, ('selenium', 'undetected_chromedriver')),
+    'browser': ('import monitor_optimized', None, ()),
+}
+
+
+def parse_importtime(stderr):
+    """解析 -X importtime 输出，返回 {顶层模块: 累计微秒} 和所有已导入模块名"""
+    top_level = {}
+    modules = set()
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        parts = line[len('import time:'):].split('|')
+        if len(parts) != 3:
+            continue
+        _, cumulative_us, name = parts
+        # 名称前有一个空格，每深一层多两个空格
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        name = name.strip()
+        modules.add(name.split('.')[0])
+        if depth == 0:
+            top_level[name] = top_level.get(name, 0) + int(cumulative_us)
+    return top_level, modules
+
+
+def run_scenario(name, repeat=5):
+    """冷启动运行一个场景，返回结果记录"""
+    statement, budget_ms, forbidden = SCENARIOS[name]
+    timings = []
+    top_level, modules, error = {}, set(), None
+
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', statement],
+            capture_output=True, text=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        )
+        timings.append((time.perf_counter() - start) * 1000)
+        if result.returncode != 0:
+            error = result.stderr.strip().splitlines()[-1] if result.stderr.strip() else 'failed'
+            break
+        top_level, modules = parse_importtime(result.stderr)
+
+    median_ms = statistics.median(timings)
+    slowest = sorted(top_level.items(), key=lambda item: item[1], reverse=True)[:8]
+    return {
+        'scenario': name,
+        'statement': statement,
+        'median_ms': round(median_ms, 1),
+        'min_ms': round(min(timings), 1),
+        'budget_ms': budget_ms,
+        'over_budget': bool(budget_ms and median_ms > budget_ms),
+        'forbidden_loaded': sorted(set(forbidden) & modules),
+        'slowest_imports': [{'module': m, 'ms': round(us / 1000, 1)} for m, us in slowest],
+        'error': error,
+    }
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description='启动时间基准测试')
+    parser.add_argument('scenarios', nargs='*', help=f"要测试的场景（{', '.join(SCENARIOS)}），默认全部")
+    parser.add_argument('-n', type=int, default=5, help='每个场景的运行次数')
+    parser.add_argument('--no-log', action='store_true', help='不写入 logs/startup_bench.jsonl')
+    args = parser.parse_args()
+
+    names = args.scenarios or list(SCENARIOS)
+    unknown = [name for name in names if name not in SCENARIOS]
+    if unknown:
+        parser.error(f"未知的场景: {', '.join(unknown)}")
+
+    records = []
+    failed = False
+    for name in names:
+        record = run_scenario(name, args.n)
+        records.append(record)
+
+        budget = f"/ {record['budget_ms']}ms" if record['budget_ms'] else ''
+        mark = '❌' if record['over_budget'] or record['forbidden_loaded'] or record['error'] else '✓'
+        print(f"{mark} {name:<8} {record['median_ms']:>7.1f}ms {budget}")
+        if record['error']:
+            print(f"    导入失败: {record['error']}")
+        if record['forbidden_loaded']:
+            print(f"    不应加载: {', '.join(record['forbidden_loaded'])}")
+        for item in record['slowest_imports'][:5]:
+            print(f"    {item['ms']:>7.1f}ms  {item['module']}")
+        failed = failed or mark == '❌'
+
+    if not args.no_log:
+        os.makedirs(os.path.dirname(BENCH_LOG), exist_ok=True)
+        stamp = datetime.now().isoformat()
+        with open(BENCH_LOG, 'a', encoding='utf-8') as f:
+            for record in records:
+                f.write(json.dumps(dict(record, timestamp=stamp), ensure_ascii=False) + '\n')
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,242 @@
+#!/usr/bin/env python3
+"""
+反爬挑战页检测和熔断器
+
+网站返回挑战页（Cloudflare "Just a moment..."、PerimeterX "Press & Hold"、Akamai "Access Denied" 等）时，
+以前仍然等待 20 秒、滚动、找到 0 个链接，最后当成"未能获取商品数据"。现在：
+- classify_page() / classify_driver()：在第一个响应或第一次 DOM 快照中识别挑战页，立即中止本次抓取
+- CircuitBreaker：被拦截后按指数退避暂停访问该目标，期间的运行直接跳过，不启动浏览器
+
+熔断状态保存在 data/circuit_breaker.json，成功抓取一次后复位。
+
+配置（环境变量）：
+- CIRCUIT_BASE_SECONDS：第一次被拦截后的暂停时间，默认 900（15 分钟）
+- CIRCUIT_MAX_SECONDS：最长暂停时间，默认 21600（6 小时）
+"""
+
+import os
+import re
+import random
+import logging
+from datetime import datetime, timedelta
+from urllib.parse import urlsplit
+
+import run_metrics
+from atomic_io import read_json, write_json
+
+logger = logging.getLogger(__name__)
+
+CIRCUIT_FILE = os.path.join('data', 'circuit_breaker.json')
+CIRCUIT_BASE_SECONDS = float(os.getenv('CIRCUIT_BASE_SECONDS', '900'))
+CIRCUIT_MAX_SECONDS = float(os.getenv('CIRCUIT_MAX_SECONDS', '21600'))
+
+# 只检查页面开头，挑战页都很小，正常页面的特征也在 <head> 中
+SCAN_BYTES = 50000
+
+# (类型, 标题特征, 页面特征)；标题命中即判定，页面特征只在没有商品卡片时判定，避免误报
+RULES = [
+    ('cloudflare',
+     re.compile(r'just a moment|attention required|cloudflare', re.I),
+     re.compile(r'cf-chl-|cf_chl_opt|challenge-platform|cf-turnstile|checking your browser', re.I)),
+    ('perimeterx',
+     re.compile(r'access to this page has been denied', re.I),
+     re.compile(r'px-captcha|perimeterx|press (&amp;|&) hold', re.I)),
+    ('datadome',
+     re.compile(r'^\s*datadome', re.I),
+     re.compile(r'captcha-delivery\.com|datadome', re.I)),
+    ('akamai',
+     re.compile(r'^\s*access denied\s*$', re.I),
+     re.compile(r"you don't have permission to access|errors\.edgesuite\.net", re.I)),
+    ('captcha',
+     re.compile(r'captcha|verify you are human|are you a robot', re.I),
+     re.compile(r'g-recaptcha|h-captcha|verify you are human', re.I)),
+]
+
+TITLE_PATTERN = re.compile(r'<title[^>]*>(.*?)</title>', re.I | re.DOTALL)
+PRODUCT_MARKERS = ('qa--product-tile', '/shop/mens/')
+
+
+class ChallengeDetected(Exception):
+    """页面是反爬挑战页或被拦截"""
+
+    def __init__(self, challenge):
+        self.challenge = challenge
+        super().__init__(f"{challenge['kind']}: {challenge['reason']}")
+
+
+def classify_page(html='', title=None, status=None, has_products=None):
+    """判断页面是否为挑战页，是则返回 {'kind', 'reason'}，否则返回 None
+
+    html 只需要页面开头部分；has_products 为 None 时根据 html 判断是否有商品卡片。
+    """
+    if status == 429:
+        return {'kind': 'rate_limited', 'reason': 'HTTP 429'}
+
+    head = (html or '')[:SCAN_BYTES]
+    if title is None:
+        match = TITLE_PATTERN.search(head)
+        title = match.group(1).strip() if match else ''
+    if has_products is None:
+        has_products = any(marker in (html or '') for marker in PRODUCT_MARKERS)
+
+    for kind, title_pattern, body_pattern in RULES:
+        if title and title_pattern.search(title):
+            return {'kind': kind, 'reason': f"标题: {title[:80]}"}
+    if has_products:
+        return None
+    for kind, _, body_pattern in RULES:
+        match = body_pattern.search(head)
+        if match:
+            return {'kind': kind, 'reason': f"页面特征: {match.group(0)}"}
+
+    if status in (403, 503):
+        return {'kind': 'blocked', 'reason': f"HTTP {status}"}
+    return None
+
+
+DOM_SNAPSHOT_SCRIPT = """
+return [
+    document.title,
+    document.documentElement ? document.documentElement.outerHTML.slice(0, arguments[0]) : '',
+    document.querySelector('.qa--product-tile__link, a[href*="/shop/mens/"]') !== null
+];
+"""
+
+
+def classify_driver(driver):
+    """用一次 DOM 快照判断浏览器当前页面是否为挑战页"""
+    try:
+        title, html, has_products = driver.execute_script(DOM_SNAPSHOT_SCRIPT, SCAN_BYTES)
+    except Exception as e:
+        logger.debug(f"读取 DOM 快照失败: {e}")
+        return None
+    return classify_page(html, title=title, has_products=has_products)
+
+
+def _raise_challenge(challenge):
+    if challenge:
+        run_metrics.current().add('challenges', 1, kind=challenge['kind'])
+        logger.warning(f"🚫 检测到反爬挑战页（{challenge['kind']}，{challenge['reason']}），中止本次抓取")
+        raise ChallengeDetected(challenge)
+
+
+def check_driver(driver):
+    """检测到挑战页时记录指标并抛出 ChallengeDetected"""
+    _raise_challenge(classify_driver(driver))
+
+
+def check_page(html, status=None):
+    """HTTP 抓取用：检测到挑战页时记录指标并抛出 ChallengeDetected"""
+    _raise_challenge(classify_page(html, status=status))
+
+
+# ============================================
+# 熔断器
+# ============================================
+
+class CircuitBreaker:
+    """按目标主机记录连续被拦截的次数，指数退避暂停访问"""
+
+    def __init__(self, filename=CIRCUIT_FILE, base_seconds=CIRCUIT_BASE_SECONDS,
+                 max_seconds=CIRCUIT_MAX_SECONDS):
+        self.filename = filename
+        self.base_seconds = base_seconds
+        self.max_seconds = max_seconds
+        self.state = self._load()
+
+    def _load(self):
+        try:
+            return read_json(self.filename, {})
+        except Exception as e:
+            logger.warning(f"加载熔断状态失败，重置: {e}")
+            return {}
+
+    def save(self):
+        try:
+            write_json(self.filename, self.state)
+        except Exception as e:
+            logger.error(f"保存熔断状态失败: {e}")
+
+    @staticmethod
+    def _key(target):
+        return urlsplit(target).netloc or target
+
+    def open_until(self, target, now=None):
+        """熔断中返回恢复时间，否则返回 None"""
+        entry = self.state.get(self._key(target))
+        if not entry or not entry.get('open_until'):
+            return None
+        until = datetime.fromisoformat(entry['open_until'])
+        return until if (now or datetime.now()) < until else None
+
+    def allow(self, target, now=None):
+        """是否可以访问目标；熔断到期后放行一次试探"""
+        until = self.open_until(target, now)
+        if until:
+            entry = self.state[self._key(target)]
+            logger.warning(f"⛔ {self._key(target)} 已连续被拦截 {entry['failures']} 次"
+                           f"（{entry.get('kind')}），暂停到 {until:%Y-%m-%d %H:%M:%S}，跳过本次运行")
+            run_metrics.current().set('circuit_open', 1)
+            return False
+        return True
+
+    def record_failure(self, target, kind, now=None):
+        """记录一次拦截，返回暂停秒数"""
+        now = now or datetime.now()
+        entry = self.state.setdefault(self._key(target), {'failures': 0})
+        entry['failures'] += 1
+        # 加入 ±10% 抖动，避免多个实例同时恢复
+        delay = min(self.max_seconds,
+                    self.base_seconds * 2 ** (entry['failures'] - 1) * random.uniform(0.9, 1.1))
+        entry.update({
+            'kind': kind,
+            'last_failure': now.isoformat(),
+            'open_until': (now + timedelta(seconds=delay)).isoformat(),
+        })
+        self.save()
+        logger.warning(f"⛔ 熔断 {self._key(target)} {delay / 60:.0f} 分钟（连续第 {entry['failures']} 次）")
+        return delay
+
+    def record_success(self, target):
+        if self.state.pop(self._key(target), None) is not None:
+            logger.info(f"✓ {self._key(target)} 已恢复，熔断复位")
+            self.save()
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description='反爬挑战页检测和熔断状态')
+    sub = parser.add_subparsers(dest='command')
+    check_parser = sub.add_parser('check', help='检测 HTML 文件是否为挑战页')
+    check_parser.add_argument('files', nargs='+')
+    sub.add_parser('status', help='查看熔断状态')
+    reset_parser = sub.add_parser('reset', help='手动复位熔断')
+    reset_parser.add_argument('target', nargs='?', help='主机名，不指定则全部复位')
+    args = parser.parse_args()
+
+    if args.command == 'check':
+        from snapshot_archive import read_object
+        for path in args.files:
+            challenge = classify_page(read_object(path))
+            print(f"{path}: {challenge['kind'] + ' - ' + challenge['reason'] if challenge else '正常'}")
+    elif args.command == 'status':
+        breaker = CircuitBreaker()
+        if not breaker.state:
+            print("没有熔断中的目标")
+        for host, entry in breaker.state.items():
+            print(f"{host}: 连续 {entry['failures']} 次（{entry.get('kind')}），暂停到 {entry.get('open_until')}")
+    elif args.command == 'reset':
+        breaker = CircuitBreaker()
+        if args.target:
+            breaker.state.pop(args.target, None)
+        else:
+            breaker.state.clear()
+        breaker.save()
+        print("已复位")
+    else:
+        parser.print_help()
+
+
+if __name__ == "__main__":
+    main()
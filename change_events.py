@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+商品变化事件 - 统一不同监控脚本产生的变化格式
+"""
+
+import re
+
+EVENT_ADDED = 'added'
+EVENT_REMOVED = 'removed'
+EVENT_PRICE_CHANGE = 'price_change'
+
+PRICE_PATTERN = re.compile(r'(\d[\d,]*(?:\.\d+)?)')
+
+
+def product_key(product):
+    """商品唯一标识：优先使用 id，其次链接和名称"""
+    return product.get('id') or product.get('link') or product.get('name')
+
+
+def parse_prices(price_text):
+    """从价格文本中解析 (当前价, 原价)
+
+    例如 "CA$637.50 CA$850.00" 或 "CA$850.00 → CA$637.50" 都返回 (637.5, 850.0)。
+    只有一个价格时原价与当前价相同；无法解析时返回 (None, None)。
+    """
+    if price_text is None:
+        return None, None
+    if isinstance(price_text, (int, float)):
+        return float(price_text), float(price_text)
+
+    values = []
+    for match in PRICE_PATTERN.findall(str(price_text)):
+        try:
+            values.append(float(match.replace(',', '')))
+        except ValueError:
+            continue
+
+    if not values:
+        return None, None
+    return min(values), max(values)
+
+
+def discount_ratio(price_text):
+    """折扣比例，0.25 表示 75 折"""
+    current, original = parse_prices(price_text)
+    if not current or not original or original <= current:
+        return 0.0
+    return 1 - current / original
+
+
+def iter_change_events(changes):
+    """把变化字典展开为事件
+
+    同时支持 monitor.py 的格式（added / removed / price_changes[product]）
+    和 monitor_selenium.py 的格式（new_products / removed_products / price_changes[name]）。
+    """
+    for product in changes.get('added') or changes.get('new_products') or []:
+        yield {'type': EVENT_ADDED, 'product': product}
+
+    for product in changes.get('removed') or changes.get('removed_products') or []:
+        yield {'type': EVENT_REMOVED, 'product': product}
+
+    for change in changes.get('price_changes') or []:
+        product = change.get('product') or {
+            'id': change.get('id'),
+            'name': change.get('name'),
+            'link': change.get('link'),
+            'price': change.get('new_price'),
+        }
+        yield {
+            'type': EVENT_PRICE_CHANGE,
+            'product': product,
+            'old_price': change.get('old_price'),
+            'new_price': change.get('new_price'),
+        }
+
+
+def events_to_changes(events):
+    """把事件列表还原成 monitor.py 的变化字典格式"""
+    changes = {'added': [], 'removed': [], 'price_changes': []}
+    for event in events:
+        if event['type'] == EVENT_ADDED:
+            changes['added'].append(event['product'])
+        elif event['type'] == EVENT_REMOVED:
+            changes['removed'].append(event['product'])
+        elif event['type'] == EVENT_PRICE_CHANGE:
+            changes['price_changes'].append({
+                'product': event['product'],
+                'old_price': event.get('old_price'),
+                'new_price': event.get('new_price'),
+            })
+    return changes
+
+
+def has_changes(changes):
+    """变化字典中是否有任何事件"""
+    return any(True for _ in iter_change_events(changes))
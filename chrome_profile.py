@@ -0,0 +1,223 @@
+#!/usr/bin/env python3
+"""
+持久化的 Chrome 用户数据目录 - 跨运行复用 HTTP 缓存和 Cookie
+
+每次用空白配置启动 Chrome 都要重新下载 Next.js 脚本、字体和同意 Cookie。
+这里为每个监控版本维护一个 --user-data-dir（默认 data/chrome_profile/<版本>/）：
+- 启动前清理上次崩溃残留的 Singleton 锁
+- 上次没有正常退出时检查 Preferences / Local State，损坏则整体重建
+- 启动失败且错误与配置目录有关（目录被占用、启动即崩溃）时先清理锁用同一目录重试，
+  再失败才重建；下载 chromedriver 失败、网络错误、版本不匹配不会清空配置目录，
+  另一个 Chrome 进程仍在使用该目录时也不会重建
+- 超过大小上限时按价值从低到高删除缓存目录（GPU / Shader → Service Worker → Code Cache → HTTP Cache）
+- 通过 --disk-cache-size 让 Chrome 自己限制 HTTP 缓存
+
+配置（环境变量）：
+- CHROME_PROFILE：设为 0 关闭，每次使用空白配置
+- CHROME_PROFILE_DIR：根目录，默认 data/chrome_profile
+- CHROME_PROFILE_MAX_MB：大小上限，默认 300
+"""
+
+import os
+import json
+import time
+import shutil
+import logging
+
+logger = logging.getLogger(__name__)
+
+CHROME_PROFILE_ENABLED = os.getenv('CHROME_PROFILE', '1') != '0'
+CHROME_PROFILE_DIR = os.getenv('CHROME_PROFILE_DIR', os.path.join('data', 'chrome_profile'))
+CHROME_PROFILE_MAX_MB = float(os.getenv('CHROME_PROFILE_MAX_MB', '300'))
+
+CLEAN_MARKER = '.clean_exit'
+SINGLETON_FILES = ('SingletonLock', 'SingletonSocket', 'SingletonCookie')
+
+# 超过上限时依次删除（排在前面的重建代价最低）
+PRUNABLE_DIRS = [
+    'GrShaderCache',
+    'ShaderCache',
+    'GraphiteDawnCache',
+    os.path.join('Default', 'GPUCache'),
+    os.path.join('Default', 'DawnCache'),
+    os.path.join('Default', 'Service Worker', 'CacheStorage'),
+    os.path.join('Default', 'Service Worker', 'ScriptCache'),
+    os.path.join('Default', 'Code Cache'),
+    os.path.join('Default', 'Cache'),
+]
+
+# 必须是合法 JSON 的文件，否则 Chrome 会报错或丢弃整个配置
+STATE_FILES = ['Local State', os.path.join('Default', 'Preferences')]
+
+# 与配置目录有关的启动错误（小写匹配）
+PROFILE_ERROR_PATTERNS = (
+    'user data directory is already in use',
+    'singletonlock',
+    'profile error',
+    'cannot create default profile directory',
+    'chrome failed to start',
+    'devtoolsactiveport',
+    'crashed',
+)
+
+
+def is_profile_error(error):
+    """启动错误是否可能由配置目录引起（锁被占用、启动即崩溃）"""
+    message = str(error).lower()
+    return any(pattern in message for pattern in PROFILE_ERROR_PATTERNS)
+
+
+def dir_size(path):
+    """目录总字节数"""
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.lstat(os.path.join(root, name)).st_size
+            except OSError:
+                continue
+    return total
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class ChromeProfile:
+    """一个监控版本的 Chrome 用户数据目录"""
+
+    def __init__(self, variant, root=CHROME_PROFILE_DIR, max_mb=CHROME_PROFILE_MAX_MB):
+        self.path = os.path.abspath(os.path.join(root, variant))
+        self.max_bytes = int(max_mb * 1024 * 1024)
+
+    def chrome_args(self):
+        """传给 Chrome 的命令行参数"""
+        # HTTP 缓存最多占上限的 60%，其余留给 Cookie、Code Cache 等
+        return [f'--user-data-dir={self.path}', f'--disk-cache-size={int(self.max_bytes * 0.6)}']
+
+    def prepare(self):
+        """启动 Chrome 前调用：清理锁、检查损坏、控制大小"""
+        os.makedirs(self.path, exist_ok=True)
+        self._clear_stale_locks()
+
+        marker = os.path.join(self.path, CLEAN_MARKER)
+        if os.path.exists(marker):
+            os.remove(marker)
+        elif not self._state_files_valid():
+            logger.warning("Chrome 配置目录上次未正常退出且已损坏，重建")
+            self.reset()
+
+        self.prune()
+        return self
+
+    def release(self):
+        """driver.quit() 之后调用，标记正常退出"""
+        try:
+            with open(os.path.join(self.path, CLEAN_MARKER), 'w') as f:
+                f.write(str(time.time()))
+        except OSError as e:
+            logger.debug(f"写入退出标记失败: {e}")
+
+    def recover(self, error, attempt):
+        """用这个目录启动失败后调用，返回是否应该再试一次
+
+        attempt 为已经重试的次数：第一次清理锁后用同一目录重试，仍然失败才重建目录。
+        SingletonLock 属于仍在运行的进程时直接返回 False，不动目录。
+        """
+        if not is_profile_error(error):
+            return False
+        owner = self._lock_owner()
+        if owner:
+            # 另一个 Chrome 正在使用这个目录，重试没有意义，重建会破坏它的配置
+            logger.warning(f"Chrome 配置目录正被进程 {owner} 使用，不重建: {error}")
+            return False
+        if attempt == 0:
+            logger.warning(f"使用持久配置启动失败，清理锁后重试: {error}")
+            self._clear_stale_locks()
+            return True
+        if attempt == 1:
+            logger.warning(f"使用持久配置仍然启动失败，重建配置目录后重试: {error}")
+            self.reset()
+            return True
+        return False
+
+    def reset(self):
+        """删除整个配置目录，下次以空白配置启动"""
+        shutil.rmtree(self.path, ignore_errors=True)
+        os.makedirs(self.path, exist_ok=True)
+
+    def _lock_owner(self):
+        """仍在运行的、持有 SingletonLock 的 Chrome 进程号，没有则返回 None"""
+        lock = os.path.join(self.path, 'SingletonLock')
+        if not os.path.islink(lock):
+            return None
+        # 锁是指向 "主机名-进程号" 的符号链接
+        try:
+            pid = int(os.readlink(lock).rsplit('-', 1)[-1])
+        except (OSError, ValueError):
+            return None
+        return pid if _pid_alive(pid) else None
+
+    def _clear_stale_locks(self):
+        if self._lock_owner():
+            return
+        for name in SINGLETON_FILES:
+            path = os.path.join(self.path, name)
+            if os.path.lexists(path):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+    def _state_files_valid(self):
+        for name in STATE_FILES:
+            path = os.path.join(self.path, name)
+            if not os.path.exists(path):
+                continue
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    json.load(f)
+            except (OSError, ValueError):
+                return False
+        return True
+
+    def prune(self):
+        """超过大小上限时删除缓存目录，返回删除后的大小"""
+        size = dir_size(self.path)
+        if size <= self.max_bytes:
+            return size
+
+        logger.info(f"Chrome 配置目录 {size / 1024 / 1024:.0f} MB 超过上限，清理缓存...")
+        for relative in PRUNABLE_DIRS:
+            target = os.path.join(self.path, relative)
+            if not os.path.isdir(target):
+                continue
+            freed = dir_size(target)
+            shutil.rmtree(target, ignore_errors=True)
+            size -= freed
+            if size <= self.max_bytes:
+                break
+
+        if size > self.max_bytes:
+            # 缓存之外的数据也超了上限（例如 IndexedDB 膨胀），直接重建
+            logger.warning("清理缓存后仍超过上限，重建配置目录")
+            self.reset()
+            size = 0
+        return size
+
+
+def managed_profile(variant):
+    """返回准备好的配置目录；CHROME_PROFILE=0 时返回 None"""
+    if not CHROME_PROFILE_ENABLED:
+        return None
+    try:
+        return ChromeProfile(variant).prepare()
+    except Exception as e:
+        logger.warning(f"准备 Chrome 配置目录失败，使用空白配置: {e}")
+        return None
@@ -0,0 +1,289 @@
+#!/usr/bin/env python3
+"""
+商品详情页并发抓取 - 补充尺码、颜色和库存
+
+列表页只有名称和价格；尺码、颜色和 SKU 库存在每个 /shop/mens/<slug> 详情页的 JSON-LD 中。
+这里用 asyncio 并发抓取详情页（请求本身通过 asyncio.to_thread 走共享的连接池 Session）：
+- 全局令牌桶限制总请求速率
+- 每个主机一个信号量限制并发数
+- 只抓取本次对比中新增或价格变化的商品，其余沿用 data/product_details.json 中的结果
+- 经过磁盘响应缓存（http_cache.py），未变化的详情页用条件请求重新验证
+
+配置（环境变量）：
+- DETAIL_ENRICH：设为 1 时在发送通知前补充详情，默认关闭
+- DETAIL_RATE：每秒请求数，默认 5
+- DETAIL_BURST：令牌桶容量，默认 10
+- DETAIL_PER_HOST：每个主机的最大并发数，默认 4
+- DETAIL_TIMEOUT：单个请求超时秒数，默认 20
+"""
+
+import os
+import re
+import json
+import time
+import asyncio
+import logging
+from datetime import datetime
+from urllib.parse import urlsplit
+
+from atomic_io import read_json, write_json
+from change_events import EVENT_ADDED, EVENT_PRICE_CHANGE, iter_change_events, product_key
+from http_cache import HTTP_CACHE_ENABLED, HTTPCache
+
+logger = logging.getLogger(__name__)
+
+DETAIL_ENRICH = os.getenv('DETAIL_ENRICH', '0') == '1'
+DETAIL_RATE = float(os.getenv('DETAIL_RATE', '5'))
+DETAIL_BURST = int(os.getenv('DETAIL_BURST', '10'))
+DETAIL_PER_HOST = int(os.getenv('DETAIL_PER_HOST', '4'))
+DETAIL_TIMEOUT = float(os.getenv('DETAIL_TIMEOUT', '20'))
+DETAILS_FILE = os.path.join('data', 'product_details.json')
+
+JSON_LD_PATTERN = re.compile(
+    r'<script[^>]+type=["\']application/ld\+json["\'][^>]*>(.*?)</script>',
+    re.DOTALL | re.IGNORECASE,
+)
+
+
+class TokenBucket:
+    """异步令牌桶：平均 rate 个/秒，最多积攒 capacity 个"""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+# ============================================
+# JSON-LD 解析
+# ============================================
+
+def _iter_json_ld(html):
+    for match in JSON_LD_PATTERN.finditer(html):
+        try:
+            data = json.loads(match.group(1).strip())
+        except ValueError:
+            continue
+        items = data if isinstance(data, list) else [data]
+        for item in items:
+            if isinstance(item, dict) and '@graph' in item:
+                items.extend(item['@graph'])
+            elif isinstance(item, dict):
+                yield item
+
+
+def _as_list(value):
+    if value is None:
+        return []
+    return value if isinstance(value, list) else [value]
+
+
+def _in_stock(offer):
+    return str(offer.get('availability', '')).rsplit('/', 1)[-1] in ('InStock', 'LimitedAvailability')
+
+
+def parse_product_details(html):
+    """从详情页 JSON-LD 中提取 SKU、尺码、颜色和库存，找不到返回 None"""
+    variants = []
+    for item in _iter_json_ld(html):
+        types = _as_list(item.get('@type'))
+        if 'ProductGroup' in types:
+            # 每个变体是一个 Product，带自己的尺码、颜色和 offers
+            for variant in _as_list(item.get('hasVariant')):
+                for offer in _as_list(variant.get('offers')):
+                    variants.append({
+                        'sku': variant.get('sku') or offer.get('sku'),
+                        'size': variant.get('size'),
+                        'color': variant.get('color'),
+                        'in_stock': _in_stock(offer),
+                        'price': offer.get('price'),
+                    })
+        elif 'Product' in types:
+            for offer in _as_list(item.get('offers')):
+                for sub_offer in _as_list(offer.get('offers')) or [offer]:
+                    variants.append({
+                        'sku': sub_offer.get('sku') or item.get('sku'),
+                        'size': sub_offer.get('size') or item.get('size'),
+                        'color': sub_offer.get('color') or item.get('color'),
+                        'in_stock': _in_stock(sub_offer),
+                        'price': sub_offer.get('price'),
+                    })
+
+    if not variants:
+        return None
+
+    in_stock = [v for v in variants if v['in_stock']]
+    return {
+        'sku_count': len(variants),
+        'in_stock_count': len(in_stock),
+        'sizes': sorted({str(v['size']) for v in in_stock if v['size']}),
+        'colors': sorted({str(v['color']) for v in in_stock if v['color']}),
+        'variants': variants,
+        'fetched_at': datetime.now().isoformat(),
+    }
+
+
+# ============================================
+# 并发抓取
+# ============================================
+
+class DetailCrawler:
+    """并发抓取详情页"""
+
+    def __init__(self, session=None, rate=DETAIL_RATE, burst=DETAIL_BURST,
+                 per_host=DETAIL_PER_HOST, timeout=DETAIL_TIMEOUT, cache=None):
+        if session is None:
+            from http_session import get_session
+            session = get_session()
+        self.session = session
+        self.cache = cache if cache is not None else (HTTPCache() if HTTP_CACHE_ENABLED else None)
+        self.rate = rate
+        self.burst = burst
+        self.per_host = per_host
+        self.timeout = timeout
+        self.stats = {'fetched': 0, 'failed': 0, 'bytes': 0}
+
+    def _get(self, url):
+        if self.cache:
+            response = self.cache.fetch(self.session, url, timeout=self.timeout)
+        else:
+            response = self.session.get(url, timeout=self.timeout)
+        response.raise_for_status()
+        return response.text
+
+    async def _fetch(self, url, bucket, semaphores):
+        host = urlsplit(url).netloc
+        semaphore = semaphores.setdefault(host, asyncio.Semaphore(self.per_host))
+        async with semaphore:
+            await bucket.acquire()
+            try:
+                html = await asyncio.to_thread(self._get, url)
+            except Exception as e:
+                self.stats['failed'] += 1
+                logger.debug(f"抓取详情失败 {url}: {e}")
+                return url, None
+        self.stats['fetched'] += 1
+        self.stats['bytes'] += len(html)
+        return url, parse_product_details(html)
+
+    async def crawl_async(self, urls, timeout=None):
+        bucket = TokenBucket(self.rate, self.burst)
+        semaphores = {}
+        tasks = [asyncio.ensure_future(self._fetch(url, bucket, semaphores)) for url in urls]
+        done, pending = await asyncio.wait(tasks, timeout=timeout)
+        if pending:
+            # 时间用完：保留已完成的结果，其余放弃
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+            self.stats['skipped'] = self.stats.get('skipped', 0) + len(pending)
+            logger.warning(f"⏳ 详情抓取超时（{timeout:.0f}s），放弃剩余 {len(pending)} 个")
+        results = [task.result() for task in done]
+        return {url: details for url, details in results if details}
+
+    def crawl(self, urls, timeout=None):
+        """抓取一组详情页，返回 {url: details}；timeout 为总时间上限，到时返回已完成的部分"""
+        urls = list(dict.fromkeys(u for u in urls if u))
+        if not urls:
+            return {}
+        if timeout is not None:
+            # 单个请求也不能超过总时间，否则退出时仍要等待线程中的请求结束
+            self.timeout = max(1.0, min(self.timeout, timeout))
+        try:
+            return asyncio.run(self.crawl_async(urls, timeout))
+        finally:
+            if self.cache:
+                self.cache.save()
+
+
+# ============================================
+# 与对比结果集成
+# ============================================
+
+def products_to_refresh(changes):
+    """需要刷新详情的商品：新增和价格变化"""
+    products = {}
+    for event in iter_change_events(changes):
+        if event['type'] in (EVENT_ADDED, EVENT_PRICE_CHANGE) and event['product'].get('link'):
+            products[product_key(event['product'])] = event['product']
+    return list(products.values())
+
+
+def load_details(filename=DETAILS_FILE):
+    try:
+        return read_json(filename, {})
+    except Exception as e:
+        logger.warning(f"加载商品详情失败: {e}")
+        return {}
+
+
+def save_details(details, filename=DETAILS_FILE):
+    try:
+        write_json(filename, details)
+    except Exception as e:
+        logger.error(f"保存商品详情失败: {e}")
+
+
+def enrich_changes(changes, crawler=None, filename=DETAILS_FILE, timeout=None):
+    """抓取新增 / 变价商品的详情页，把结果写入商品的 details 字段（原地修改）
+
+    timeout 为总时间上限（秒），到时只使用已抓到的详情。
+    """
+    products = products_to_refresh(changes)
+    if not products:
+        return 0
+
+    crawler = crawler or DetailCrawler()
+    started = time.monotonic()
+    fetched = crawler.crawl((p['link'] for p in products), timeout=timeout)
+
+    details = load_details(filename)
+    for product in products:
+        result = fetched.get(product['link'])
+        key = product_key(product)
+        if result:
+            details[key] = result
+        if key in details:
+            product['details'] = details[key]
+    save_details(details, filename)
+
+    logger.info(f"✓ 补充了 {len(fetched)}/{len(products)} 个商品的详情"
+                f"（{time.monotonic() - started:.1f}s，失败 {crawler.stats['failed']}）")
+    return len(fetched)
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description='抓取商品详情页（尺码、颜色、库存）')
+    parser.add_argument('urls', nargs='*', help='详情页 URL；不指定时使用 data/changes.json 中的新增和变价商品')
+    parser.add_argument('--changes-file', default=os.path.join('data', 'changes.json'))
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    if args.urls:
+        results = DetailCrawler().crawl(args.urls)
+        print(json.dumps(results, ensure_ascii=False, indent=2))
+        return
+
+    with open(args.changes_file, 'r', encoding='utf-8') as f:
+        changes = json.load(f)
+    enrich_changes(changes)
+
+
+if __name__ == "__main__":
+    main()
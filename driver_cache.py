@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+"""
+chromedriver 缓存 - 按 Chrome 主版本保存 undetected-chromedriver 打过补丁的 chromedriver
+
+uc.Chrome() 每次启动都会检查、下载并给 chromedriver 打补丁，cron 每次运行都要付出几秒和一次网络请求。
+这里把打好补丁的二进制按 Chrome 主版本存到 data/driver_cache/<主版本>/，
+用 sha256 校验后直接通过 driver_executable_path 传给 uc.Chrome，离线也能启动；
+只有安装的 Chrome 升级到新的主版本时才重新下载和打补丁。
+
+配置（环境变量）：
+- CHROME_BINARY：Chrome 可执行文件路径（默认自动查找）
+- CHROME_VERSION_MAIN：直接指定 Chrome 主版本，跳过检测
+- DRIVER_CACHE_DIR：缓存目录，默认 data/driver_cache
+"""
+
+import os
+import re
+import json
+import shutil
+import hashlib
+import logging
+import subprocess
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+DRIVER_CACHE_DIR = os.getenv('DRIVER_CACHE_DIR', os.path.join('data', 'driver_cache'))
+MANIFEST_NAME = 'manifest.json'
+KEEP_VERSIONS = 2
+
+CHROME_CANDIDATES = [
+    'google-chrome',
+    'google-chrome-stable',
+    'chromium',
+    'chromium-browser',
+    '/Applications/Google Chrome.app/Contents/MacOS/Google Chrome',
+    r'C:\Program Files\Google\Chrome\Application\chrome.exe',
+]
+
+VERSION_PATTERN = re.compile(r'(\d+)\.\d+\.\d+(?:\.\d+)?')
+
+
+def chrome_version():
+    """检测已安装的 Chrome 版本号（如 '141.0.7390.65'），找不到返回 None"""
+    candidates = [os.getenv('CHROME_BINARY')] if os.getenv('CHROME_BINARY') else CHROME_CANDIDATES
+    for candidate in candidates:
+        binary = candidate if os.path.isabs(candidate) else shutil.which(candidate)
+        if not binary or not os.path.exists(binary):
+            continue
+        try:
+            output = subprocess.run([binary, '--version'], capture_output=True,
+                                    text=True, timeout=10).stdout
+        except (OSError, subprocess.SubprocessError):
+            continue
+        match = VERSION_PATTERN.search(output)
+        if match:
+            return match.group(0)
+    return None
+
+
+def chrome_major_version():
+    """Chrome 主版本号，环境变量 CHROME_VERSION_MAIN 优先"""
+    if os.getenv('CHROME_VERSION_MAIN'):
+        return int(os.getenv('CHROME_VERSION_MAIN'))
+    version = chrome_version()
+    return int(version.split('.')[0]) if version else None
+
+
+def file_sha256(path):
+    """计算文件的 sha256"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class DriverCache:
+    """按 Chrome 主版本缓存打过补丁的 chromedriver"""
+
+    def __init__(self, cache_dir=DRIVER_CACHE_DIR):
+        self.cache_dir = cache_dir
+        self.manifest_file = os.path.join(cache_dir, MANIFEST_NAME)
+        self.manifest = self._load()
+
+    def _load(self):
+        if os.path.exists(self.manifest_file):
+            try:
+                with open(self.manifest_file, 'r', encoding='utf-8') as f:
+                    return json.load(f)
+            except Exception as e:
+                logger.warning(f"加载 chromedriver 缓存清单失败: {e}")
+        return {}
+
+    def _save(self):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        tmp_file = self.manifest_file + '.tmp'
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump(self.manifest, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_file, self.manifest_file)
+
+    def lookup(self, major):
+        """返回校验通过的缓存路径，没有或校验失败返回 None"""
+        entry = self.manifest.get(str(major))
+        if not entry or not os.path.exists(entry['path']):
+            return None
+        if file_sha256(entry['path']) != entry['sha256']:
+            logger.warning(f"缓存的 chromedriver {major} 校验失败，将重新打补丁")
+            return None
+        return entry['path']
+
+    def store(self, major, source_path):
+        """把打好补丁的 chromedriver 复制进缓存"""
+        target_dir = os.path.join(self.cache_dir, str(major))
+        os.makedirs(target_dir, exist_ok=True)
+        target = os.path.join(target_dir, os.path.basename(source_path))
+
+        tmp_file = target + '.tmp'
+        shutil.copy2(source_path, tmp_file)
+        os.chmod(tmp_file, 0o755)
+        os.replace(tmp_file, target)
+
+        self.manifest[str(major)] = {
+            'path': target,
+            'sha256': file_sha256(target),
+            'chrome_version': chrome_version(),
+            'patched_at': datetime.now().isoformat(),
+        }
+        self._prune()
+        self._save()
+        return target
+
+    def _prune(self):
+        """只保留最近的几个主版本"""
+        majors = sorted(self.manifest, key=int, reverse=True)
+        for major in majors[KEEP_VERSIONS:]:
+            shutil.rmtree(os.path.join(self.cache_dir, major), ignore_errors=True)
+            del self.manifest[major]
+
+    def patch(self, major):
+        """用 undetected-chromedriver 下载并打补丁，然后放入缓存"""
+        from undetected_chromedriver.patcher import Patcher
+
+        logger.info(f"正在为 Chrome {major} 下载并修补 chromedriver...")
+        patcher = Patcher(version_main=major)
+        patcher.auto()
+        return self.store(major, patcher.executable_path)
+
+    def driver_path(self, major):
+        """获取（必要时生成）该主版本的 chromedriver 路径"""
+        path = self.lookup(major)
+        if path:
+            logger.info(f"✓ 使用缓存的 chromedriver（Chrome {major}）")
+            return path
+        return self.patch(major)
+
+
+def cached_driver_path(major=None):
+    """uc.Chrome 的 driver_executable_path；检测不到 Chrome 或缓存失败时返回 None，由 uc 自行处理"""
+    major = major or chrome_major_version()
+    if not major:
+        logger.warning("未检测到 Chrome 版本，跳过 chromedriver 缓存")
+        return None
+    try:
+        return DriverCache().driver_path(major)
+    except Exception as e:
+        logger.warning(f"chromedriver 缓存不可用: {e}")
+        return None
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description='chromedriver 缓存管理')
+    sub = parser.add_subparsers(dest='command')
+    sub.add_parser('show', help='显示 Chrome 版本和缓存内容')
+    sub.add_parser('warm', help='为当前 Chrome 版本准备 chromedriver（部署时运行一次）')
+    sub.add_parser('clear', help='清空缓存')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    cache = DriverCache()
+
+    if args.command == 'warm':
+        path = cached_driver_path()
+        print(f"chromedriver: {path}" if path else "❌ 准备 chromedriver 失败")
+    elif args.command == 'clear':
+        shutil.rmtree(cache.cache_dir, ignore_errors=True)
+        print(f"已清空 {cache.cache_dir}")
+    elif args.command == 'show':
+        print(f"Chrome: {chrome_version() or '未找到'}")
+        for major, entry in sorted(cache.manifest.items(), key=lambda item: int(item[0])):
+            print(f"  {major}: {entry['path']}  sha256={entry['sha256'][:12]}  {entry['patched_at']}")
+    else:
+        parser.print_help()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,512 @@
+#!/usr/bin/env python3
+"""
+可切换的抓取方式和自动选择
+
+各个监控脚本的区别主要在于怎样拿到商品列表。这里把它们统一成同一个接口，按成本从低到高排列：
+- http-json：requests 直接请求页面，从服务端渲染的 HTML / __NEXT_DATA__ 中解析，不启动浏览器
+- cdp-capture：无头 Chrome 加载页面，通过 CDP 读取文档和 JSON 接口的原始响应，不等待渲染和滚动
+- selenium：普通 Selenium，等待渲染后解析 DOM（monitor_optimized.py 的抓取方式）；
+  最多解析 30 个商品，只在明确指定时使用，不参与自动选择
+- undetected：undetected-chromedriver，等待渲染并滚动（monitor.py 的抓取方式），能通过大多数反爬检测
+
+BackendSelector 按成本顺序尝试，记住每个目标上一次成功的方式和商品数量，之后直接从它开始；
+商品数量明显少于页面标明的总数或记住的数量（SNAPSHOT_MIN_RATIO）时视为不完整，继续尝试下一种方式，
+避免便宜但只拿到部分商品的方式被记住，其余商品被报告为下架。
+每隔 FETCH_PROBE_RUNS 次运行重新从最便宜的方式试一遍，网站放宽限制后自动回到更快的路径。
+状态保存在 data/fetch_backend.json。
+
+用法：
+    python3 fetch_backends.py                        # 自动选择抓取方式，运行一次监控
+    python3 fetch_backends.py --backend http-json    # 指定抓取方式
+    python3 fetch_backends.py --status               # 查看每个目标记住的抓取方式
+
+配置（环境变量）：
+- FETCH_BACKENDS：参与选择的抓取方式，逗号分隔，默认除 selenium 以外的全部
+- FETCH_PROBE_RUNS：每隔多少次运行重新试一遍更便宜的方式，默认 24
+"""
+
+import os
+import json
+import time
+import base64
+import logging
+import importlib.util
+from datetime import datetime
+
+import run_metrics
+import run_budget
+import profiling
+from atomic_io import read_json, write_json
+from monitor_core import (
+    TARGET_URL, BASELINE_FILE, ensure_directories, normalize_products,
+    save_data, load_baseline, compare_products, print_changes,
+)
+from snapshot_quality import (
+    SNAPSHOT_MIN_RATIO, guard_snapshot, advertised_total, advertised_total_from_driver,
+)
+from snapshot_archive import archive_page
+from alert_latency import seconds_since_mtime
+from challenge_detector import ChallengeDetected, CircuitBreaker, check_driver, check_page
+
+logger = logging.getLogger(__name__)
+
+SELECTOR_FILE = os.path.join('data', 'fetch_backend.json')
+FETCH_PROBE_RUNS = int(os.getenv('FETCH_PROBE_RUNS', '24'))
+HTTP_TIMEOUT = 30
+
+
+# ============================================
+# 抓取方式
+# ============================================
+
+class FetchBackend:
+    """抓取方式的接口：fetch(url) 返回 (商品列表, 页面标明的商品总数或 None)
+
+    识别到挑战页时抛出 ChallengeDetected；其他失败抛出异常或返回空列表。
+    """
+
+    name = None
+    cost = 0
+    # 运行需要的模块
+    requires = ()
+    # 至少需要的时间（秒），运行剩余时间不够时跳过
+    min_seconds = 10
+    # 是否参与自动选择（只能拿到部分商品的方式需要明确指定）
+    auto = True
+
+    def available(self):
+        return all(importlib.util.find_spec(module) is not None for module in self.requires)
+
+    def fetch(self, url):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class HttpJsonBackend(FetchBackend):
+    name = 'http-json'
+    cost = 1
+    requires = ('requests',)
+    min_seconds = 10
+
+    def fetch(self, url):
+        from http_session import get_session
+        from replay import parse_html_products
+
+        budget = run_budget.current()
+        with budget.phase('fetch'):
+            with run_metrics.span('page_load'):
+                response = get_session().get(url, timeout=budget.timeout(HTTP_TIMEOUT))
+            run_metrics.current().add('bytes_fetched', len(response.content))
+            html = response.text
+            check_page(html, status=response.status_code)
+            response.raise_for_status()
+            with run_metrics.span('archive'):
+                archive_page(html, 'auto', target=url)
+
+        with budget.phase('extract'), run_metrics.span('extract'):
+            products = parse_html_products(html, url, datetime.now().isoformat())
+        return products, advertised_total(html)
+
+
+class CdpCaptureBackend(FetchBackend):
+    name = 'cdp-capture'
+    cost = 2
+    requires = ('selenium',)
+    min_seconds = 30
+
+    def __init__(self):
+        self.driver = None
+
+    def _create_driver(self):
+        from selenium import webdriver
+        from selenium.webdriver.chrome.options import Options
+
+        options = Options()
+        for arg in ('--headless=new', '--no-sandbox', '--disable-dev-shm-usage', '--disable-gpu',
+                    '--blink-settings=imagesEnabled=false', '--window-size=1280,720'):
+            options.add_argument(arg)
+        # 只需要原始响应，不等待图片、样式和脚本执行完
+        options.page_load_strategy = 'eager'
+        options.set_capability('goog:loggingPrefs', {'performance': 'ALL'})
+        with run_metrics.span('driver_start'):
+            return webdriver.Chrome(options=options)
+
+    def _responses(self):
+        """性能日志中的文档和 JSON 响应：(requestId, 类型, URL)"""
+        for entry in self.driver.get_log('performance'):
+            try:
+                message = json.loads(entry['message'])['message']
+            except (KeyError, ValueError):
+                continue
+            if message.get('method') != 'Network.responseReceived':
+                continue
+            params = message['params']
+            kind = params.get('type')
+            mime = params['response'].get('mimeType', '')
+            if kind == 'Document' or (kind in ('XHR', 'Fetch') and 'json' in mime):
+                yield params['requestId'], kind, params['response']['url']
+
+    def _body(self, request_id):
+        result = self.driver.execute_cdp_cmd('Network.getResponseBody', {'requestId': request_id})
+        body = result.get('body', '')
+        if result.get('base64Encoded'):
+            body = base64.b64decode(body).decode('utf-8', errors='replace')
+        return body
+
+    def _captured_products(self, timestamp):
+        """从捕获的响应中取商品最多的一份，返回 (商品列表, 文档 HTML)"""
+        from replay import parse_html_products
+        from next_data import NEXT_DATA_PATHS, find_items, to_products
+
+        best, document = [], ''
+        for request_id, kind, response_url in self._responses():
+            try:
+                body = self._body(request_id)
+            except Exception as e:
+                logger.debug(f"读取响应失败 {response_url}: {e}")
+                continue
+            if kind == 'Document':
+                document = document or body
+                products = parse_html_products(body, response_url, timestamp)
+            else:
+                # 商品接口返回的结构与 __NEXT_DATA__ 的 pageProps 相同
+                items, _ = find_items(body, [path[2:] for path in NEXT_DATA_PATHS])
+                products = to_products(items, timestamp)
+            products = [p for p in products if p.get('link') or p.get('name')]
+            if len(products) > len(best):
+                best = products
+        return best, document
+
+    def fetch(self, url):
+        budget = run_budget.current()
+        with budget.phase('startup'):
+            self.driver = self._create_driver()
+
+        with budget.phase('fetch'):
+            self.driver.set_page_load_timeout(budget.timeout(45))
+            self.driver.execute_cdp_cmd('Network.enable', {})
+            with run_metrics.span('page_load'):
+                self.driver.get(url)
+            check_driver(self.driver)
+            run_metrics.current().sample_page(self.driver)
+
+        with budget.phase('extract'), run_metrics.span('extract'):
+            products, document = self._captured_products(datetime.now().isoformat())
+        with run_metrics.span('archive'):
+            archive_page(document, 'auto', target=url)
+        return products, advertised_total(document)
+
+    def close(self):
+        if self.driver:
+            try:
+                self.driver.quit()
+            except Exception:
+                pass
+            self.driver = None
+
+
+class _BrowserBackend(FetchBackend):
+    """复用现有监控脚本的 create_driver / fetch_products"""
+
+    module = None
+    profile_name = None
+
+    def __init__(self):
+        self.driver = None
+        self.profile = None
+
+    def fetch(self, url):
+        from chrome_profile import managed_profile
+
+        impl = importlib.import_module(self.module)
+        with run_budget.current().phase('startup'):
+            self.profile = managed_profile(self.profile_name)
+            self.driver = impl.create_driver(self.profile)
+        products = impl.fetch_products(self.driver, url)
+        return products, self.advertised()
+
+    def advertised(self):
+        return advertised_total_from_driver(self.driver)
+
+    def close(self):
+        try:
+            if self.driver:
+                try:
+                    self.driver.quit()
+                except Exception:
+                    pass
+                self.driver = None
+        finally:
+            # 驱动没有创建成功或退出失败时也要释放配置目录的锁
+            if self.profile:
+                try:
+                    self.profile.release()
+                except Exception:
+                    pass
+                self.profile = None
+
+
+class SeleniumBackend(_BrowserBackend):
+    name = 'selenium'
+    cost = 3
+    requires = ('selenium',)
+    min_seconds = 45
+    module = 'monitor_optimized'
+    profile_name = 'optimized'
+    auto = False
+
+    def advertised(self):
+        # 这种方式最多解析 30 个商品，不和页面标明的总数比较
+        return None
+
+
+class UndetectedBackend(_BrowserBackend):
+    name = 'undetected'
+    cost = 4
+    requires = ('undetected_chromedriver', 'selenium')
+    min_seconds = 60
+    module = 'monitor'
+    profile_name = 'monitor'
+
+
+BACKENDS = {backend.name: backend for backend in
+            (HttpJsonBackend, CdpCaptureBackend, SeleniumBackend, UndetectedBackend)}
+
+
+def create_backends(names=None):
+    """按成本排序创建抓取方式；names 为 None 时使用 FETCH_BACKENDS 或全部参与自动选择的方式"""
+    if names is None:
+        names = [n.strip() for n in os.getenv('FETCH_BACKENDS', '').split(',') if n.strip()] or \
+            [n for n, backend in BACKENDS.items() if backend.auto]
+    unknown = [n for n in names if n not in BACKENDS]
+    if unknown:
+        raise ValueError(f"未知的抓取方式: {', '.join(unknown)}（可选: {', '.join(BACKENDS)}）")
+    return sorted((BACKENDS[n]() for n in names), key=lambda b: b.cost)
+
+
+# ============================================
+# 自动选择
+# ============================================
+
+class BackendSelector:
+    """按成本顺序尝试抓取方式，记住每个目标上一次成功的方式"""
+
+    def __init__(self, backends=None, filename=SELECTOR_FILE, probe_runs=FETCH_PROBE_RUNS):
+        self.backends = backends if backends is not None else create_backends()
+        self.filename = filename
+        self.probe_runs = max(1, probe_runs)
+        try:
+            self.state = read_json(filename, {})
+        except Exception as e:
+            logger.warning(f"加载抓取方式记录失败，重新选择: {e}")
+            self.state = {}
+
+    def save(self):
+        try:
+            write_json(self.filename, self.state)
+        except Exception as e:
+            logger.error(f"保存抓取方式记录失败: {e}")
+
+    def order(self, target):
+        """本次尝试的顺序：记住的方式在前，到了重新探测的时候按成本从低到高"""
+        entry = self.state.get(target, {})
+        winner = entry.get('backend')
+        names = [b.name for b in self.backends]
+        if winner not in names or entry.get('runs', 0) >= self.probe_runs:
+            return list(self.backends)
+        return sorted(self.backends, key=lambda b: (b.name != winner, b.cost))
+
+    def _record_failure(self, target, backend, reason):
+        failures = self.state.setdefault(target, {}).setdefault('failures', {})
+        failures[backend.name] = {'reason': reason, 'at': datetime.now().isoformat()}
+        run_metrics.current().add('fetch_backend_failures', 1, backend=backend.name)
+
+    def _incomplete(self, target, backend, products, advertised):
+        """商品数量明显少于页面标明的总数，或少于记住的方式上次拿到的数量"""
+        entry = self.state.get(target, {})
+        expected = advertised
+        if not expected and entry.get('backend') != backend.name:
+            expected = entry.get('count')
+        return bool(expected) and len(products) < expected * SNAPSHOT_MIN_RATIO
+
+    def _record_success(self, target, backend, probed, count):
+        entry = self.state.setdefault(target, {})
+        if entry.get('backend') != backend.name:
+            logger.info(f"抓取方式切换为 {backend.name}（之前: {entry.get('backend') or '无'}）")
+        entry['backend'] = backend.name
+        entry['count'] = count
+        entry['updated'] = datetime.now().isoformat()
+        # 从最便宜的方式开始试过一遍后重新计数
+        entry['runs'] = 0 if probed else entry.get('runs', 0) + 1
+        entry.get('failures', {}).pop(backend.name, None)
+
+    def fetch(self, target):
+        """返回 (抓取方式名称, 商品列表, 页面标明的商品总数)；都失败时商品列表为空
+
+        所有方式都失败且至少一次遇到挑战页时抛出最后一个 ChallengeDetected，交给熔断器处理。
+        所有方式的结果都不完整时返回商品最多的一份（交给 guard_snapshot 处理），不记住它。
+        """
+        budget = run_budget.current()
+        candidates = self.order(target)
+        probed = candidates[0] is self.backends[0]
+        blocked = None
+        partial = (None, [], None)
+
+        for backend in candidates:
+            if not backend.available():
+                logger.debug(f"跳过 {backend.name}：缺少 {', '.join(backend.requires)}")
+                continue
+            if not budget.has_time(backend.min_seconds):
+                budget.degrade(backend.name)
+                break
+
+            logger.info(f"使用抓取方式 {backend.name}...")
+            started = time.monotonic()
+            try:
+                products, advertised = backend.fetch(target)
+            except ChallengeDetected as e:
+                blocked = e
+                self._record_failure(target, backend, e.challenge['kind'])
+                continue
+            except Exception as e:
+                logger.warning(f"抓取方式 {backend.name} 失败: {e}")
+                self._record_failure(target, backend, str(e)[:200])
+                continue
+            finally:
+                backend.close()
+                run_metrics.current().set('fetch_backend_seconds',
+                                          round(time.monotonic() - started, 3), backend=backend.name)
+
+            if products and self._incomplete(target, backend, products, advertised):
+                logger.warning(f"抓取方式 {backend.name} 只获取到 {len(products)} 个商品，"
+                               f"少于预期，继续尝试下一种方式")
+                self._record_failure(target, backend, f'incomplete: {len(products)}')
+                if len(products) > len(partial[1]):
+                    partial = (backend.name, products, advertised)
+                continue
+            if products:
+                self._record_success(target, backend, probed, len(products))
+                self.save()
+                run_metrics.current().set('fetch_backend', backend.cost, backend=backend.name)
+                logger.info(f"✓ {backend.name} 获取到 {len(products)} 个商品")
+                return backend.name, products, advertised
+            logger.warning(f"抓取方式 {backend.name} 没有找到商品")
+            self._record_failure(target, backend, 'empty')
+
+        self.save()
+        if partial[1]:
+            logger.warning(f"所有抓取方式的结果都不完整，使用 {partial[0]} 的 {len(partial[1])} 个商品")
+            return partial
+        if blocked:
+            raise blocked
+        return None, [], None
+
+
+# ============================================
+# 监控流程
+# ============================================
+
+def main(backend=None):
+    """用自动选择的抓取方式运行一次监控"""
+    ensure_directories()
+
+    logger.info("=" * 60)
+    logger.info("Arc'teryx Outlet 监控工具 - 自动选择抓取方式")
+    logger.info("=" * 60)
+
+    run_metrics.start_run('auto')
+    budget = run_budget.start()
+    status = 'error'
+    breaker = CircuitBreaker()
+    try:
+        # 被拦截后的退避期内直接跳过
+        if not breaker.allow(TARGET_URL):
+            status = 'skipped'
+            return
+
+        selector = BackendSelector(create_backends([backend] if backend else None))
+        # 在抓取开始前读取，不把本次抓取耗时算进 poll_interval
+        poll_interval = seconds_since_mtime(BASELINE_FILE)
+        _, current_products, advertised = selector.fetch(TARGET_URL)
+        detection = {
+            'observed_at': datetime.now(),
+            'poll_interval': poll_interval,
+            'fetch_seconds': run_metrics.current().total('page_load', 'wait', 'extract'),
+        }
+
+        if not current_products:
+            logger.error("未能获取商品数据")
+            status = 'empty'
+            return
+        breaker.record_success(TARGET_URL)
+        normalize_products(current_products, TARGET_URL)
+
+        baseline_products = load_baseline()
+
+        # 数量明显偏少（懒加载不完整）时与基准合并或丢弃，不覆盖基准
+        current_products, _ = guard_snapshot(current_products, baseline_products, 'auto', advertised)
+        if current_products is None:
+            status = 'rejected'
+            return
+
+        if not baseline_products:
+            logger.info(f"\n首次运行，创建基准数据（{len(current_products)} 个商品）...")
+        else:
+            logger.info(f"\n对比基准数据（{len(baseline_products)} 个商品 vs {len(current_products)} 个商品）...")
+            with run_metrics.span('diff'):
+                changes = compare_products(baseline_products, current_products)
+            print_changes(changes)
+
+            from monitor import EMAIL_ENABLED, notify_changes
+            if EMAIL_ENABLED:
+                notify_changes(changes, current_products, detection)
+
+        with budget.phase('save'), run_metrics.span('save'):
+            save_data(current_products)
+
+        status = 'ok'
+        logger.info("\n✓ 监控完成")
+
+    except ChallengeDetected as e:
+        breaker.record_failure(TARGET_URL, e.challenge['kind'])
+        status = 'blocked'
+    except Exception as e:
+        logger.error(f"运行出错: {e}")
+    finally:
+        run_budget.finish()
+        run_metrics.finish_run(status)
+
+
+def print_status(filename=SELECTOR_FILE):
+    state = read_json(filename, {})
+    if not state:
+        print("还没有记录")
+    for target, entry in state.items():
+        print(f"{target}")
+        print(f"  抓取方式: {entry.get('backend') or '-'}（{entry.get('count', '-')} 个商品，"
+              f"{entry.get('updated', '-')}，距上次探测 {entry.get('runs', 0)} 次）")
+        for name, failure in entry.get('failures', {}).items():
+            print(f"  ✗ {name}: {failure['reason']}（{failure['at']}）")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(levelname)s - %(message)s'
+    )
+
+    parser = argparse.ArgumentParser(description="Arc'teryx Outlet 监控工具 - 自动选择抓取方式")
+    parser.add_argument('--backend', choices=list(BACKENDS), help='指定抓取方式，不自动选择')
+    parser.add_argument('--status', action='store_true', help='查看每个目标记住的抓取方式')
+    profiling.add_profile_argument(parser)
+    args = parser.parse_args()
+
+    if args.status:
+        print_status()
+    else:
+        with profiling.start_session(args.profile, 'auto'):
+            main(args.backend)
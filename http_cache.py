@@ -0,0 +1,277 @@
+#!/usr/bin/env python3
+"""
+磁盘 HTTP 响应缓存 - ETag / Last-Modified 校验、TTL 和 LRU 淘汰
+
+详情页和静态 JSON 在两次运行之间很少变化。缓存按 URL + 影响内容的请求头作为键：
+- 在 TTL 内直接返回本地内容，不发请求
+- 过期后带 If-None-Match / If-Modified-Since 发条件请求，304 时沿用本地内容
+- 总大小超过上限时按最近访问时间淘汰
+
+TTL 优先取响应的 Cache-Control: max-age，no-store 的响应不缓存；
+no-cache 和没有 max-age 的 must-revalidate 的 TTL 为 0，每次都发条件请求。
+
+配置（环境变量）：
+- HTTP_CACHE：设为 0 关闭
+- HTTP_CACHE_DIR：缓存目录，默认 data/http_cache
+- HTTP_CACHE_TTL：没有 max-age 时的默认 TTL 秒数，默认 300
+- HTTP_CACHE_MAX_MB：大小上限，默认 50
+
+查看命中率：python3 http_cache.py stats
+"""
+
+import os
+import re
+import json
+import time
+import hashlib
+import logging
+import threading
+
+import run_metrics
+
+logger = logging.getLogger(__name__)
+
+HTTP_CACHE_ENABLED = os.getenv('HTTP_CACHE', '1') != '0'
+HTTP_CACHE_DIR = os.getenv('HTTP_CACHE_DIR', os.path.join('data', 'http_cache'))
+HTTP_CACHE_TTL = float(os.getenv('HTTP_CACHE_TTL', '300'))
+HTTP_CACHE_MAX_MB = float(os.getenv('HTTP_CACHE_MAX_MB', '50'))
+
+# 会影响响应内容的请求头，参与缓存键
+KEY_HEADERS = ('Accept', 'Accept-Language')
+MAX_AGE_PATTERN = re.compile(r'max-age=(\d+)')
+
+
+class CachedResponse:
+    """缓存返回的响应，接口与 requests.Response 的常用部分一致"""
+
+    def __init__(self, url, status_code, content, headers, from_cache):
+        self.url = url
+        self.status_code = status_code
+        self.content = content
+        self.headers = headers
+        self.from_cache = from_cache
+
+    @property
+    def text(self):
+        return self.content.decode('utf-8', errors='replace')
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise RuntimeError(f"HTTP {self.status_code}: {self.url}")
+
+
+class HTTPCache:
+    """磁盘响应缓存"""
+
+    def __init__(self, cache_dir=HTTP_CACHE_DIR, default_ttl=HTTP_CACHE_TTL, max_mb=HTTP_CACHE_MAX_MB):
+        self.cache_dir = cache_dir
+        self.default_ttl = default_ttl
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self.index_file = os.path.join(cache_dir, 'index.json')
+        self.index = self._load()
+        self.stats = {'hits': 0, 'revalidated': 0, 'misses': 0, 'stored': 0, 'evicted': 0}
+        self._lock = threading.Lock()
+
+    def _load(self):
+        if os.path.exists(self.index_file):
+            try:
+                with open(self.index_file, 'r', encoding='utf-8') as f:
+                    return json.load(f)
+            except Exception as e:
+                logger.warning(f"加载 HTTP 缓存索引失败，重建: {e}")
+        return {}
+
+    def key(self, url, headers):
+        parts = [url] + [f"{name}={headers.get(name, '')}" for name in KEY_HEADERS]
+        return hashlib.sha256('\n'.join(parts).encode('utf-8')).hexdigest()
+
+    def _body_path(self, key):
+        return os.path.join(self.cache_dir, key[:2], key)
+
+    def _read_body(self, key):
+        try:
+            with open(self._body_path(key), 'rb') as f:
+                return f.read()
+        except OSError:
+            return None
+
+    @staticmethod
+    def _cache_control(headers):
+        """Cache-Control 指令不区分大小写，统一转成小写再判断"""
+        return (headers.get('Cache-Control') or '').lower()
+
+    def _ttl(self, headers):
+        cache_control = self._cache_control(headers)
+        if 'no-cache' in cache_control:
+            return 0
+        match = MAX_AGE_PATTERN.search(cache_control)
+        if match:
+            return float(match.group(1))
+        # must-revalidate 不允许在没有明确有效期时按默认 TTL 使用本地内容
+        return 0 if 'must-revalidate' in cache_control else self.default_ttl
+
+    def fetch(self, session, url, timeout=30, ttl=None, **kwargs):
+        """通过缓存获取 URL，返回 CachedResponse"""
+        request_headers = dict(session.headers)
+        request_headers.update(kwargs.pop('headers', None) or {})
+        key = self.key(url, request_headers)
+        now = time.time()
+
+        with self._lock:
+            entry = self.index.get(key)
+        body = self._read_body(key) if entry else None
+
+        if entry and body is not None:
+            # detail_crawler 从多个线程调用，索引和计数都在锁内更新
+            with self._lock:
+                entry['last_access'] = now
+                fresh = now < entry['expires']
+                if fresh:
+                    self.stats['hits'] += 1
+            if fresh:
+                return CachedResponse(url, entry['status'], body, entry['headers'], True)
+            # 过期：发条件请求
+            if entry.get('etag'):
+                request_headers['If-None-Match'] = entry['etag']
+            if entry.get('last_modified'):
+                request_headers['If-Modified-Since'] = entry['last_modified']
+
+        response = session.get(url, timeout=timeout, headers=request_headers, **kwargs)
+
+        if response.status_code == 304 and entry and body is not None:
+            with self._lock:
+                self.stats['revalidated'] += 1
+                entry['expires'] = now + (ttl if ttl is not None else self._ttl(response.headers))
+            return CachedResponse(url, entry['status'], body, entry['headers'], True)
+
+        with self._lock:
+            self.stats['misses'] += 1
+        self._store(key, url, response, now, ttl)
+        return CachedResponse(url, response.status_code, response.content,
+                              dict(response.headers), False)
+
+    def _store(self, key, url, response, now, ttl):
+        if response.status_code != 200 or 'no-store' in self._cache_control(response.headers):
+            return
+
+        path = self._body_path(key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # 同一个 URL 可能被两个线程同时写入，临时文件按线程区分
+            tmp_file = f"{path}.{threading.get_ident()}.tmp"
+            with open(tmp_file, 'wb') as f:
+                f.write(response.content)
+            os.replace(tmp_file, path)
+        except OSError as e:
+            logger.debug(f"写入 HTTP 缓存失败: {e}")
+            return
+
+        with self._lock:
+            self.index[key] = {
+                'url': url,
+                'status': response.status_code,
+                'headers': {name: response.headers[name] for name in ('Content-Type',)
+                            if name in response.headers},
+                'etag': response.headers.get('ETag'),
+                'last_modified': response.headers.get('Last-Modified'),
+                'expires': now + (ttl if ttl is not None else self._ttl(response.headers)),
+                'size': len(response.content),
+                'last_access': now,
+            }
+            self.stats['stored'] += 1
+
+    def evict(self):
+        """按最近访问时间淘汰，直到总大小不超过上限"""
+        with self._lock:
+            total = sum(entry['size'] for entry in self.index.values())
+            if total <= self.max_bytes:
+                return 0
+            evicted = 0
+            for key, entry in sorted(self.index.items(), key=lambda item: item[1]['last_access']):
+                try:
+                    os.remove(self._body_path(key))
+                except OSError:
+                    pass
+                del self.index[key]
+                total -= entry['size']
+                evicted += 1
+                if total <= self.max_bytes:
+                    break
+            self.stats['evicted'] += evicted
+            return evicted
+
+    def hit_rate(self):
+        """本次运行的命中率（包括 304 重新验证）"""
+        total = self.stats['hits'] + self.stats['revalidated'] + self.stats['misses']
+        return (self.stats['hits'] + self.stats['revalidated']) / total if total else None
+
+    def save(self):
+        """淘汰超出部分后保存索引，并把命中情况记入运行指标"""
+        self.evict()
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            tmp_file = self.index_file + '.tmp'
+            with self._lock, open(tmp_file, 'w', encoding='utf-8') as f:
+                json.dump(self.index, f, ensure_ascii=False)
+            os.replace(tmp_file, self.index_file)
+        except Exception as e:
+            logger.warning(f"保存 HTTP 缓存索引失败: {e}")
+
+        metrics = run_metrics.current()
+        for name in ('hits', 'revalidated', 'misses'):
+            metrics.add('http_cache_requests', self.stats[name], result=name)
+
+        rate = self.hit_rate()
+        if rate is not None:
+            logger.info(f"HTTP 缓存命中率 {rate:.0%}（命中 {self.stats['hits']}，"
+                        f"304 {self.stats['revalidated']}，未命中 {self.stats['misses']}）")
+
+    def summary(self):
+        """缓存内容概况"""
+        now = time.time()
+        return {
+            'entries': len(self.index),
+            'bytes': sum(entry['size'] for entry in self.index.values()),
+            'fresh': sum(1 for entry in self.index.values() if entry['expires'] > now),
+            'with_validator': sum(1 for entry in self.index.values()
+                                  if entry.get('etag') or entry.get('last_modified')),
+        }
+
+
+def main():
+    import argparse
+    import shutil
+
+    parser = argparse.ArgumentParser(description='HTTP 响应缓存')
+    sub = parser.add_subparsers(dest='command')
+    sub.add_parser('stats', help='缓存概况和最近运行的命中率')
+    sub.add_parser('clear', help='清空缓存')
+    args = parser.parse_args()
+
+    cache = HTTPCache()
+    if args.command == 'clear':
+        shutil.rmtree(cache.cache_dir, ignore_errors=True)
+        print(f"已清空 {cache.cache_dir}")
+    elif args.command == 'stats':
+        summary = cache.summary()
+        print(f"条目: {summary['entries']}（未过期 {summary['fresh']}，可校验 {summary['with_validator']}）")
+        print(f"大小: {summary['bytes'] / 1024 / 1024:.1f} / {cache.max_bytes / 1024 / 1024:.0f} MB")
+
+        from run_metrics import METRICS_LOG
+        if os.path.exists(METRICS_LOG):
+            with open(METRICS_LOG, 'r', encoding='utf-8') as f:
+                records = [json.loads(line) for line in f if line.strip()]
+            for record in records[-10:]:
+                counts = record['values'].get('http_cache_requests')
+                if not counts:
+                    continue
+                hits = counts.get('result=hits', 0) + counts.get('result=revalidated', 0)
+                total = hits + counts.get('result=misses', 0)
+                if total:
+                    print(f"  {record['started_at']}  {record['variant']:<10} 命中率 {hits / total:.0%}（{hits}/{total}）")
+    else:
+        parser.print_help()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+共享的 HTTP 会话 - 连接池、keep-alive、压缩和持久化 Cookie
+
+所有基于 requests 的抓取都通过 get_session() 取得同一个 Session：
+- HTTPAdapter 连接池按主机复用连接（以及 TLS 会话），抓取多个 URL 时不必重复握手
+- 只在安装了 brotli 时声明 br，否则 urllib3 无法解压
+- Cookie 保存在 data/cookies.txt（LWP 格式），下次运行继续使用同意 Cookie 等
+
+配置（环境变量）：
+- HTTP_COOKIE_FILE：Cookie 文件，默认 data/cookies.txt
+- HTTP_POOL_CONNECTIONS：缓存的主机连接池数量，默认 4
+- HTTP_POOL_MAXSIZE：每个主机的最大连接数，默认 16
+"""
+
+import os
+import atexit
+import logging
+from http.cookiejar import LWPCookieJar
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+logger = logging.getLogger(__name__)
+
+HTTP_COOKIE_FILE = os.getenv('HTTP_COOKIE_FILE', os.path.join('data', 'cookies.txt'))
+HTTP_POOL_CONNECTIONS = int(os.getenv('HTTP_POOL_CONNECTIONS', '4'))
+HTTP_POOL_MAXSIZE = int(os.getenv('HTTP_POOL_MAXSIZE', '16'))
+
+USER_AGENT = ('Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 '
+              '(KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36')
+
+
+def accept_encoding():
+    """可以解压的编码：br 需要 brotli 或 brotlicffi"""
+    encodings = ['gzip', 'deflate']
+    for module in ('brotli', 'brotlicffi'):
+        try:
+            __import__(module)
+            encodings.append('br')
+            break
+        except ImportError:
+            continue
+    return ', '.join(encodings)
+
+
+def default_headers():
+    return {
+        'User-Agent': USER_AGENT,
+        'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,*/*;q=0.8',
+        'Accept-Language': 'zh-CN,zh;q=0.9,en;q=0.8',
+        'Accept-Encoding': accept_encoding(),
+        'Connection': 'keep-alive',
+    }
+
+
+def create_session(cookie_file=HTTP_COOKIE_FILE, pool_connections=HTTP_POOL_CONNECTIONS,
+                   pool_maxsize=HTTP_POOL_MAXSIZE):
+    """创建带连接池、重试和持久化 Cookie 的 Session"""
+    session = requests.Session()
+    session.headers.update(default_headers())
+
+    retry = Retry(
+        total=2,
+        backoff_factor=0.5,
+        status_forcelist=(502, 503, 504),
+        allowed_methods=frozenset(['GET', 'HEAD']),
+    )
+    adapter = HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize,
+                          max_retries=retry)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+
+    jar = LWPCookieJar(cookie_file)
+    if os.path.exists(cookie_file):
+        try:
+            jar.load(ignore_discard=True, ignore_expires=False)
+        except Exception as e:
+            logger.warning(f"加载 Cookie 失败，使用空 Cookie: {e}")
+    session.cookies = jar
+    return session
+
+
+def save_cookies(session):
+    """把会话 Cookie 写回文件（包括会话 Cookie）"""
+    jar = session.cookies
+    if not isinstance(jar, LWPCookieJar):
+        return
+    try:
+        os.makedirs(os.path.dirname(jar.filename) or '.', exist_ok=True)
+        jar.save(ignore_discard=True, ignore_expires=False)
+    except Exception as e:
+        logger.warning(f"保存 Cookie 失败: {e}")
+
+
+_session = None
+
+
+def get_session():
+    """进程内共享的 Session，退出时自动保存 Cookie"""
+    global _session
+    if _session is None:
+        _session = create_session()
+        atexit.register(save_cookies, _session)
+    return _session
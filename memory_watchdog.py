@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+"""
+Chrome 内存看门狗 - 在小内存机器上限制浏览器进程树的内存
+
+后台线程定期通过 /proc 采样 chromedriver 和 Chrome 两棵进程树的 RSS（undetected_chromedriver 直接启动 Chrome，
+浏览器不是 chromedriver 的子进程），记录峰值并标记内存压力。
+WebDriver 不能跨线程并发调用，所以回收动作都在主线程的检查点 checkpoint() 中执行：
+1. 超过预算的 80%：通知 Chrome 内存压力（释放内存缓存，保留磁盘缓存）、触发 GC、关闭多余的窗口
+2. 回收后仍超过预算：关闭浏览器并重新启动（需要提供 restart 函数）
+
+配置（环境变量）：
+- CHROME_MEMORY_BUDGET_MB：内存预算，默认取物理内存的 60%
+- WATCHDOG_INTERVAL：采样间隔秒数，默认 2
+"""
+
+import os
+import logging
+import threading
+
+import run_metrics
+from run_metrics import process_tree_rss, driver_pids
+
+logger = logging.getLogger(__name__)
+
+WATCHDOG_INTERVAL = float(os.getenv('WATCHDOG_INTERVAL', '2'))
+SOFT_RATIO = 0.8
+
+
+def default_budget_bytes():
+    """内存预算：环境变量优先，否则取物理内存的 60%"""
+    budget_mb = os.getenv('CHROME_MEMORY_BUDGET_MB')
+    if budget_mb:
+        return int(float(budget_mb) * 1024 * 1024)
+    try:
+        return int(os.sysconf('SC_PHYS_PAGES') * os.sysconf('SC_PAGE_SIZE') * 0.6)
+    except (ValueError, OSError, AttributeError):
+        return 1024 * 1024 * 1024
+
+
+class MemoryWatchdog:
+    """浏览器内存看门狗
+
+    用法：
+        watchdog = MemoryWatchdog(restart=create_driver).attach(driver)
+        with watchdog:
+            for url in urls:
+                driver = watchdog.checkpoint(driver)   # 页面之间回收内存
+                ...
+    """
+
+    def __init__(self, budget_bytes=None, interval=WATCHDOG_INTERVAL, restart=None):
+        self.budget = budget_bytes or default_budget_bytes()
+        self.soft_limit = int(self.budget * SOFT_RATIO)
+        self.interval = interval
+        self.restart = restart
+        self.driver = None
+        self.last_rss = None
+        self.peak_rss = 0
+        self.over_budget = False
+        self._stop = threading.Event()
+        self._thread = None
+        self._warned = False
+
+    def attach(self, driver):
+        """跟踪一个（新的）浏览器"""
+        self.driver = driver
+        self._warned = False
+        return self
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+        return False
+
+    def start(self):
+        run_metrics.current().set('chrome_memory_budget_bytes', self.budget)
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='chrome-memory-watchdog', daemon=True)
+        self._thread.start()
+        logger.info(f"🐕 内存看门狗已启动（预算 {self.budget / 1024 / 1024:.0f} MB）")
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=self.interval + 1)
+            self._thread = None
+        if self.peak_rss:
+            logger.info(f"🐕 Chrome 内存峰值 {self.peak_rss / 1024 / 1024:.0f} MB")
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.sample()
+
+    def sample(self):
+        """采样一次进程树内存"""
+        if not self.driver:
+            return None
+        rss = process_tree_rss(driver_pids(self.driver))
+        if rss is None:
+            return None
+
+        self.last_rss = rss
+        self.peak_rss = max(self.peak_rss, rss)
+        run_metrics.current().peak('chrome_rss_bytes', rss)
+
+        self.over_budget = rss > self.soft_limit
+        if rss > self.budget and not self._warned:
+            self._warned = True
+            logger.warning(f"⚠️  Chrome 内存 {rss / 1024 / 1024:.0f} MB 超过预算，将在下一个检查点回收")
+        return rss
+
+    def relieve(self, driver):
+        """在主线程中回收浏览器内存：释放内存缓存、GC、关闭多余窗口
+
+        不调用 Network.clearBrowserCache，以免清掉持久化配置目录里的磁盘缓存。
+        """
+        for command, params in (('Memory.simulatePressureNotification', {'level': 'critical'}),
+                                ('HeapProfiler.collectGarbage', {})):
+            try:
+                driver.execute_cdp_cmd(command, params)
+            except Exception as e:
+                logger.debug(f"{command} 失败: {e}")
+
+        try:
+            handles = driver.window_handles
+            current = driver.current_window_handle
+            for handle in handles:
+                if handle != current:
+                    driver.switch_to.window(handle)
+                    driver.close()
+            if len(handles) > 1:
+                driver.switch_to.window(current)
+                logger.info(f"关闭了 {len(handles) - 1} 个多余窗口")
+        except Exception as e:
+            logger.debug(f"关闭多余窗口失败: {e}")
+
+        run_metrics.current().add('chrome_memory_relief', 1)
+
+    def checkpoint(self, driver):
+        """页面之间调用：按内存压力回收或重启浏览器，返回（可能是新的）driver"""
+        if self.driver is not driver:
+            self.attach(driver)
+        rss = self.sample()
+        if rss is None or rss <= self.soft_limit:
+            return driver
+
+        logger.info(f"🐕 Chrome 内存 {rss / 1024 / 1024:.0f} MB，开始回收...")
+        self.relieve(driver)
+        rss = self.sample()
+        if rss is None or rss <= self.budget or not self.restart:
+            return driver
+
+        logger.warning(f"⚠️  回收后仍有 {rss / 1024 / 1024:.0f} MB，重启浏览器")
+        try:
+            driver.quit()
+        except Exception:
+            pass
+        driver = self.restart()
+        run_metrics.current().add('chrome_restarts', 1)
+        self.attach(driver)
+        return driver
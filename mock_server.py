@@ -0,0 +1,449 @@
+#!/usr/bin/env python3
+"""
+本地模拟 Arc'teryx Outlet 网站 - 离线压测和回归测试
+
+不访问真实网站就能测量抓取吞吐、调度行为和各个后端（requests、Selenium、undetected）：
+- /ca/zh/c/mens：合成的商品列表页，商品卡片同时带有各版本用到的选择器，并内嵌 __NEXT_DATA__
+- /ca/zh/shop/mens/<slug>：详情页（JSON-LD），带 ETag / Last-Modified，支持 304
+- /recorded/<文件>：原样返回录制的页面（例如 debug_undetected.html）
+- /__control：查看和修改状态（商品增删、降价、延迟、429、反爬挑战页）
+
+用法：
+    python3 mock_server.py --products 500 --port 8765
+    TARGET_URL=http://127.0.0.1:8765/ca/zh/c/mens python3 monitor.py
+
+    curl -X POST localhost:8765/__control/mutate -d '{"add": 3, "remove": 2, "price_drop": 5}'
+    curl -X POST localhost:8765/__control -d '{"latency_ms": 300, "rate_429": 0.2}'
+    curl -X POST localhost:8765/__control -d '{"challenge": "cloudflare"}'
+"""
+
+import os
+import json
+import time
+import random
+import hashlib
+import logging
+import threading
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+
+logger = logging.getLogger(__name__)
+
+CATALOG_PATH = '/ca/zh/c/mens'
+DETAIL_PREFIX = '/ca/zh/shop/mens/'
+RECORDED_DIR = os.path.dirname(os.path.abspath(__file__))
+
+MODELS = ['Beta AR', 'Beta LT', 'Atom LT', 'Atom SL', 'Gamma MX', 'Gamma LT', 'Cerium',
+          'Proton LT', 'Squamish', 'Zeta SL', 'Alpha SV', 'Rho LT', 'Konseal', 'Norvan']
+KINDS = ['Jacket', 'Hoody', 'Pant', 'Vest', 'Shirt', 'Anorak']
+COLOURS = ['Black', 'Orca', 'Solitude', 'Forage', 'Void', 'Tatsu']
+SIZES = ['XS', 'S', 'M', 'L', 'XL', 'XXL']
+
+# 反爬挑战页：状态码 + 页面内容，与真实拦截页的特征一致
+CHALLENGES = {
+    'cloudflare': (403, '<html><head><title>Just a moment...</title></head><body>'
+                        '<div id="challenge-running">Checking your browser before accessing the site.</div>'
+                        '<script src="/cdn-cgi/challenge-platform/h/b/orchestrate/chl_page/v1"></script>'
+                        '</body></html>'),
+    'captcha': (403, '<html><head><title>Access to this page has been denied</title></head><body>'
+                     '<div id="px-captcha"></div><p>Press &amp; Hold to confirm you are a human.</p>'
+                     '</body></html>'),
+    'access_denied': (403, '<html><head><title>Access Denied</title></head><body><h1>Access Denied</h1>'
+                           "You don't have permission to access this server.<p>Reference #18.5f3c1702</p>"
+                           '</body></html>'),
+}
+
+
+def _http_date(timestamp):
+    return format_datetime(datetime.fromtimestamp(timestamp, timezone.utc), usegmt=True)
+
+
+class MockCatalog:
+    """模拟网站的状态：商品列表和故障注入设置，所有方法线程安全"""
+
+    DEFAULT_SETTINGS = {
+        'latency_ms': 0,        # 每个请求的固定延迟
+        'jitter_ms': 0,         # 额外的随机延迟上限
+        'rate_429': 0.0,        # 返回 429 的概率
+        'retry_after': 5,       # 429 的 Retry-After 秒数
+        'challenge': None,      # cloudflare / captcha / access_denied
+        'challenge_rate': 1.0,  # 开启挑战时被拦截的概率
+        'recorded': None,       # 设为文件名时，列表页改为返回该录制页面
+        'max_age': 60,          # 详情页的 Cache-Control: max-age
+        'cache_control': None,  # 设置时详情页改用这个 Cache-Control（例如 no-cache）
+    }
+
+    def __init__(self, size=100, seed=0):
+        self.random = random.Random(seed)
+        self.settings = dict(self.DEFAULT_SETTINGS)
+        self.products = {}
+        self.version = 0
+        self.updated = time.time()
+        self.requests = {}
+        self._next_id = 0
+        self._lock = threading.Lock()
+        self.add(size)
+
+    def _new_product(self):
+        self._next_id += 1
+        model = self.random.choice(MODELS)
+        kind = self.random.choice(KINDS)
+        slug = f"{model.lower().replace(' ', '-')}-{kind.lower()}-{self._next_id}"
+        original = self.random.randrange(150, 900, 10)
+        return {
+            'id': slug,
+            'name': f"{model} {kind} Men's #{self._next_id}",
+            'original_price': original,
+            'price': round(original * self.random.choice((0.6, 0.7, 0.75, 1.0))),
+            'colours': self.random.sample(COLOURS, self.random.randint(1, 3)),
+            'stock': {size: self.random.random() > 0.3 for size in SIZES},
+            'updated': time.time(),
+        }
+
+    def _touch(self):
+        self.version += 1
+        self.updated = time.time()
+
+    # ---------- 变更 ----------
+
+    def add(self, count):
+        with self._lock:
+            added = [self._new_product() for _ in range(count)]
+            for product in added:
+                self.products[product['id']] = product
+            self._touch()
+            return [p['id'] for p in added]
+
+    def remove(self, count):
+        with self._lock:
+            removed = self.random.sample(list(self.products), min(count, len(self.products)))
+            for key in removed:
+                del self.products[key]
+            self._touch()
+            return removed
+
+    def drop_prices(self, count, percent=20):
+        with self._lock:
+            dropped = self.random.sample(list(self.products), min(count, len(self.products)))
+            for key in dropped:
+                product = self.products[key]
+                product['price'] = max(1, round(product['price'] * (100 - percent) / 100))
+                product['updated'] = time.time()
+            self._touch()
+            return dropped
+
+    def mutate(self, add=0, remove=0, price_drop=0, drop_pct=20):
+        """一次应用多种变更，返回受影响的商品 ID"""
+        return {
+            'removed': self.remove(remove) if remove else [],
+            'price_drop': self.drop_prices(price_drop, drop_pct) if price_drop else [],
+            'added': self.add(add) if add else [],
+        }
+
+    def configure(self, **settings):
+        unknown = set(settings) - set(self.DEFAULT_SETTINGS)
+        if unknown:
+            raise ValueError(f"未知设置: {', '.join(sorted(unknown))}")
+        with self._lock:
+            self.settings.update(settings)
+
+    def reset(self):
+        with self._lock:
+            self.settings = dict(self.DEFAULT_SETTINGS)
+            self.requests = {}
+
+    def count_request(self, status):
+        with self._lock:
+            self.requests[str(status)] = self.requests.get(str(status), 0) + 1
+
+    def snapshot(self):
+        with self._lock:
+            return list(self.products.values())
+
+    def get(self, slug):
+        with self._lock:
+            product = self.products.get(slug)
+            return dict(product) if product else None
+
+    def state(self):
+        with self._lock:
+            return {
+                'products': len(self.products),
+                'version': self.version,
+                'updated': self.updated,
+                'settings': dict(self.settings),
+                'requests': dict(self.requests),
+            }
+
+
+# ============================================
+# 页面渲染
+# ============================================
+
+def _price(value):
+    return f"CA${value:.2f}"
+
+
+def render_tile(product, base_url):
+    """商品卡片：覆盖 monitor / monitor_optimized / monitor_selenium 的选择器"""
+    link = f"{base_url}{DETAIL_PREFIX}{product['id']}"
+    discounted = product['price'] < product['original_price']
+    prices = (f'<span class="qa--product-tile__original-price">{_price(product["original_price"])}</span>'
+              f'<span class="qa--product-tile__minRange-price qa--product-tile__discount-price">'
+              f'{_price(product["price"])}</span>') if discounted else \
+             f'<span class="qa--product-tile__minRange-price">{_price(product["price"])}</span>'
+    return (
+        f'<div id="mens-{product["id"]}" class="qa--grid-product-tile product-tile" '
+        f'data-testid="product-card" data-product-id="{product["id"]}">'
+        f'<a class="qa--product-tile__link" href="{link}">'
+        f'<img src="/static/{product["id"]}.jpg" alt="{product["name"]}"></a>'
+        f'<div class="product-tile-name"><h3>{product["name"]}</h3></div>'
+        f'<div class="qa--product-tile__prices price">{prices}</div>'
+        f'</div>'
+    )
+
+
+def render_catalog(products, base_url):
+    next_data = {
+        'props': {'pageProps': {
+            'products': [{
+                'id': p['id'],
+                'name': p['name'],
+                'price': _price(p['price']),
+                'url': f"{base_url}{DETAIL_PREFIX}{p['id']}",
+            } for p in products],
+            'totalCount': len(products),
+        }},
+        'page': CATALOG_PATH,
+    }
+    tiles = '\n'.join(render_tile(p, base_url) for p in products)
+    return (
+        '<!DOCTYPE html><html lang="zh"><head><meta charset="utf-8">'
+        "<title>Men's Outlet | Arc'teryx Outlet</title></head><body>"
+        f'<main><h1>男装</h1><div class="qa--product-count">{len(products)} 件商品</div>'
+        f'<div class="product-grid">\n{tiles}\n</div></main>'
+        '<script id="__NEXT_DATA__" type="application/json">'
+        f'{json.dumps(next_data, ensure_ascii=False)}</script>'
+        '</body></html>'
+    )
+
+
+def render_detail(product):
+    json_ld = {
+        '@context': 'https://schema.org',
+        '@type': 'ProductGroup',
+        'name': product['name'],
+        'productGroupID': product['id'],
+        'hasVariant': [{
+            '@type': 'Product',
+            'sku': f"{product['id']}-{colour[:3].upper()}-{size}",
+            'size': size,
+            'color': colour,
+            'offers': {
+                '@type': 'Offer',
+                'price': product['price'],
+                'priceCurrency': 'CAD',
+                'availability': 'https://schema.org/' + ('InStock' if in_stock else 'OutOfStock'),
+            },
+        } for colour in product['colours'] for size, in_stock in product['stock'].items()],
+    }
+    return (
+        f'<!DOCTYPE html><html lang="zh"><head><meta charset="utf-8"><title>{product["name"]}</title>'
+        f'<script type="application/ld+json">{json.dumps(json_ld, ensure_ascii=False)}</script>'
+        f'</head><body><h1>{product["name"]}</h1><div class="price">{_price(product["price"])}</div>'
+        '</body></html>'
+    )
+
+
+# ============================================
+# HTTP 服务
+# ============================================
+
+class MockHandler(BaseHTTPRequestHandler):
+    server_version = 'MockOutlet/1.0'
+    protocol_version = 'HTTP/1.1'
+
+    @property
+    def catalog(self):
+        return self.server.catalog
+
+    def log_message(self, format, *args):
+        logger.debug(f"{self.address_string()} {format % args}")
+
+    def _send(self, status, body, content_type='text/html; charset=utf-8', headers=None):
+        data = body.encode('utf-8') if isinstance(body, str) else body
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        if self.command != 'HEAD':
+            self.wfile.write(data)
+        self.catalog.count_request(status)
+
+    def _send_json(self, status, data):
+        self._send(status, json.dumps(data, ensure_ascii=False, indent=2), 'application/json')
+
+    def _base_url(self):
+        return f"http://{self.headers.get('Host') or '%s:%s' % self.server.server_address[:2]}"
+
+    def _inject_faults(self):
+        """按设置注入延迟、429 和挑战页，已经响应时返回 True"""
+        settings = self.catalog.settings
+        delay = settings['latency_ms'] + random.uniform(0, settings['jitter_ms'])
+        if delay:
+            time.sleep(delay / 1000)
+
+        if settings['rate_429'] and random.random() < settings['rate_429']:
+            self._send(429, '<html><body><h1>429 Too Many Requests</h1></body></html>',
+                       headers={'Retry-After': str(settings['retry_after'])})
+            return True
+
+        challenge = settings['challenge']
+        if challenge in CHALLENGES and random.random() < settings['challenge_rate']:
+            status, body = CHALLENGES[challenge]
+            self._send(status, body, headers={'Cache-Control': 'no-store'})
+            return True
+        return False
+
+    def do_HEAD(self):
+        self.do_GET()
+
+    def do_GET(self):
+        path = urlsplit(self.path).path
+        if path.startswith('/__control'):
+            self._send_json(200, self.catalog.state())
+        elif path.startswith('/recorded/'):
+            self._serve_recorded(path[len('/recorded/'):])
+        elif self._inject_faults():
+            return
+        elif path.rstrip('/') == CATALOG_PATH:
+            self._serve_catalog()
+        elif path.startswith(DETAIL_PREFIX):
+            self._serve_detail(path[len(DETAIL_PREFIX):].strip('/'))
+        else:
+            self._send(404, '<html><body><h1>404</h1></body></html>')
+
+    def _serve_recorded(self, name):
+        # 只允许目录下的 .html 文件
+        name = os.path.basename(name)
+        path = os.path.join(self.server.recorded_dir, name)
+        if not name.endswith('.html') or not os.path.isfile(path):
+            self._send(404, f'<html><body>未找到录制页面 {name}</body></html>')
+            return
+        with open(path, 'rb') as f:
+            self._send(200, f.read())
+
+    def _serve_catalog(self):
+        recorded = self.catalog.settings['recorded']
+        if recorded:
+            self._serve_recorded(recorded)
+            return
+        body = render_catalog(self.catalog.snapshot(), self._base_url())
+        self._send(200, body, headers={'Cache-Control': 'no-cache'})
+
+    def _serve_detail(self, slug):
+        product = self.catalog.get(slug)
+        if not product:
+            self._send(404, '<html><body><h1>商品已下架</h1></body></html>')
+            return
+
+        body = render_detail(product).encode('utf-8')
+        etag = '"%s"' % hashlib.sha256(body).hexdigest()[:16]
+        modified = int(product['updated'])
+        headers = {
+            'ETag': etag,
+            'Last-Modified': _http_date(modified),
+            'Cache-Control': (self.catalog.settings['cache_control']
+                              or f"max-age={self.catalog.settings['max_age']}"),
+        }
+
+        if self.headers.get('If-None-Match') == etag:
+            self._send(304, b'', headers=headers)
+            return
+        since = self.headers.get('If-Modified-Since')
+        if since and not self.headers.get('If-None-Match'):
+            try:
+                if parsedate_to_datetime(since).timestamp() >= modified:
+                    self._send(304, b'', headers=headers)
+                    return
+            except (TypeError, ValueError):
+                pass
+        self._send(200, body, headers=headers)
+
+    def do_POST(self):
+        path = urlsplit(self.path).path.rstrip('/')
+        length = int(self.headers.get('Content-Length') or 0)
+        try:
+            payload = json.loads(self.rfile.read(length) or b'{}')
+        except ValueError:
+            self._send_json(400, {'error': '请求体不是 JSON'})
+            return
+
+        try:
+            if path == '/__control':
+                self.catalog.configure(**payload)
+                result = self.catalog.state()
+            elif path == '/__control/mutate':
+                result = self.catalog.mutate(**payload)
+                logger.info(f"变更: +{len(result['added'])} -{len(result['removed'])} "
+                            f"降价 {len(result['price_drop'])}")
+            elif path == '/__control/reset':
+                self.catalog.reset()
+                result = self.catalog.state()
+            else:
+                self._send_json(404, {'error': f'未知控制接口 {path}'})
+                return
+        except (TypeError, ValueError) as e:
+            self._send_json(400, {'error': str(e)})
+            return
+        self._send_json(200, result)
+
+
+def start_server(catalog=None, host='127.0.0.1', port=0, recorded_dir=RECORDED_DIR):
+    """在后台线程启动模拟服务器，返回 server（server.url 为列表页地址）
+
+    port=0 时自动选择空闲端口，适合在基准测试中嵌入使用；用完调用 server.shutdown()。
+    """
+    server = ThreadingHTTPServer((host, port), MockHandler)
+    server.daemon_threads = True
+    server.catalog = catalog or MockCatalog()
+    server.recorded_dir = recorded_dir
+    server.url = f"http://{host}:{server.server_address[1]}{CATALOG_PATH}"
+    threading.Thread(target=server.serve_forever, name='mock-outlet', daemon=True).start()
+    return server
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="本地模拟 Arc'teryx Outlet 网站")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--products', type=int, default=100, help='初始商品数量')
+    parser.add_argument('--seed', type=int, default=0, help='随机种子，相同种子生成相同的商品')
+    parser.add_argument('--latency', type=int, default=0, help='每个请求的延迟（毫秒）')
+    parser.add_argument('--recorded-dir', default=RECORDED_DIR, help='录制页面所在目录')
+    parser.add_argument('-v', '--verbose', action='store_true', help='打印每个请求')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.DEBUG if args.verbose else logging.INFO,
+                        format='%(asctime)s - %(levelname)s - %(message)s')
+
+    catalog = MockCatalog(args.products, args.seed)
+    catalog.configure(latency_ms=args.latency)
+    server = start_server(catalog, args.host, args.port, args.recorded_dir)
+    logger.info(f"模拟网站已启动，{args.products} 件商品")
+    print(f"TARGET_URL={server.url}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
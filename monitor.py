@@ -4,17 +4,33 @@ Arc'teryx Outlet 监控工具 - 最终版本
 使用 undetected-chromedriver 绕过反爬虫检测
 """
 
-import os
-import json
 import time
 import logging
 from datetime import datetime
-import undetected_chromedriver as uc
-from selenium.webdriver.common.by import By
+
+import run_metrics
+import run_budget
+import profiling
+from monitor_core import (
+    TARGET_URL, BASELINE_FILE, ensure_directories,
+    save_data, load_baseline, compare_products, print_changes,
+)
+from snapshot_quality import guard_snapshot, advertised_total_from_driver
+from snapshot_archive import archive_driver
+from memory_watchdog import MemoryWatchdog
+from chrome_profile import managed_profile
+from driver_cache import chrome_major_version, cached_driver_path
+from alert_latency import seconds_since_mtime
+from detail_crawler import DETAIL_ENRICH, enrich_changes
+from challenge_detector import ChallengeDetected, CircuitBreaker, check_driver
 
 # 导入邮件通知模块
 try:
-    from email_notifier import send_change_notification
+    from email_notifier import EmailNotifier, send_change_notification
+    from subscriptions import send_subscriber_digests
+    from alert_ledger import NotificationLedger
+    from notification_batcher import DigestBatcher
+    from alert_latency import LatencyTracker
     EMAIL_ENABLED = True
 except ImportError:
     EMAIL_ENABLED = False
@@ -27,228 +43,266 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# 配置
-TARGET_URL = "https://outlet.arcteryx.com/ca/zh/c/mens"
-DATA_DIR = "data"
-LOGS_DIR = "logs"
-BASELINE_FILE = os.path.join(DATA_DIR, "baseline.json")
+def create_driver(profile=None, attempt=0):
+    """创建 undetected Chrome WebDriver
 
-def ensure_directories():
-    """确保必要的目录存在"""
-    os.makedirs(DATA_DIR, exist_ok=True)
-    os.makedirs(LOGS_DIR, exist_ok=True)
-
-def create_driver():
-    """创建 undetected Chrome WebDriver"""
+    profile 为持久化的 Chrome 配置目录；因配置目录启动失败时先原样重试，再重建目录重试。
+    """
+    # 按需导入，HTTP 和通知路径不需要加载 Selenium
+    import undetected_chromedriver as uc
+    
     logger.info("正在初始化 Chrome WebDriver...")
     
     options = uc.ChromeOptions()
     options.headless = True
     options.add_argument('--window-size=1920,1080')
+    if profile:
+        for arg in profile.chrome_args():
+            options.add_argument(arg)
     
     try:
-        driver = uc.Chrome(options=options, version_main=141)  # 指定 Chrome 版本
+        # 按安装的 Chrome 主版本复用打过补丁的 chromedriver，避免每次启动都下载和打补丁
+        with run_metrics.span('driver_patch'):
+            version_main = chrome_major_version()
+            driver_path = cached_driver_path(version_main)
+        
+        with run_metrics.span('driver_start'):
+            if driver_path:
+                driver = uc.Chrome(options=options, version_main=version_main,
+                                   driver_executable_path=driver_path)
+            else:
+                driver = uc.Chrome(options=options, version_main=version_main)
         driver.set_page_load_timeout(90)  # 增加超时时间
         logger.info("✓ Chrome WebDriver 初始化成功")
         return driver
     except Exception as e:
+        # 只有配置目录引起的失败才重试（先原样重试，再重建），其他错误不动配置目录
+        if profile and profile.recover(e, attempt):
+            return create_driver(profile, attempt + 1)
         logger.error(f"✗ 初始化 WebDriver 失败: {e}")
         raise
 
 def fetch_products(driver, url):
     """获取商品信息"""
+    from selenium.webdriver.common.by import By
+    
+    budget = run_budget.current()
     logger.info(f"正在访问 {url}...")
     
     try:
-        driver.get(url)
-        logger.info("✓ 页面已加载，等待 JavaScript 渲染...")
-        
-        # 等待 JavaScript 渲染
-        time.sleep(20)
-        
-        # 滚动页面加载更多产品
-        for i in range(3):
-            driver.execute_script("window.scrollTo(0, document.body.scrollHeight);")
-            time.sleep(3)
-            logger.info(f"滚动 {i+1}/3...")
-        
-        # 查找产品链接 (Arc'teryx Outlet 使用 /shop/mens/ 而不是 /products/)
-        product_links = driver.find_elements(By.CSS_SELECTOR, '.qa--product-tile__link, a[href*="/shop/mens/"]')
-        logger.info(f"找到 {len(product_links)} 个产品链接")
+        with budget.phase('fetch'):
+            driver.set_page_load_timeout(budget.timeout(90))
+            with run_metrics.span('page_load'):
+                driver.get(url)
+            # 第一次 DOM 快照就识别挑战页，不再等待渲染
+            check_driver(driver)
+            logger.info("✓ 页面已加载，等待 JavaScript 渲染...")
+            
+            with run_metrics.span('wait'):
+                # 等待 JavaScript 渲染（时间预算不足时缩短）
+                budget.sleep(20)
+                
+                # 滚动页面加载更多产品
+                for i in range(3):
+                    if not budget.has_time(3):
+                        budget.degrade('scroll')
+                        break
+                    driver.execute_script("window.scrollTo(0, document.body.scrollHeight);")
+                    time.sleep(3)
+                    logger.info(f"滚动 {i+1}/3...")
+            
+            run_metrics.current().sample_page(driver)
+            profiling.capture_browser(driver)
+            with run_metrics.span('archive'):
+                archive_driver(driver, 'monitor')
         
-        # 提取产品信息
-        products = []
-        seen_urls = set()
+        with budget.phase('extract'):
+            with run_metrics.span('extract'):
+                # 查找产品链接 (Arc'teryx Outlet 使用 /shop/mens/ 而不是 /products/)
+                product_links = driver.find_elements(By.CSS_SELECTOR, '.qa--product-tile__link, a[href*="/shop/mens/"]')
+                logger.info(f"找到 {len(product_links)} 个产品链接")
+                products = extract_products(product_links)
         
-        for idx, link in enumerate(product_links):
-            try:
-                href = link.get_attribute('href')
-                
-                if not href or '/shop/mens/' not in href:
-                    continue
-                
-                # 去重
-                if href in seen_urls:
-                    continue
-                seen_urls.add(href)
-                
-                # 提取产品 ID (从 URL 末尾)
-                product_id = href.rstrip('/').split('/')[-1] if href else f'product_{idx}'
-                
-                # 尝试获取产品名称
-                name = None
-                try:
-                    # 查找产品名称元素
-                    parent = link.find_element(By.XPATH, '..')
-                    name_elems = parent.find_elements(By.CSS_SELECTOR, '.product-tile-name, [class*="tile-name"]')
-                    if name_elems:
-                        name = name_elems[0].text.strip()
-                    
-                    if not name:
-                        # 备用：从链接文本获取
-                        name = link.text.strip()
-                    
-                    if not name:
-                        # 再备用：从图片 alt 获取
-                        imgs = link.find_elements(By.TAG_NAME, 'img')
-                        if imgs:
-                            name = imgs[0].get_attribute('alt')
-                except Exception as e:
-                    logger.debug(f"获取产品名称失败: {e}")
-                
-                # 尝试获取价格
-                price = None
-                try:
-                    # 向上查找父元素中的价格
-                    parent = link
-                    for _ in range(5):
-                        try:
-                            parent = parent.find_element(By.XPATH, '..')
-                            price_elems = parent.find_elements(By.CSS_SELECTOR, '.qa--product-tile__prices, [class*="price"]')
-                            if price_elems:
-                                price_text = price_elems[0].text.strip()
-                                # 清理价格文本（可能包含多行）
-                                price = ' '.join(price_text.split())
-                                if price:
-                                    break
-                        except:
-                            break
-                except Exception as e:
-                    logger.debug(f"获取价格失败: {e}")
-                
-                # 保存产品信息
-                product = {
-                    'id': product_id,
-                    'name': name or product_id,
-                    'price': price,
-                    'link': href,
-                    'timestamp': datetime.now().isoformat()
-                }
-                products.append(product)
-                logger.debug(f"✓ 提取产品: {product['name'][:50]}")
-                
-            except Exception as e:
-                logger.warning(f"处理链接 {idx} 失败: {e}")
-                continue
+        if not products:
+            # 挑战页也可能在脚本执行后才出现
+            check_driver(driver)
         
+        run_metrics.current().set('products_found', len(products))
         logger.info(f"✓ 成功提取 {len(products)} 个商品")
         return products
         
+    except ChallengeDetected:
+        raise
     except Exception as e:
         logger.error(f"获取商品失败: {e}")
         import traceback
         traceback.print_exc()
         return []
 
-def save_data(products, filename=BASELINE_FILE):
-    """保存数据"""
-    try:
-        with open(filename, 'w', encoding='utf-8') as f:
-            json.dump({
-                'products': products,
-                'count': len(products),
+def extract_products(product_links):
+    """从商品链接元素中提取商品信息"""
+    from selenium.webdriver.common.by import By
+    
+    # 提取产品信息
+    products = []
+    seen_urls = set()
+    budget = run_budget.current()
+    
+    for idx, link in enumerate(product_links):
+        # 提取阶段超时：保留已提取的部分（由数量检查决定是否与基准合并）
+        if not budget.has_time(0):
+            budget.degrade('links', reason=f"提取时间用完，剩余 {len(product_links) - idx} 个链接")
+            break
+        try:
+            href = link.get_attribute('href')
+            
+            if not href or '/shop/mens/' not in href:
+                continue
+            
+            # 去重
+            if href in seen_urls:
+                continue
+            seen_urls.add(href)
+            
+            # 提取产品 ID (从 URL 末尾)
+            product_id = href.rstrip('/').split('/')[-1] if href else f'product_{idx}'
+            
+            # 尝试获取产品名称
+            name = None
+            try:
+                # 查找产品名称元素
+                parent = link.find_element(By.XPATH, '..')
+                name_elems = parent.find_elements(By.CSS_SELECTOR, '.product-tile-name, [class*="tile-name"]')
+                if name_elems:
+                    name = name_elems[0].text.strip()
+                
+                if not name:
+                    # 备用：从链接文本获取
+                    name = link.text.strip()
+                
+                if not name:
+                    # 再备用：从图片 alt 获取
+                    imgs = link.find_elements(By.TAG_NAME, 'img')
+                    if imgs:
+                        name = imgs[0].get_attribute('alt')
+            except Exception as e:
+                logger.debug(f"获取产品名称失败: {e}")
+            
+            # 尝试获取价格
+            price = None
+            try:
+                # 向上查找父元素中的价格
+                parent = link
+                for _ in range(5):
+                    try:
+                        parent = parent.find_element(By.XPATH, '..')
+                        price_elems = parent.find_elements(By.CSS_SELECTOR, '.qa--product-tile__prices, [class*="price"]')
+                        if price_elems:
+                            price_text = price_elems[0].text.strip()
+                            # 清理价格文本（可能包含多行）
+                            price = ' '.join(price_text.split())
+                            if price:
+                                break
+                    except:
+                        break
+            except Exception as e:
+                logger.debug(f"获取价格失败: {e}")
+            
+            # 保存产品信息
+            product = {
+                'id': product_id,
+                'name': name or product_id,
+                'price': price,
+                'link': href,
                 'timestamp': datetime.now().isoformat()
-            }, f, ensure_ascii=False, indent=2)
-        logger.info(f"✓ 数据已保存到 {filename}")
-        return True
-    except Exception as e:
-        logger.error(f"✗ 保存数据失败: {e}")
-        return False
+            }
+            products.append(product)
+            logger.debug(f"✓ 提取产品: {product['name'][:50]}")
+        
+        except Exception as e:
+            logger.warning(f"处理链接 {idx} 失败: {e}")
+            continue
+    
+    return products
 
-def load_baseline():
-    """加载基准数据"""
-    try:
-        if os.path.exists(BASELINE_FILE):
-            with open(BASELINE_FILE, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-                return data.get('products', [])
-        return []
-    except Exception as e:
-        logger.error(f"加载基准数据失败: {e}")
-        return []
+def notify_changes(changes, current_products, detection=None):
+    """去重、积攒后发送变化通知
 
-def compare_products(old_products, new_products):
-    """比较商品变化"""
-    old_ids = {p['id']: p for p in old_products if p.get('id')}
-    new_ids = {p['id']: p for p in new_products if p.get('id')}
+    detection 包含 observed_at / poll_interval / fetch_seconds，用于统计端到端延迟。
+    """
+    # 去重：抑制闪烁商品和冷却期内的重复通知
+    ledger = NotificationLedger()
+    changes = ledger.filter_changes(changes, current_products)
+    ledger.save()
     
-    # 新增商品
-    added = [p for pid, p in new_ids.items() if pid not in old_ids]
+    # 可选：抓取新增和变价商品的详情页，补充尺码和库存（时间预算不足时跳过）
+    if DETAIL_ENRICH:
+        with run_budget.current().phase('enrich') as budget, run_metrics.span('enrich'):
+            if not budget.has_time(5):
+                budget.degrade('enrich')
+            else:
+                try:
+                    enrich_changes(changes, timeout=budget.phase_remaining())
+                except Exception as e:
+                    logger.warning(f"补充商品详情失败: {e}")
     
-    # 下架商品
-    removed = [p for pid, p in old_ids.items() if pid not in new_ids]
+    # 记录事件首次发现的时间（积攒期间保留最早的时间）
+    tracker = LatencyTracker()
+    tracker.observe(changes, **(detection or {}))
     
-    # 价格变化
-    price_changes = []
-    for pid in set(old_ids.keys()) & set(new_ids.keys()):
-        old_price = old_ids[pid].get('price')
-        new_price = new_ids[pid].get('price')
-        if old_price and new_price and old_price != new_price:
-            price_changes.append({
-                'product': new_ids[pid],
-                'old_price': old_price,
-                'new_price': new_price
-            })
+    # 积攒：窗口未到期时先放入待发队列，到期后合并为一封摘要
+    batcher = DigestBatcher()
+    batcher.add(changes)
+    if not batcher.ready():
+        if len(batcher):
+            logger.info(f"\n{len(batcher)} 条变化已加入摘要队列，窗口到期后统一发送")
+        batcher.save()
+        tracker.save()
+        return
+    changes = batcher.pending()
     
-    return {
-        'added': added,
-        'removed': removed,
-        'price_changes': price_changes
-    }
+    # 发送成功后才清空队列；失败的事件留在队列中，下次运行重试
+    failed = []
+    started = time.monotonic()
+    with run_budget.current().phase('notify'), run_metrics.span('notify'):
+        def on_sent(email, digest):
+            tracker.delivered(digest, 'email:subscriber')
+            ledger.record_sent(digest)
 
-def print_changes(changes):
-    """打印变化"""
-    has_changes = False
-    
-    if changes['added']:
-        has_changes = True
-        logger.info(f"\n🆕 新增商品 ({len(changes['added'])}个):")
-        for p in changes['added'][:10]:
-            logger.info(f"  - {p.get('name', 'N/A')}")
-            logger.info(f"    价格: {p.get('price', 'N/A')}")
-            logger.info(f"    链接: {p.get('link', 'N/A')}")
-        if len(changes['added']) > 10:
-            logger.info(f"  ... 还有 {len(changes['added']) - 10} 个")
-    
-    if changes['removed']:
-        has_changes = True
-        logger.info(f"\n📦 下架商品 ({len(changes['removed'])}个):")
-        for p in changes['removed'][:10]:
-            logger.info(f"  - {p.get('name', 'N/A')}")
-        if len(changes['removed']) > 10:
-            logger.info(f"  ... 还有 {len(changes['removed']) - 10} 个")
-    
-    if changes['price_changes']:
-        has_changes = True
-        logger.info(f"\n💰 价格变化 ({len(changes['price_changes'])}个):")
-        for c in changes['price_changes'][:10]:
-            logger.info(f"  - {c['product'].get('name', 'N/A')}")
-            logger.info(f"    {c['old_price']} → {c['new_price']}")
-        if len(changes['price_changes']) > 10:
-            logger.info(f"  ... 还有 {len(changes['price_changes']) - 10} 个")
+        # 配置了订阅文件时按订阅规则分别发送，否则发给默认收件人
+        notifier = EmailNotifier()
+        try:
+            sent = None
+            if notifier.enabled:
+                sent = send_subscriber_digests(
+                    changes, on_sent=on_sent, on_failed=lambda email, digest: failed.append(digest))
+            if sent is not None:
+                logger.info(f"\n已发送 {sent} 封订阅摘要邮件")
+            elif not notifier.configured():
+                # 没有配置邮件时不积压，与以前一样直接丢弃
+                logger.info("邮件通知未配置，跳过发送")
+            else:
+                logger.info("\n发送邮件通知...")
+                if send_change_notification(changes):
+                    tracker.delivered(changes, 'email')
+                    ledger.record_sent(changes)
+                else:
+                    failed.append(changes)
+        except Exception as e:
+            logger.error(f"发送通知失败: {e}")
+            failed = [changes]
     
-    if not has_changes:
-        logger.info("\n✓ 无变化")
+    if failed:
+        batcher.retain(*failed)
+        logger.warning(f"{len(batcher)} 条变化发送失败，保留在摘要队列中，下次运行重试")
+    else:
+        batcher.flush()
+    batcher.save()
+    run_metrics.current().set('notification_latency_seconds',
+                              round(time.monotonic() - started, 3), channel='email')
+    tracker.save()
+    # 只有实际发出的事件才进入冷却期
+    ledger.save()
 
 def main():
     """主函数"""
@@ -258,26 +312,60 @@ def main():
     logger.info("Arc'teryx Outlet 监控工具")
     logger.info("=" * 60)
     
+    run_metrics.start_run('monitor')
+    budget = run_budget.start()
+    status = 'error'
     driver = None
+    profile = None
+    breaker = CircuitBreaker()
     try:
+        # 被拦截后的退避期内直接跳过，不启动浏览器
+        if not breaker.allow(TARGET_URL):
+            status = 'skipped'
+            return
+        
         # 创建驱动
-        driver = create_driver()
+        with budget.phase('startup'):
+            profile = managed_profile('monitor')
+            driver = create_driver(profile)
         
-        # 获取当前商品
-        current_products = fetch_products(driver, TARGET_URL)
+        # 距上次成功抓取（基准文件写入）的时间，变化最早可能在那之后出现；
+        # 在抓取开始前读取，否则会把本次抓取耗时算进去（fetch_seconds 另外统计）
+        poll_interval = seconds_since_mtime(BASELINE_FILE)
+        
+        # 获取当前商品（看门狗在后台记录内存峰值，抓取完成后回收内存）
+        watchdog = MemoryWatchdog().attach(driver)
+        with watchdog:
+            current_products = fetch_products(driver, TARGET_URL)
+            watchdog.checkpoint(driver)
+        detection = {
+            'observed_at': datetime.now(),
+            'poll_interval': poll_interval,
+            'fetch_seconds': run_metrics.current().total('page_load', 'wait', 'extract'),
+        }
         
         if not current_products:
             logger.error("未能获取商品数据")
+            status = 'empty'
             return
+        breaker.record_success(TARGET_URL)
         
         # 加载基准数据
         baseline_products = load_baseline()
         
+        # 数量明显偏少（懒加载不完整）时与基准合并或丢弃，不覆盖基准
+        current_products, _ = guard_snapshot(
+            current_products, baseline_products, 'monitor', advertised_total_from_driver(driver))
+        if current_products is None:
+            status = 'rejected'
+            return
+        
         if not baseline_products:
             # 首次运行，创建基准
             logger.info(f"\n首次运行，创建基准数据...")
             logger.info(f"基准商品数量: {len(current_products)}")
-            save_data(current_products)
+            with budget.phase('save'), run_metrics.span('save'):
+                save_data(current_products)
             
             # 显示前5个商品
             logger.info("\n前 5 个商品:")
@@ -288,25 +376,24 @@ def main():
         else:
             # 比较变化
             logger.info(f"\n对比基准数据（{len(baseline_products)} 个商品 vs {len(current_products)} 个商品）...")
-            changes = compare_products(baseline_products, current_products)
+            with run_metrics.span('diff'):
+                changes = compare_products(baseline_products, current_products)
             print_changes(changes)
             
             # 发送邮件通知（如果有变化）
             if EMAIL_ENABLED:
-                has_changes = any([
-                    changes.get('added'),
-                    changes.get('price_changes'),
-                    changes.get('removed')
-                ])
-                if has_changes:
-                    logger.info("\n发送邮件通知...")
-                    send_change_notification(changes)
+                notify_changes(changes, current_products, detection)
             
             # 更新基准
-            save_data(current_products)
+            with budget.phase('save'), run_metrics.span('save'):
+                save_data(current_products)
         
+        status = 'ok'
         logger.info("\n✓ 监控完成")
         
+    except ChallengeDetected as e:
+        breaker.record_failure(TARGET_URL, e.challenge['kind'])
+        status = 'blocked'
     except Exception as e:
         logger.error(f"运行出错: {e}")
         import traceback
@@ -316,8 +403,19 @@ def main():
             try:
                 driver.quit()
                 logger.info("✓ 浏览器已关闭")
+                if profile:
+                    profile.release()
             except:
                 pass
+        run_budget.finish()
+        run_metrics.finish_run(status)
 
 if __name__ == "__main__":
-    main()
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Arc'teryx Outlet 监控工具")
+    profiling.add_profile_argument(parser)
+    args = parser.parse_args()
+
+    with profiling.start_session(args.profile, 'monitor'):
+        main()
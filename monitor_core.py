@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""
+监控脚本共用的部分 - 配置、基准数据的读写、对比和打印
+
+monitor.py、monitor_final.py、monitor_json.py、monitor_optimized.py 以前各自复制了一份
+save_data / load_baseline / compare_products / print_changes，现在都从这里导入，
+各脚本只保留自己的抓取方式。fetch_backends.py 的自动选择也使用同一套函数。
+
+基准格式（data/baseline.json）：
+    {"products": [{"id", "name", "price", "link", "timestamp"}, ...], "count": N, "timestamp": "..."}
+"""
+
+import os
+import logging
+from datetime import datetime
+from urllib.parse import urljoin
+
+from atomic_io import read_json, write_json
+
+logger = logging.getLogger(__name__)
+
+# 配置
+TARGET_URL = os.getenv("TARGET_URL", "https://outlet.arcteryx.com/ca/zh/c/mens")
+DATA_DIR = "data"
+LOGS_DIR = "logs"
+BASELINE_FILE = os.path.join(DATA_DIR, "baseline.json")
+
+
+def ensure_directories():
+    """确保必要的目录存在"""
+    os.makedirs(DATA_DIR, exist_ok=True)
+    os.makedirs(LOGS_DIR, exist_ok=True)
+
+
+def product_id_from_link(link):
+    """商品 ID：链接的最后一段（各种抓取方式都能得到，可以互相对比）"""
+    return link.rstrip('/').split('/')[-1] if link else None
+
+
+def normalize_products(products, base_url=TARGET_URL):
+    """补全相对链接，并统一以链接末尾作为 ID
+
+    不同的抓取方式取到的 ID 不一样（DOM 元素 id、__NEXT_DATA__ 中的 productId、链接），
+    切换抓取方式时如果不统一，所有商品都会被当成下架再上架。
+    """
+    for product in products:
+        if product.get('link'):
+            product['link'] = urljoin(base_url, product['link'])
+        product_id = product_id_from_link(product.get('link'))
+        if product_id:
+            product['id'] = product_id
+    return products
+
+
+def save_data(products, filename=BASELINE_FILE):
+    """保存数据"""
+    try:
+        write_json(filename, {
+            'products': products,
+            'count': len(products),
+            'timestamp': datetime.now().isoformat()
+        })
+        logger.info(f"✓ 数据已保存到 {filename}")
+        return True
+    except Exception as e:
+        logger.error(f"✗ 保存数据失败: {e}")
+        return False
+
+
+def load_baseline(filename=BASELINE_FILE):
+    """加载基准数据"""
+    try:
+        # 文件损坏时自动从上一个版本恢复，而不是当成首次运行
+        data = read_json(filename, {})
+        return data.get('products', [])
+    except Exception as e:
+        logger.error(f"加载基准数据失败: {e}")
+        return []
+
+
+def compare_products(old_products, new_products):
+    """比较商品变化"""
+    old_ids = {p['id']: p for p in old_products if p.get('id')}
+    new_ids = {p['id']: p for p in new_products if p.get('id')}
+
+    # 新增商品
+    added = [p for pid, p in new_ids.items() if pid not in old_ids]
+
+    # 下架商品
+    removed = [p for pid, p in old_ids.items() if pid not in new_ids]
+
+    # 价格变化
+    price_changes = []
+    for pid in set(old_ids.keys()) & set(new_ids.keys()):
+        old_price = old_ids[pid].get('price')
+        new_price = new_ids[pid].get('price')
+        if old_price and new_price and old_price != new_price:
+            price_changes.append({
+                'product': new_ids[pid],
+                'old_price': old_price,
+                'new_price': new_price
+            })
+
+    return {
+        'added': added,
+        'removed': removed,
+        'price_changes': price_changes
+    }
+
+
+def print_changes(changes, limit=10):
+    """打印变化（每类最多 limit 个）"""
+    if changes['added']:
+        logger.info(f"\n🆕 新增商品 ({len(changes['added'])}个):")
+        for p in changes['added'][:limit]:
+            logger.info(f"  - {p.get('name', 'N/A')}")
+            logger.info(f"    价格: {p.get('price', 'N/A')}")
+            logger.info(f"    链接: {p.get('link', 'N/A')}")
+        if len(changes['added']) > limit:
+            logger.info(f"  ... 还有 {len(changes['added']) - limit} 个")
+
+    if changes['removed']:
+        logger.info(f"\n📦 下架商品 ({len(changes['removed'])}个):")
+        for p in changes['removed'][:limit]:
+            logger.info(f"  - {p.get('name', 'N/A')}")
+        if len(changes['removed']) > limit:
+            logger.info(f"  ... 还有 {len(changes['removed']) - limit} 个")
+
+    if changes['price_changes']:
+        logger.info(f"\n💰 价格变化 ({len(changes['price_changes'])}个):")
+        for c in changes['price_changes'][:limit]:
+            logger.info(f"  - {c['product'].get('name', 'N/A')}")
+            logger.info(f"    {c['old_price']} → {c['new_price']}")
+        if len(changes['price_changes']) > limit:
+            logger.info(f"  ... 还有 {len(changes['price_changes']) - limit} 个")
+
+    if not any([changes['added'], changes['removed'], changes['price_changes']]):
+        logger.info("\n✓ 无变化")
@@ -5,26 +5,31 @@
 适用于低内存环境
 """
 
-import requests
 from bs4 import BeautifulSoup
 import json
 import os
 from datetime import datetime
 import time
 
+import run_metrics
+from http_session import get_session, save_cookies
+from snapshot_archive import archive_page
+
 class LiteMonitor:
     def __init__(self):
-        self.url = "https://outlet.arcteryx.com/ca/zh/c/mens"
-        self.session = requests.Session()
-        self.session.headers.update({
-            'User-Agent': 'Mozilla/5.0 (Linux; x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/119.0.0.0 Safari/537.36'
-        })
+        self.url = os.getenv("TARGET_URL", "https://outlet.arcteryx.com/ca/zh/c/mens")
+        # 共享的连接池 Session，Cookie 跨运行保留
+        self.session = get_session()
     
     def check_page_changes(self):
-        """检查页面变化（简化版）"""
+        """检查页面变化（简化版），返回是否变化；检查失败返回 None"""
         try:
             print(f"检查网页: {self.url}")
-            response = self.session.get(self.url, timeout=30)
+            with run_metrics.span('page_load'):
+                response = self.session.get(self.url, timeout=30)
+            run_metrics.current().add('bytes_fetched', len(response.content))
+            # 归档每次抓取的页面（内容相同的页面只存一份）
+            archive_page(response.text, 'lite', target=self.url)
             
             # 简单的变化检测
             content_hash = hash(response.text)
@@ -42,10 +47,7 @@ class LiteMonitor:
                 f.write(str(content_hash))
             
             if previous_hash and str(content_hash) != previous_hash:
-                print("🔔 页面内容发生变化！")
-                # 保存页面用于分析
-                with open("data/latest_page.html", "w", encoding='utf-8') as f:
-                    f.write(response.text)
+                print("🔔 页面内容发生变化！页面见快照归档（python3 snapshot_archive.py list）")
                 return True
             else:
                 print("✓ 页面无变化")
@@ -53,11 +55,18 @@ class LiteMonitor:
                 
         except Exception as e:
             print(f"❌ 检查失败: {e}")
-            return False
+            return None
 
 def main():
+    run_metrics.start_run('lite')
     monitor = LiteMonitor()
-    monitor.check_page_changes()
+    status = 'error'
+    try:
+        if monitor.check_page_changes() is not None:
+            status = 'ok'
+    finally:
+        save_cookies(monitor.session)
+        run_metrics.finish_run(status)
 
 if __name__ == "__main__":
     main()
@@ -3,11 +3,11 @@
 Arc'teryx Outlet 监控工具 - 优化版（适用于低内存 EC2 实例）
 """
 
-import os
-import json
 import time
+import random
 import logging
 from datetime import datetime
+from urllib.parse import urljoin
 from selenium import webdriver
 from selenium.webdriver.chrome.service import Service
 from selenium.webdriver.chrome.options import Options
@@ -16,6 +16,20 @@ from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 from selenium.common.exceptions import TimeoutException, WebDriverException
 
+import run_metrics
+import run_budget
+import profiling
+from monitor_core import (
+    TARGET_URL, ensure_directories,
+    save_data, load_baseline, compare_products, print_changes,
+)
+from snapshot_quality import guard_snapshot
+from snapshot_archive import archive_driver
+from selector_cache import SelectorCache, SelectorStrategy
+from memory_watchdog import MemoryWatchdog
+from chrome_profile import managed_profile
+from challenge_detector import ChallengeDetected, CircuitBreaker, check_driver
+
 # 配置日志
 logging.basicConfig(
     level=logging.INFO,
@@ -23,19 +37,11 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# 配置
-TARGET_URL = "https://outlet.arcteryx.com/ca/zh/c/mens"
-DATA_DIR = "data"
-LOGS_DIR = "logs"
-BASELINE_FILE = os.path.join(DATA_DIR, "baseline.json")
+def create_driver(profile=None, attempt=0):
+    """创建优化的 Chrome WebDriver（低内存配置）
 
-def ensure_directories():
-    """确保必要的目录存在"""
-    os.makedirs(DATA_DIR, exist_ok=True)
-    os.makedirs(LOGS_DIR, exist_ok=True)
-
-def create_driver():
-    """创建优化的 Chrome WebDriver（低内存配置）"""
+    profile 为持久化的 Chrome 配置目录；因配置目录启动失败时先原样重试，再重建目录重试。
+    """
     logger.info("正在初始化 Chrome WebDriver（优化模式）...")
     
     chrome_options = Options()
@@ -60,7 +66,7 @@ def create_driver():
     
     # 限制内存使用
     chrome_options.add_argument('--max-old-space-size=256')
-    chrome_options.add_argument('--memory-pressure-off')
+    # 不加 --memory-pressure-off：MemoryWatchdog 靠模拟内存压力通知让 Chrome 释放内存
     chrome_options.add_argument('--single-process')  # 单进程模式
     
     # 窗口大小
@@ -74,8 +80,14 @@ def create_driver():
     chrome_options.add_experimental_option("excludeSwitches", ["enable-automation"])
     chrome_options.add_experimental_option('useAutomationExtension', False)
     
+    # 持久化配置目录：复用 HTTP 缓存和 Cookie
+    if profile:
+        for arg in profile.chrome_args():
+            chrome_options.add_argument(arg)
+    
     try:
-        driver = webdriver.Chrome(options=chrome_options)
+        with run_metrics.span('driver_start'):
+            driver = webdriver.Chrome(options=chrome_options)
         
         # 设置超时（缩短以节省资源）
         driver.set_page_load_timeout(45)
@@ -88,100 +100,154 @@ def create_driver():
         return driver
         
     except Exception as e:
+        # 只有配置目录引起的失败才重试（先原样重试，再重建），其他错误不动配置目录
+        if profile and profile.recover(e, attempt):
+            return create_driver(profile, attempt + 1)
         logger.error(f"✗ 初始化 WebDriver 失败: {e}")
         raise
 
-def fetch_products(driver, url, max_retries=2):
+def retry_delay(attempt, base=5, cap=60):
+    """重试等待时间：指数退避加抖动"""
+    return min(cap, base * 2 ** attempt) * random.uniform(0.8, 1.2)
+
+# 一次重试至少需要的时间（加载 + 等待渲染 + 解析）
+RETRY_MIN_SECONDS = 30
+
+def wait_before_retry(attempt, budget):
+    """重试前等待；剩余时间不够再试一次时放弃重试，返回 False"""
+    delay = retry_delay(attempt)
+    if not budget.has_time(delay + RETRY_MIN_SECONDS):
+        budget.degrade('retry')
+        return False
+    time.sleep(delay)
+    return True
+
+def fetch_products(driver, url, max_retries=2, watchdog=None):
     """获取商品信息（简化版）"""
     logger.info(f"正在访问 {url}...")
+    budget = run_budget.current()
     
-    for attempt in range(max_retries):
-        try:
-            driver.get(url)
-            logger.info(f"页面请求已发送，等待加载... (尝试 {attempt + 1}/{max_retries})")
-            
-            # 等待页面基本加载完成（等待 body 元素）
-            wait = WebDriverWait(driver, 20)
-            wait.until(EC.presence_of_element_located((By.TAG_NAME, 'body')))
-            logger.info("✓ 页面 body 已加载")
-            
-            # 额外等待 JavaScript 执行
-            time.sleep(5)
-            logger.info("等待 JavaScript 渲染...")
-            
-            # 尝试滚动触发懒加载
-            driver.execute_script("window.scrollTo(0, 1000);")
-            time.sleep(3)
+    with budget.phase('fetch'):
+        for attempt in range(max_retries):
+            # 重试前检查内存，必要时回收或重启浏览器
+            if watchdog and attempt > 0:
+                driver = watchdog.checkpoint(driver)
+            retry = attempt < max_retries - 1
             
-            # 解析产品（不等待特定元素，直接尝试解析）
-            products = parse_products(driver)
-            
-            if products:
-                logger.info(f"✓ 成功获取 {len(products)} 个商品")
-                return products
-            else:
-                logger.warning(f"未找到商品（尝试 {attempt + 1}/{max_retries}）")
-                # 保存页面源码用于调试
-                if attempt == max_retries - 1:
-                    try:
-                        with open('page_source.html', 'w', encoding='utf-8') as f:
-                            f.write(driver.page_source)
-                        logger.info("页面源码已保存到 page_source.html")
-                    except:
-                        pass
-                if attempt < max_retries - 1:
-                    time.sleep(5)
+            try:
+                with run_metrics.span('page_load'):
+                    driver.set_page_load_timeout(budget.timeout(45))
+                    driver.get(url)
+                    logger.info(f"页面请求已发送，等待加载... (尝试 {attempt + 1}/{max_retries})")
+                    
+                    # 等待页面基本加载完成（等待 body 元素）
+                    wait = WebDriverWait(driver, budget.timeout(20))
+                    wait.until(EC.presence_of_element_located((By.TAG_NAME, 'body')))
+                # 挑战页不会因为重试而消失，识别后直接中止
+                check_driver(driver)
+                logger.info("✓ 页面 body 已加载")
+                
+                with run_metrics.span('wait'):
+                    # 额外等待 JavaScript 执行
+                    budget.sleep(5)
+                    logger.info("等待 JavaScript 渲染...")
+                    
+                    # 尝试滚动触发懒加载
+                    driver.execute_script("window.scrollTo(0, 1000);")
+                    budget.sleep(3)
+                run_metrics.current().sample_page(driver)
+                profiling.capture_browser(driver)
+                with run_metrics.span('archive'):
+                    archive_driver(driver, 'optimized')
+                
+                # 解析产品（不等待特定元素，直接尝试解析）
+                with budget.phase('extract'), run_metrics.span('extract'):
+                    products = parse_products(driver)
+                
+                if products:
+                    run_metrics.current().set('products_found', len(products))
+                    logger.info(f"✓ 成功获取 {len(products)} 个商品")
+                    return products
+                else:
+                    check_driver(driver)
+                    logger.warning(f"未找到商品（尝试 {attempt + 1}/{max_retries}），"
+                                   f"页面源码见快照归档（python3 snapshot_archive.py list）")
                     
-        except TimeoutException:
-            logger.warning(f"页面加载超时（尝试 {attempt + 1}/{max_retries}）")
-            if attempt < max_retries - 1:
-                time.sleep(5)
-        except Exception as e:
-            logger.error(f"获取商品失败: {e}")
-            if attempt < max_retries - 1:
-                time.sleep(5)
+            except ChallengeDetected:
+                raise
+            except TimeoutException:
+                logger.warning(f"页面加载超时（尝试 {attempt + 1}/{max_retries}）")
+            except Exception as e:
+                logger.error(f"获取商品失败: {e}")
+            
+            if retry and not wait_before_retry(attempt, budget):
+                break
     
     return []
 
+# 候选选择器（按优先级）；实际尝试顺序由选择器缓存决定
+PRODUCT_SELECTORS = [
+    'div[data-testid="product-card"]',
+    '.product-card',
+    '[class*="ProductCard"]',
+    'article[class*="product"]'
+]
+NAME_SELECTORS = [
+    'h3', 'h4', '.product-name', '[class*="productName"]',
+    '[class*="ProductName"]', '[data-testid*="name"]'
+]
+PRICE_SELECTORS = [
+    '.price', '[class*="price"]', '[data-testid*="price"]',
+    'span[class*="Price"]'
+]
+
 def parse_products(driver):
     """解析产品元素"""
     products = []
     
-    # 多种选择器
-    selectors = [
-        'div[data-testid="product-card"]',
-        '.product-card',
-        '[class*="ProductCard"]',
-        'article[class*="product"]'
-    ]
-    
-    product_elements = []
-    for selector in selectors:
-        try:
-            elements = driver.find_elements(By.CSS_SELECTOR, selector)
-            if elements:
-                logger.info(f"使用选择器 '{selector}' 找到 {len(elements)} 个元素")
-                product_elements = elements
-                break
-        except:
-            continue
-    
-    if not product_elements:
-        logger.warning("未找到任何产品元素")
-        return []
+    # 先试上次匹配的选择器，不再匹配时回退到完整列表并重新学习
+    cache = SelectorCache()
+    containers = cache.strategy(TARGET_URL, 'optimized.container', PRODUCT_SELECTORS)
+    names = cache.strategy(TARGET_URL, 'optimized.name', NAME_SELECTORS)
+    prices = cache.strategy(TARGET_URL, 'optimized.price', PRICE_SELECTORS)
     
-    for element in product_elements[:30]:  # 限制处理数量
-        try:
-            product_data = parse_product_element(element)
-            if product_data:
-                products.append(product_data)
-        except Exception as e:
-            continue
+    try:
+        product_elements = []
+        for selector in containers:
+            try:
+                elements = driver.find_elements(By.CSS_SELECTOR, selector)
+                if elements:
+                    logger.info(f"使用选择器 '{selector}' 找到 {len(elements)} 个元素")
+                    containers.matched(selector)
+                    product_elements = elements
+                    break
+            except:
+                pass
+            containers.missed(selector)
+        
+        if not product_elements:
+            logger.warning("未找到任何产品元素")
+            return []
+        
+        for element in product_elements[:30]:  # 限制处理数量
+            try:
+                product_data = parse_product_element(element, names, prices)
+                if product_data:
+                    products.append(product_data)
+            except Exception as e:
+                continue
+    finally:
+        cache.save()
     
     return products
 
-def parse_product_element(element):
-    """解析单个产品元素"""
+def parse_product_element(element, names=None, prices=None):
+    """解析单个产品元素
+
+    names / prices 为名称和价格选择器的尝试顺序，匹配结果会被记住。
+    """
+    names = names or SelectorStrategy('name', NAME_SELECTORS)
+    prices = prices or SelectorStrategy('price', PRICE_SELECTORS)
     try:
         # 获取产品 ID
         product_id = None
@@ -194,34 +260,30 @@ def parse_product_element(element):
         
         # 获取产品名称
         name = None
-        name_selectors = [
-            'h3', 'h4', '.product-name', '[class*="productName"]',
-            '[class*="ProductName"]', '[data-testid*="name"]'
-        ]
-        for selector in name_selectors:
+        for selector in names:
             try:
                 name_elem = element.find_element(By.CSS_SELECTOR, selector)
                 name = name_elem.text.strip()
                 if name:
+                    names.matched(selector)
                     break
             except:
-                continue
+                pass
+            names.missed(selector)
         
         # 获取价格
         price = None
-        price_selectors = [
-            '.price', '[class*="price"]', '[data-testid*="price"]',
-            'span[class*="Price"]'
-        ]
-        for selector in price_selectors:
+        for selector in prices:
             try:
                 price_elem = element.find_element(By.CSS_SELECTOR, selector)
                 price_text = price_elem.text.strip()
                 if price_text and ('$' in price_text or '¥' in price_text):
                     price = price_text
+                    prices.matched(selector)
                     break
             except:
-                continue
+                pass
+            prices.missed(selector)
         
         # 获取链接
         link = None
@@ -229,7 +291,7 @@ def parse_product_element(element):
             link_elem = element.find_element(By.TAG_NAME, 'a')
             link = link_elem.get_attribute('href')
             if link and not link.startswith('http'):
-                link = f"https://outlet.arcteryx.com{link}"
+                link = urljoin(TARGET_URL, link)
         except:
             pass
         
@@ -252,82 +314,6 @@ def parse_product_element(element):
     
     return None
 
-def save_data(products, filename=BASELINE_FILE):
-    """保存数据"""
-    try:
-        with open(filename, 'w', encoding='utf-8') as f:
-            json.dump({
-                'products': products,
-                'count': len(products),
-                'timestamp': datetime.now().isoformat()
-            }, f, ensure_ascii=False, indent=2)
-        logger.info(f"✓ 数据已保存到 {filename}")
-        return True
-    except Exception as e:
-        logger.error(f"✗ 保存数据失败: {e}")
-        return False
-
-def load_baseline():
-    """加载基准数据"""
-    try:
-        if os.path.exists(BASELINE_FILE):
-            with open(BASELINE_FILE, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-                return data.get('products', [])
-        return []
-    except Exception as e:
-        logger.error(f"加载基准数据失败: {e}")
-        return []
-
-def compare_products(old_products, new_products):
-    """比较商品变化"""
-    old_ids = {p['id']: p for p in old_products}
-    new_ids = {p['id']: p for p in new_products}
-    
-    # 新增商品
-    added = [p for pid, p in new_ids.items() if pid not in old_ids]
-    
-    # 下架商品
-    removed = [p for pid, p in old_ids.items() if pid not in new_ids]
-    
-    # 价格变化
-    price_changes = []
-    for pid in set(old_ids.keys()) & set(new_ids.keys()):
-        old_price = old_ids[pid].get('price')
-        new_price = new_ids[pid].get('price')
-        if old_price and new_price and old_price != new_price:
-            price_changes.append({
-                'product': new_ids[pid],
-                'old_price': old_price,
-                'new_price': new_price
-            })
-    
-    return {
-        'added': added,
-        'removed': removed,
-        'price_changes': price_changes
-    }
-
-def print_changes(changes):
-    """打印变化"""
-    if changes['added']:
-        logger.info(f"\n🆕 新增商品 ({len(changes['added'])}个):")
-        for p in changes['added'][:10]:
-            logger.info(f"  - {p['name']} ({p.get('price', 'N/A')})")
-    
-    if changes['removed']:
-        logger.info(f"\n📦 下架商品 ({len(changes['removed'])}个):")
-        for p in changes['removed'][:10]:
-            logger.info(f"  - {p['name']}")
-    
-    if changes['price_changes']:
-        logger.info(f"\n💰 价格变化 ({len(changes['price_changes'])}个):")
-        for c in changes['price_changes'][:10]:
-            logger.info(f"  - {c['product']['name']}: {c['old_price']} → {c['new_price']}")
-    
-    if not any([changes['added'], changes['removed'], changes['price_changes']]):
-        logger.info("\n✓ 无变化")
-
 def main():
     """主函数"""
     ensure_directories()
@@ -336,45 +322,89 @@ def main():
     logger.info("Arc'teryx Outlet 监控工具 - 优化版")
     logger.info("=" * 60)
     
+    run_metrics.start_run('optimized')
+    budget = run_budget.start()
+    status = 'error'
     driver = None
+    watchdog = None
+    profile = None
+    breaker = CircuitBreaker()
     try:
+        # 被拦截后的退避期内直接跳过，不启动浏览器
+        if not breaker.allow(TARGET_URL):
+            status = 'skipped'
+            return
+        
         # 创建驱动
-        driver = create_driver()
+        with budget.phase('startup'):
+            profile = managed_profile('optimized')
+            driver = create_driver(profile)
+        watchdog = MemoryWatchdog(restart=lambda: create_driver(profile)).attach(driver)
         
         # 获取当前商品
-        current_products = fetch_products(driver, TARGET_URL)
+        with watchdog:
+            current_products = fetch_products(driver, TARGET_URL, watchdog=watchdog)
         
         if not current_products:
             logger.error("未能获取商品数据")
+            status = 'empty'
             return
+        breaker.record_success(TARGET_URL)
         
         # 加载基准数据
         baseline_products = load_baseline()
         
+        # 数量明显偏少（懒加载不完整）时与基准合并或丢弃，不覆盖基准
+        # （这个版本最多解析 30 个商品，不和页面标明的总数比较）
+        current_products, _ = guard_snapshot(current_products, baseline_products, 'optimized')
+        if current_products is None:
+            status = 'rejected'
+            return
+        
         if not baseline_products:
             # 首次运行，创建基准
             logger.info("首次运行，创建基准数据...")
-            save_data(current_products)
+            with budget.phase('save'), run_metrics.span('save'):
+                save_data(current_products)
         else:
             # 比较变化
-            changes = compare_products(baseline_products, current_products)
+            with run_metrics.span('diff'):
+                changes = compare_products(baseline_products, current_products)
             print_changes(changes)
             
             # 更新基准
-            save_data(current_products)
+            with budget.phase('save'), run_metrics.span('save'):
+                save_data(current_products)
         
+        status = 'ok'
         logger.info("\n✓ 监控完成")
         
+    except ChallengeDetected as e:
+        breaker.record_failure(TARGET_URL, e.challenge['kind'])
+        status = 'blocked'
     except Exception as e:
         logger.error(f"运行出错: {e}")
     finally:
+        # 看门狗可能已经重启过浏览器
+        if watchdog:
+            driver = watchdog.driver
         if driver:
             try:
                 driver.quit()
                 logger.info("✓ 浏览器已关闭")
+                if profile:
+                    profile.release()
             except:
                 pass
+        run_budget.finish()
+        run_metrics.finish_run(status)
 
 if __name__ == "__main__":
-    main()
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Arc'teryx Outlet 监控工具 - 优化版")
+    profiling.add_profile_argument(parser)
+    args = parser.parse_args()
 
+    with profiling.start_session(args.profile, 'optimized'):
+        main()
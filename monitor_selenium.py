@@ -12,22 +12,53 @@ from selenium.webdriver.support import expected_conditions as EC
 from selenium.webdriver.chrome.options import Options
 from selenium.webdriver.chrome.service import Service
 from selenium.common.exceptions import TimeoutException, NoSuchElementException
-import json
 import os
 from datetime import datetime
 from typing import Dict, List
 import time
 import hashlib
 
+import run_metrics
+import profiling
+from atomic_io import read_json, write_json
+from snapshot_archive import archive_driver
+from snapshot_quality import guard_snapshot, advertised_total_from_driver
+from alert_latency import seconds_since_mtime
+from selector_cache import SelectorCache, SelectorStrategy
+
+# 候选选择器（按优先级）；实际尝试顺序由选择器缓存决定
+PRODUCT_SELECTORS = [
+    "div[id*='mens-']",  # 商品容器以 mens- 开头的 id
+    ".qa--grid-product-tile",
+    "[data-testid='product-tile']",
+    ".product-tile",
+    "article",
+]
+NAME_SELECTORS = [
+    ".product-tile-name",  # 主要选择器
+    "[class*='product-tile-name']",
+    "[data-component='body3']",
+    ".product-name",
+    "h2",
+    "h3",
+]
+PRICE_SELECTORS = [
+    ".qa--product-tile__prices",  # 价格容器
+    ".qa--product-tile__minRange-price",  # 折扣价
+    "[class*='price']",
+]
+
 
 class ArcOutletMonitorSelenium:
     def __init__(self, data_dir="data", headless=True):
-        self.url = "https://outlet.arcteryx.com/ca/zh/c/mens"
+        self.url = os.getenv("TARGET_URL", "https://outlet.arcteryx.com/ca/zh/c/mens")
         self.data_dir = data_dir
         self.products_file = os.path.join(data_dir, "products.json")
         self.history_file = os.path.join(data_dir, "history.json")
         self.changes_file = os.path.join(data_dir, "changes.json")
         self.headless = headless
+        # 页面标明的商品总数，由 fetch_and_parse_products 在关闭浏览器前读取
+        self.advertised_total = None
         
         # 创建数据目录
         os.makedirs(data_dir, exist_ok=True)
@@ -56,7 +87,8 @@ class ArcOutletMonitorSelenium:
         
         try:
             print("正在启动 Chrome 浏览器...")
-            driver = webdriver.Chrome(options=options)
+            with run_metrics.span('driver_start'):
+                driver = webdriver.Chrome(options=options)
             driver.set_page_load_timeout(60)  # 60秒页面加载超时
             driver.set_script_timeout(30)  # 30秒脚本超时
             print("✓ 浏览器启动成功")
@@ -71,6 +103,7 @@ class ArcOutletMonitorSelenium:
     
     def fetch_and_parse_products(self) -> Dict[str, dict]:
         """使用 Selenium 获取并解析商品"""
+        self.advertised_total = None
         driver = self.create_driver()
         if not driver:
             return {}
@@ -80,71 +113,77 @@ class ArcOutletMonitorSelenium:
         try:
             print(f"正在访问: {self.url}")
             try:
-                driver.get(self.url)
+                with run_metrics.span('page_load'):
+                    driver.get(self.url)
             except Exception as e:
                 print(f"⚠️  页面加载遇到问题: {e}")
                 print("尝试继续...")
             
-            # 等待页面加载
-            print("等待页面加载...")
-            time.sleep(5)  # 给页面更多时间来渲染
-            
-            # 尝试等待商品容器加载
-            try:
-                WebDriverWait(driver, 20).until(
-                    EC.presence_of_element_located((By.CSS_SELECTOR, "body"))
-                )
-                print("✓ 页面已加载")
-            except TimeoutException:
-                print("⚠️  页面加载超时，尝试继续...")
-            
-            # 再等待一会儿让 JavaScript 执行
-            time.sleep(3)
-            
-            # 滚动页面以加载更多商品（如果有懒加载）
-            self.scroll_page(driver)
-            
-            # 多种商品选择器
-            selectors = [
-                "div[id*='mens-']",  # 商品容器以 mens- 开头的 id
-                ".qa--grid-product-tile",
-                "[data-testid='product-tile']",
-                ".product-tile",
-                "article",
-            ]
-            
-            product_elements = []
-            for selector in selectors:
+            with run_metrics.span('wait'):
+                # 等待页面加载
+                print("等待页面加载...")
+                time.sleep(5)  # 给页面更多时间来渲染
+                
+                # 尝试等待商品容器加载
                 try:
-                    product_elements = driver.find_elements(By.CSS_SELECTOR, selector)
-                    if product_elements:
-                        print(f"✓ 使用选择器找到 {len(product_elements)} 个元素: {selector}")
-                        break
-                except:
-                    continue
-            
-            if not product_elements:
-                print("⚠️  未找到商品元素")
-                # 保存页面源代码用于调试
-                with open(os.path.join(self.data_dir, "page_source.html"), "w", encoding='utf-8') as f:
-                    f.write(driver.page_source)
-                print(f"已保存页面源代码到 {self.data_dir}/page_source.html")
-                return products
-            
-            print(f"正在解析 {len(product_elements)} 个商品...")
-            
-            for idx, element in enumerate(product_elements, 1):
-                try:
-                    product_data = self.parse_product_element(element, idx)
-                    if product_data and product_data.get('name') != "未知商品":
-                        product_id = product_data['id']
-                        products[product_id] = product_data
-                        if idx <= 3:  # 打印前3个用于调试
-                            print(f"  {idx}. {product_data['name']} - {product_data['price']}")
-                except Exception as e:
-                    print(f"⚠️  解析商品 {idx} 时出错: {e}")
-                    continue
+                    WebDriverWait(driver, 20).until(
+                        EC.presence_of_element_located((By.CSS_SELECTOR, "body"))
+                    )
+                    print("✓ 页面已加载")
+                except TimeoutException:
+                    print("⚠️  页面加载超时，尝试继续...")
+                
+                # 再等待一会儿让 JavaScript 执行
+                time.sleep(3)
+                
+                # 滚动页面以加载更多商品（如果有懒加载）
+                self.scroll_page(driver)
+            run_metrics.current().sample_page(driver)
+            profiling.capture_browser(driver)
+            with run_metrics.span('archive'):
+                archive_driver(driver, 'selenium')
+            self.advertised_total = advertised_total_from_driver(driver)
             
+            with run_metrics.span('extract'):
+                # 先试上次匹配的选择器，不再匹配时回退到完整列表并重新学习
+                cache = SelectorCache()
+                containers = cache.strategy(self.url, 'selenium.container', PRODUCT_SELECTORS)
+                names = cache.strategy(self.url, 'selenium.name', NAME_SELECTORS)
+                prices = cache.strategy(self.url, 'selenium.price', PRICE_SELECTORS)
+                
+                product_elements = []
+                for selector in containers:
+                    try:
+                        product_elements = driver.find_elements(By.CSS_SELECTOR, selector)
+                        if product_elements:
+                            print(f"✓ 使用选择器找到 {len(product_elements)} 个元素: {selector}")
+                            containers.matched(selector)
+                            break
+                    except:
+                        pass
+                    containers.missed(selector)
+                
+                if not product_elements:
+                    print("⚠️  未找到商品元素，页面源码见快照归档（python3 snapshot_archive.py list）")
+                    cache.save()
+                    return products
+                
+                print(f"正在解析 {len(product_elements)} 个商品...")
+                
+                for idx, element in enumerate(product_elements, 1):
+                    try:
+                        product_data = self.parse_product_element(element, idx, names, prices)
+                        if product_data and product_data.get('name') != "未知商品":
+                            product_id = product_data['id']
+                            products[product_id] = product_data
+                            if idx <= 3:  # 打印前3个用于调试
+                                print(f"  {idx}. {product_data['name']} - {product_data['price']}")
+                    except Exception as e:
+                        print(f"⚠️  解析商品 {idx} 时出错: {e}")
+                        continue
+                cache.save()
+                
+            run_metrics.current().set('products_found', len(products))
             print(f"✓ 成功解析 {len(products)} 个商品")
             
         except Exception as e:
@@ -169,50 +208,45 @@ class ArcOutletMonitorSelenium:
         except:
             pass
     
-    def parse_product_element(self, element, idx) -> dict:
-        """解析单个商品元素"""
+    def parse_product_element(self, element, idx, names=None, prices=None) -> dict:
+        """解析单个商品元素
+
+        names / prices 为名称和价格选择器的尝试顺序，匹配结果会被记住。
+        """
+        names = names or SelectorStrategy('name', NAME_SELECTORS)
+        prices = prices or SelectorStrategy('price', PRICE_SELECTORS)
+        
         # 从 ID 属性获取产品 ID
         element_id = element.get_attribute('id') or f"product_{idx}"
         product_id = element_id
         
         # 商品名称
         name = "未知商品"
-        name_selectors = [
-            ".product-tile-name",  # 主要选择器
-            "[class*='product-tile-name']",
-            "[data-component='body3']",
-            ".product-name",
-            "h2",
-            "h3",
-        ]
-        
-        for selector in name_selectors:
+        for selector in names:
             try:
                 name_elem = element.find_element(By.CSS_SELECTOR, selector)
                 name_text = name_elem.text.strip()
                 if name_text and len(name_text) > 3 and not name_text.startswith('CA'):
                     name = name_text
+                    names.matched(selector)
                     break
             except:
-                continue
+                pass
+            names.missed(selector)
         
         # 价格 - 原价和折扣价
         price = "价格未知"
-        price_selectors = [
-            ".qa--product-tile__prices",  # 价格容器
-            ".qa--product-tile__minRange-price",  # 折扣价
-            "[class*='price']",
-        ]
-        
-        for selector in price_selectors:
+        for selector in prices:
             try:
                 price_elem = element.find_element(By.CSS_SELECTOR, selector)
                 price_text = price_elem.text.strip()
                 if price_text and 'CA$' in price_text:
                     price = price_text.replace('\n', ' ')
+                    prices.matched(selector)
                     break
             except:
-                continue
+                pass
+            prices.missed(selector)
         
         # 链接
         link = ""
@@ -241,20 +275,17 @@ class ArcOutletMonitorSelenium:
     
     def load_previous_data(self) -> Dict[str, dict]:
         """加载之前保存的数据"""
-        if os.path.exists(self.products_file):
-            try:
-                with open(self.products_file, 'r', encoding='utf-8') as f:
-                    return json.load(f)
-            except Exception as e:
-                print(f"⚠️  加载历史数据失败: {e}")
-                return {}
-        return {}
+        try:
+            # 文件损坏时自动从上一个版本恢复
+            return read_json(self.products_file, {})
+        except Exception as e:
+            print(f"⚠️  加载历史数据失败: {e}")
+            return {}
     
     def save_current_data(self, products: Dict[str, dict]):
         """保存当前数据"""
         try:
-            with open(self.products_file, 'w', encoding='utf-8') as f:
-                json.dump(products, f, ensure_ascii=False, indent=2)
+            write_json(self.products_file, products)
             print(f"✓ 已保存商品数据")
         except Exception as e:
             print(f"❌ 保存数据失败: {e}")
@@ -320,15 +351,11 @@ class ArcOutletMonitorSelenium:
     
     def save_changes(self, changes: Dict):
         """保存变化记录"""
-        history = []
-        
         # 加载历史记录
-        if os.path.exists(self.history_file):
-            try:
-                with open(self.history_file, 'r', encoding='utf-8') as f:
-                    history = json.load(f)
-            except:
-                history = []
+        try:
+            history = read_json(self.history_file, [])
+        except Exception:
+            history = []
         
         # 添加新记录
         history.append(changes)
@@ -338,12 +365,10 @@ class ArcOutletMonitorSelenium:
         
         # 保存历史
         try:
-            with open(self.history_file, 'w', encoding='utf-8') as f:
-                json.dump(history, f, ensure_ascii=False, indent=2)
+            write_json(self.history_file, history)
             
             # 同时保存最新变化到单独文件
-            with open(self.changes_file, 'w', encoding='utf-8') as f:
-                json.dump(changes, f, ensure_ascii=False, indent=2)
+            write_json(self.changes_file, changes)
             
             print(f"✓ 已保存变化记录")
         except Exception as e:
@@ -410,26 +435,51 @@ class ArcOutletMonitorSelenium:
     
     def run_once(self):
         """运行一次监控"""
+        run_metrics.start_run('selenium')
+        status = 'error'
+        try:
+            status = self._run_once()
+        finally:
+            run_metrics.finish_run(status)
+    
+    def _run_once(self):
+        """运行一次监控，返回运行状态"""
         print("\n" + "=" * 60)
         print(f"开始监控 - {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
         print("=" * 60)
         
+        # 在抓取开始前读取，不把本次抓取耗时算进 poll_interval
+        poll_interval = seconds_since_mtime(self.products_file)
+        
         # 获取商品
         current_products = self.fetch_and_parse_products()
         
         if not current_products:
             print("⚠️  未能解析到任何商品")
-            return
+            return 'empty'
         
         # 加载历史数据
         previous_products = self.load_previous_data()
         
+        # 数量明显偏少（懒加载不完整）时与历史数据合并或丢弃，不覆盖商品文件
+        guarded, _ = guard_snapshot(
+            list(current_products.values()), list(previous_products.values()),
+            'selenium', self.advertised_total)
+        if guarded is None:
+            return 'rejected'
+        current_products = {p['id']: p for p in guarded}
+        
         # 检测变化
         if previous_products:
-            changes = self.compare_and_detect_changes(previous_products, current_products)
+            with run_metrics.span('diff'):
+                changes = self.compare_and_detect_changes(previous_products, current_products)
+            # 供 send_notification.py 统计端到端延迟
+            changes['poll_interval_seconds'] = poll_interval
+            changes['fetch_seconds'] = run_metrics.current().total('page_load', 'wait', 'extract')
             
             # 保存变化记录
-            self.save_changes(changes)
+            with run_metrics.span('save'):
+                self.save_changes(changes)
             
             # 生成并显示报告
             report = self.generate_report(changes)
@@ -444,9 +494,11 @@ class ArcOutletMonitorSelenium:
             print("ℹ️  这是首次运行，已保存初始数据")
         
         # 保存当前数据
-        self.save_current_data(current_products)
+        with run_metrics.span('save'):
+            self.save_current_data(current_products)
         
         print("\n✓ 监控完成")
+        return 'ok'
     
     def run_continuous(self, interval_minutes=30):
         """持续监控"""
@@ -474,6 +526,7 @@ def main():
   python monitor_selenium.py --continuous       # 持续监控（默认30分钟检查一次）
   python monitor_selenium.py --continuous -i 60 # 持续监控（每60分钟检查一次）
   python monitor_selenium.py --show-browser     # 显示浏览器窗口（调试用）
+  python monitor_selenium.py --profile cpu,mem  # 剖析本次运行（结果在 profiles/）
         """
     )
     
@@ -503,6 +556,8 @@ def main():
         help='显示浏览器窗口（调试模式）'
     )
     
+    profiling.add_profile_argument(parser)
+    
     args = parser.parse_args()
     
     monitor = ArcOutletMonitorSelenium(
@@ -513,7 +568,8 @@ def main():
     if args.continuous:
         monitor.run_continuous(interval_minutes=args.interval)
     else:
-        monitor.run_once()
+        with profiling.start_session(args.profile, 'selenium'):
+            monitor.run_once()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,326 @@
+#!/usr/bin/env python3
+"""
+__NEXT_DATA__ 定位和按需解析
+
+列表页把全部数据放在 <script id="__NEXT_DATA__"> 中，可能有好几 MB，而需要的只是其中的商品数组。
+以前先用 DOTALL 正则在整个页面上匹配，再 json.loads 整个对象，然后逐个试五个写死的路径。现在：
+- locate()：用 find 在页面中直接找到 script 标签的起止位置（str 和 bytes 都可以），不跑正则
+- extract_subtree()：沿着路径扫描 JSON 文本，跳过不需要的键和数组元素（只找括号和引号，不构造对象），
+  只对目标子树调用 json 解码
+- discover_product_path()：已知路径都不存在时才完整解析一次，找出最像商品列表的数组
+  （元素必须有名称和价格，导航菜单之类的 {title, url} 数组不算）
+- NextDataLocator：按目标记住找到商品的路径（data/next_data_path.json），之后的运行直接用它，
+  网站改版后路径失效时自动重新发现；路径还在但数组为空（例如整个类别售罄）时照常返回空列表
+
+商品字段的映射（id / name / price / link）与 monitor_json.py 以前的写法一致。
+"""
+
+import os
+import re
+import json
+import logging
+from datetime import datetime
+
+import run_metrics
+from atomic_io import read_json, write_json
+
+logger = logging.getLogger(__name__)
+
+NEXT_DATA_PATH_FILE = os.path.join('data', 'next_data_path.json')
+
+# 发现之前先试的路径
+NEXT_DATA_PATHS = [
+    ['props', 'pageProps', 'products'],
+    ['props', 'pageProps', 'productList'],
+    ['props', 'pageProps', 'items'],
+    ['props', 'pageProps', 'data', 'products'],
+    ['props', 'pageProps', 'catalog', 'products'],
+]
+
+NAME_KEYS = ('name', 'title', 'productName')
+PRICE_KEYS = ('price', 'salePrice', 'currentPrice')
+
+# 发现时最多深入的层数，以及每个数组最多检查的元素数
+DISCOVER_MAX_DEPTH = 10
+DISCOVER_MAX_ITEMS = 20
+
+_MARKER = '__NEXT_DATA__'
+_WHITESPACE = re.compile(r'[ \t\n\r]*')
+_STRING_REST = re.compile(r'[^"\\]*(?:\\.[^"\\]*)*"', re.DOTALL)
+# 跳过括号之间的内容（包括字符串，字符串里的括号不算），每次匹配到下一个括号
+_NEXT_BRACKET = re.compile(r'[^"{}\[\]]*(?:"[^"\\]*(?:\\.[^"\\]*)*"[^"{}\[\]]*)*([{}\[\]])', re.DOTALL)
+_SCALAR = re.compile(r'[^,}\]\s]+')
+_decoder = json.JSONDecoder()
+
+
+# ============================================
+# 定位和按需解析
+# ============================================
+
+def locate(html):
+    """返回 __NEXT_DATA__ 中 JSON 文本的 (起, 止) 位置，找不到返回 None"""
+    binary = isinstance(html, (bytes, bytearray))
+    marker, lt, gt, close = ((_MARKER.encode(), b'<', b'>', b'</script') if binary
+                             else (_MARKER, '<', '>', '</script'))
+    pos = html.find(marker)
+    while pos != -1:
+        tag_start = html.rfind(lt, 0, pos)
+        tag_end = html.find(gt, pos)
+        # 必须是 <script ... id="__NEXT_DATA__" ...> 标签本身，而不是脚本里引用的变量名
+        tag = html[tag_start:tag_end]
+        if binary:
+            tag = tag.decode('latin-1')
+        if tag_start != -1 and tag_end != -1 and tag[:7].lower() == '<script' and 'id=' in tag:
+            end = html.find(close, tag_end)
+            if end != -1:
+                return tag_end + 1, end
+        pos = html.find(marker, pos + 1)
+    return None
+
+
+def next_data_text(html):
+    """__NEXT_DATA__ 的 JSON 文本，找不到返回 None"""
+    span = locate(html)
+    if span is None:
+        return None
+    text = html[span[0]:span[1]]
+    return text.decode('utf-8', errors='replace') if isinstance(text, (bytes, bytearray)) else text
+
+
+def _skip_ws(text, i):
+    return _WHITESPACE.match(text, i).end()
+
+
+def _skip_string(text, i):
+    """i 指向开头的引号，返回结束引号之后的位置"""
+    match = _STRING_REST.match(text, i + 1)
+    if not match:
+        raise ValueError(f"位置 {i} 的字符串没有结束")
+    return match.end()
+
+
+def _skip_value(text, i):
+    """跳过一个值（不解码），返回之后的位置"""
+    i = _skip_ws(text, i)
+    char = text[i]
+    if char == '"':
+        return _skip_string(text, i)
+    if char in '{[':
+        depth = 0
+        while True:
+            match = _NEXT_BRACKET.match(text, i)
+            if not match:
+                raise ValueError("JSON 没有结束")
+            i = match.end()
+            depth += 1 if match.group(1) in '{[' else -1
+            if depth == 0:
+                return i
+    match = _SCALAR.match(text, i)
+    if not match:
+        raise ValueError(f"位置 {i} 无法解析")
+    return match.end()
+
+
+def _find_key(text, i, key):
+    """i 指向 '{'，返回 key 对应的值的位置"""
+    i = _skip_ws(text, i + 1)
+    while text[i] != '}':
+        end = _skip_string(text, i)
+        name = text[i + 1:end - 1]
+        if '\\' in name:
+            name = json.loads(text[i:end])
+        i = _skip_ws(text, end)
+        if text[i] != ':':
+            raise ValueError(f"位置 {i} 缺少冒号")
+        i = _skip_ws(text, i + 1)
+        if name == key:
+            return i
+        i = _skip_ws(text, _skip_value(text, i))
+        if text[i] == ',':
+            i = _skip_ws(text, i + 1)
+    raise KeyError(key)
+
+
+def _find_index(text, i, index):
+    """i 指向 '['，返回第 index 个元素的位置"""
+    i = _skip_ws(text, i + 1)
+    position = 0
+    while text[i] != ']':
+        if position == index:
+            return i
+        i = _skip_ws(text, _skip_value(text, i))
+        if text[i] == ',':
+            i = _skip_ws(text, i + 1)
+        position += 1
+    raise IndexError(index)
+
+
+def extract_subtree(text, path, start=0):
+    """只解码 path 指向的子树；路径不存在时抛出 KeyError / IndexError"""
+    i = _skip_ws(text, start)
+    for key in path:
+        if isinstance(key, int):
+            if text[i] != '[':
+                raise KeyError(key)
+            i = _find_index(text, i, key)
+        else:
+            if text[i] != '{':
+                raise KeyError(key)
+            i = _find_key(text, i, key)
+    value, _ = _decoder.raw_decode(text, i)
+    return value
+
+
+# ============================================
+# 商品路径
+# ============================================
+
+def _looks_like_product(item):
+    return (isinstance(item, dict) and any(item.get(k) for k in NAME_KEYS)
+            and any(k in item for k in PRICE_KEYS))
+
+
+def discover_product_path(data):
+    """找出最像商品列表的数组（像商品的元素最多），返回路径，找不到返回 None"""
+    best_count, best_path = 0, None
+    stack = [(data, [])]
+    while stack:
+        node, path = stack.pop()
+        if len(path) > DISCOVER_MAX_DEPTH:
+            continue
+        if isinstance(node, dict):
+            stack.extend((value, path + [key]) for key, value in node.items()
+                         if isinstance(value, (dict, list)))
+        elif isinstance(node, list) and node:
+            count = sum(1 for item in node if _looks_like_product(item))
+            if count > best_count and count * 2 >= len(node):
+                best_count, best_path = count, path
+            stack.extend((item, path + [idx]) for idx, item in enumerate(node[:DISCOVER_MAX_ITEMS])
+                         if isinstance(item, (dict, list)))
+    return best_path
+
+
+def _walk(data, path):
+    for key in path:
+        data = data[key]
+    return data
+
+
+def find_parsed(data, paths=NEXT_DATA_PATHS):
+    """在已解析的 JSON 中找商品数组：先试 paths，再自动发现；返回 (数组, 路径)
+
+    paths 中存在的数组即使为空也直接返回。
+    """
+    for path in paths:
+        try:
+            value = _walk(data, path)
+        except (KeyError, IndexError, TypeError):
+            continue
+        if isinstance(value, list):
+            return value, list(path)
+    path = discover_product_path(data)
+    if path is None:
+        return [], None
+    return _walk(data, path), path
+
+
+def find_items(text, paths=NEXT_DATA_PATHS):
+    """在 JSON 文本中找商品数组，返回 (数组, 路径)；找不到返回 ([], None)
+
+    先按 paths 的顺序按需解析，都不存在时才完整解析一次自动发现。
+    已知路径上的空数组（类别售罄）是有效结果，不会触发发现。
+    """
+    for path in paths:
+        try:
+            value = extract_subtree(text, path)
+        except (KeyError, IndexError, ValueError):
+            continue
+        if isinstance(value, list):
+            return value, list(path)
+
+    try:
+        data = json.loads(text)
+    except ValueError as e:
+        logger.warning(f"解析 __NEXT_DATA__ 失败: {e}")
+        return [], None
+    return find_parsed(data, ())
+
+
+def to_products(items, timestamp=None):
+    """把 __NEXT_DATA__ 中的商品转换为监控脚本的格式"""
+    timestamp = timestamp or datetime.now().isoformat()
+    products = []
+    for item in items:
+        if not isinstance(item, dict):
+            continue
+        product = {
+            'id': item.get('id') or item.get('productId') or item.get('sku'),
+            'name': item.get('name') or item.get('title') or item.get('productName'),
+            'price': item.get('price') or item.get('salePrice') or item.get('currentPrice'),
+            'link': item.get('url') or item.get('link') or item.get('href'),
+            'timestamp': timestamp,
+        }
+        # 确保有基本信息
+        if product['id'] or product['name']:
+            products.append(product)
+    return products
+
+
+def products_from_html(html, timestamp=None, paths=NEXT_DATA_PATHS):
+    """不记住路径的版本（离线回放等场景）"""
+    text = next_data_text(html)
+    if text is None:
+        return []
+    items, _ = find_items(text, paths)
+    return to_products(items, timestamp)
+
+
+class NextDataLocator:
+    """按目标记住商品列表在 __NEXT_DATA__ 中的路径"""
+
+    def __init__(self, target, filename=NEXT_DATA_PATH_FILE):
+        self.target = target
+        self.filename = filename
+        try:
+            self.state = read_json(filename, {})
+        except Exception as e:
+            logger.warning(f"加载 __NEXT_DATA__ 路径失败，重新发现: {e}")
+            self.state = {}
+
+    @property
+    def learned_path(self):
+        return self.state.get(self.target, {}).get('path')
+
+    def _remember(self, path, count):
+        if path != self.learned_path:
+            if self.learned_path:
+                logger.info(f"__NEXT_DATA__ 商品路径已变化: {self.learned_path} → {path}")
+            self.state[self.target] = {
+                'path': path,
+                'count': count,
+                'updated': datetime.now().isoformat(),
+            }
+            try:
+                write_json(self.filename, self.state)
+            except Exception as e:
+                logger.warning(f"保存 __NEXT_DATA__ 路径失败: {e}")
+
+    def products(self, html, timestamp=None):
+        """从页面中取出商品列表（监控脚本的格式）"""
+        text = next_data_text(html)
+        if text is None:
+            logger.warning("未找到 __NEXT_DATA__ JSON")
+            return []
+        learned = self.learned_path
+        paths = ([learned] if learned else []) + [p for p in NEXT_DATA_PATHS if p != learned]
+        items, path = find_items(text, paths)
+        if path is None:
+            # 完整页面（含 __NEXT_DATA__）已存入快照归档，可用 snapshot_archive.py export 导出
+            logger.warning("在 __NEXT_DATA__ 中未找到商品列表")
+            return []
+        if path not in paths:
+            run_metrics.current().add('next_data_discovered', 1)
+            logger.info(f"自动发现商品列表路径: {' -> '.join(map(str, path))}")
+        self._remember(path, len(items))
+        logger.info(f"✓ 在路径 {' -> '.join(map(str, path))} 找到产品列表")
+        return to_products(items, timestamp)
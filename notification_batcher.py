@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+"""
+通知摘要批处理 - 在对比和发送之间积攒变化事件
+
+大批上新时连续几次运行都会产生变化。事件先写入待发队列（data/pending_digest.json），
+等到时间窗口结束或事件数量达到上限时，合并重复事件后一次性发出摘要。
+窗口为 0 时不做积攒，每次运行直接发送（与原来的行为一致）。
+发送失败的事件留在队列中，下次运行重试。
+"""
+
+import os
+import logging
+from datetime import datetime, timedelta
+
+from atomic_io import read_json, write_json
+from change_events import (
+    EVENT_ADDED, EVENT_REMOVED, EVENT_PRICE_CHANGE,
+    iter_change_events, events_to_changes, product_key,
+)
+
+logger = logging.getLogger(__name__)
+
+PENDING_FILE = os.path.join('data', 'pending_digest.json')
+
+DEFAULT_WINDOW_MINUTES = float(os.getenv('DIGEST_WINDOW_MINUTES', '0'))
+DEFAULT_MAX_EVENTS = int(os.getenv('DIGEST_MAX_EVENTS', '50'))
+
+
+def merge_event(existing, event):
+    """合并同一商品的两个事件，返回合并结果；返回 None 表示两者抵消"""
+    if existing is None:
+        return event
+
+    old_type, new_type = existing['type'], event['type']
+
+    # 新增后又下架、下架后又上架：窗口内相互抵消
+    if {old_type, new_type} == {EVENT_ADDED, EVENT_REMOVED}:
+        return None
+
+    # 新增后又变价：仍然是新品，只是价格以最新为准
+    if old_type == EVENT_ADDED and new_type == EVENT_PRICE_CHANGE:
+        product = dict(existing['product'])
+        product['price'] = event.get('new_price') or product.get('price')
+        return {'type': EVENT_ADDED, 'product': product}
+
+    # 多次变价：保留最早的旧价和最新的新价，价格回到原点则抵消
+    if old_type == EVENT_PRICE_CHANGE and new_type == EVENT_PRICE_CHANGE:
+        if existing.get('old_price') == event.get('new_price'):
+            return None
+        return {
+            'type': EVENT_PRICE_CHANGE,
+            'product': event['product'],
+            'old_price': existing.get('old_price'),
+            'new_price': event.get('new_price'),
+        }
+
+    # 其余情况以最新事件为准
+    return event
+
+
+class DigestBatcher:
+    """持久化的通知待发队列"""
+
+    def __init__(self, filename=PENDING_FILE, window_minutes=DEFAULT_WINDOW_MINUTES,
+                 max_events=DEFAULT_MAX_EVENTS):
+        self.filename = filename
+        self.window = timedelta(minutes=window_minutes)
+        self.max_events = max_events
+        self.state = self._load()
+
+    def _load(self):
+        state = {'first_event_at': None, 'events': {}}
+        try:
+            state.update(read_json(self.filename, {}))
+        except Exception as e:
+            logger.warning(f"加载待发队列失败，将重新开始: {e}")
+        return state
+
+    def save(self):
+        """保存待发队列"""
+        try:
+            write_json(self.filename, self.state)
+        except Exception as e:
+            logger.error(f"保存待发队列失败: {e}")
+
+    def __len__(self):
+        return len(self.state['events'])
+
+    def add(self, changes, now=None):
+        """把本次的变化并入队列"""
+        now = now or datetime.now()
+        events = self.state['events']
+
+        for event in iter_change_events(changes):
+            pid = product_key(event['product'])
+            merged = merge_event(events.get(pid), event)
+            if merged is None:
+                events.pop(pid, None)
+            else:
+                events[pid] = merged
+
+        if events and not self.state['first_event_at']:
+            self.state['first_event_at'] = now.isoformat()
+        elif not events:
+            self.state['first_event_at'] = None
+
+    def ready(self, now=None):
+        """窗口已到期或事件数量达到上限时可以发送"""
+        if not self.state['events']:
+            return False
+        if not self.window or len(self) >= self.max_events:
+            return True
+        now = now or datetime.now()
+        first = datetime.fromisoformat(self.state['first_event_at'])
+        return now - first >= self.window
+
+    def pending(self):
+        """合并后的变化（monitor.py 格式），不清空队列；发送成功后再调用 flush()"""
+        return events_to_changes(self.state['events'].values())
+
+    def flush(self):
+        """取出合并后的变化（monitor.py 格式）并清空队列"""
+        changes = self.pending()
+        self.state = {'first_event_at': None, 'events': {}}
+        return changes
+
+    def retain(self, *changes):
+        """发送失败后只保留这些变化中的事件，下次运行重试（保留最早的积攒时间）"""
+        keep = {product_key(event['product']) for c in changes for event in iter_change_events(c)}
+        events = {pid: event for pid, event in self.state['events'].items() if pid in keep}
+        self.state['events'] = events
+        if not events:
+            self.state['first_event_at'] = None
@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+通知并发分发器 - 同时向所有已配置的渠道发送通知
+每个渠道有独立的截止时间和重试次数，并统计各渠道耗时
+"""
+
+import time
+import threading
+
+
+class NotificationDispatcher:
+    """并发发送通知到多个渠道"""
+
+    def __init__(self, default_timeout=30, default_retries=1, retry_backoff=1.0):
+        self.default_timeout = default_timeout
+        self.default_retries = default_retries
+        self.retry_backoff = retry_backoff
+        self.channels = []
+
+    def add_channel(self, name, send_func, timeout=None, retries=None):
+        """注册一个渠道
+
+        send_func 接受关键字参数 timeout（本次尝试可用的秒数），
+        返回 True 表示发送成功；返回 False 或抛出异常都视为失败。
+        """
+        self.channels.append({
+            'name': name,
+            'send': send_func,
+            'timeout': timeout if timeout is not None else self.default_timeout,
+            'retries': retries if retries is not None else self.default_retries,
+        })
+
+    def _run_channel(self, channel, deadline):
+        """在截止时间内发送单个渠道，失败时按退避重试"""
+        attempts = 0
+        error = None
+        start = time.monotonic()
+
+        while attempts <= channel['retries']:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                error = error or "超过截止时间"
+                break
+
+            attempts += 1
+            try:
+                if channel['send'](timeout=remaining):
+                    return {
+                        'success': True,
+                        'attempts': attempts,
+                        'latency': time.monotonic() - start,
+                        'error': None,
+                    }
+                error = "发送返回失败"
+            except Exception as e:
+                error = str(e)
+
+            # 指数退避，但不超过剩余时间
+            backoff = self.retry_backoff * (2 ** (attempts - 1))
+            if attempts <= channel['retries']:
+                time.sleep(max(0, min(backoff, deadline - time.monotonic())))
+
+        return {
+            'success': False,
+            'attempts': attempts,
+            'latency': time.monotonic() - start,
+            'error': error,
+        }
+
+    def dispatch(self):
+        """并发发送所有渠道，返回 {渠道名: 结果} 汇总"""
+        summary = {}
+        if not self.channels:
+            return summary
+
+        started = time.monotonic()
+        results = {}
+
+        def run(channel, deadline):
+            try:
+                results[channel['name']] = self._run_channel(channel, deadline)
+            except Exception as e:
+                results[channel['name']] = {
+                    'success': False,
+                    'attempts': 0,
+                    'latency': time.monotonic() - started,
+                    'error': str(e),
+                }
+
+        # 每个渠道一个守护线程：卡住的渠道到截止时间后直接放弃，不会拖住进程退出
+        # （ThreadPoolExecutor 的工作线程会在解释器退出时被等待）
+        threads = []
+        for channel in self.channels:
+            deadline = started + channel['timeout']
+            thread = threading.Thread(target=run, args=(channel, deadline),
+                                      name=f"notify-{channel['name']}", daemon=True)
+            thread.start()
+            threads.append((channel['name'], thread, deadline))
+
+        for name, thread, deadline in threads:
+            # 多留一点余量给线程收尾，真正的超时由各客户端自己的 timeout 控制
+            thread.join(max(0, deadline - time.monotonic()) + 1)
+            summary[name] = results.get(name) or {
+                'success': False,
+                'attempts': 0,
+                'latency': time.monotonic() - started,
+                'error': "超过截止时间",
+            }
+        return summary
+
+    @staticmethod
+    def print_summary(summary):
+        """打印各渠道发送结果和耗时"""
+        if not summary:
+            return
+        print("\n📨 通知发送汇总:")
+        for name, result in summary.items():
+            status = "✓" if result['success'] else "❌"
+            line = f"  {status} {name}: {result['latency'] * 1000:.0f} ms, 尝试 {result['attempts']} 次"
+            if result['error'] and not result['success']:
+                line += f" ({result['error']})"
+            print(line)
@@ -0,0 +1,254 @@
+#!/usr/bin/env python3
+"""
+通知模板 - 邮件 HTML、纯文本和 Webhook 文本的预编译模板
+
+所有模板在模块加载时编译一次，渲染时只做替换和列表拼接；
+商品名称、链接等外部数据统一经过 HTML 转义。
+"""
+
+import html
+from string import Template
+from datetime import datetime
+
+# ============================================
+# HTML 邮件
+# ============================================
+
+EMAIL_CSS = """
+body { font-family: -apple-system, BlinkMacSystemFont, 'Segoe UI', Arial, sans-serif; line-height: 1.6; color: #333; max-width: 800px; margin: 0 auto; padding: 20px; }
+.header { background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); color: white; padding: 30px; border-radius: 10px; text-align: center; margin-bottom: 30px; }
+.header h1 { margin: 0; font-size: 28px; }
+.timestamp { color: rgba(255,255,255,0.8); font-size: 14px; margin-top: 10px; }
+.section { background: #f8f9fa; border-left: 4px solid #667eea; padding: 20px; margin-bottom: 20px; border-radius: 5px; }
+.section-title { font-size: 20px; font-weight: bold; margin-bottom: 15px; color: #667eea; }
+.product { background: white; padding: 15px; margin-bottom: 15px; border-radius: 5px; box-shadow: 0 2px 4px rgba(0,0,0,0.1); }
+.product-name { font-size: 16px; font-weight: bold; color: #2c3e50; margin-bottom: 8px; }
+.product-price { color: #e74c3c; font-size: 18px; font-weight: bold; margin-bottom: 8px; }
+.product-link { display: inline-block; padding: 8px 16px; background: #667eea; color: white; text-decoration: none; border-radius: 4px; font-size: 14px; }
+.product-link:hover { background: #5568d3; }
+.footer { text-align: center; color: #7f8c8d; font-size: 12px; margin-top: 40px; padding-top: 20px; border-top: 1px solid #ecf0f1; }
+.emoji { font-size: 24px; }
+"""
+
+HTML_PAGE = Template("""<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<style>$css</style>
+</head>
+<body>
+<div class="header">
+<h1>🏔️ Arc'teryx Outlet 监控报告</h1>
+<div class="timestamp">📅 $timestamp</div>
+</div>
+$sections
+<div class="footer">
+<p>这是一封自动生成的邮件，来自 Arc'teryx Outlet 监控系统</p>
+<p>如有问题，请检查 EC2 实例日志</p>
+</div>
+</body>
+</html>
+""")
+
+HTML_SECTION = Template("""<div class="section">
+<div class="section-title"><span class="emoji">$emoji</span> $title ($count 个)</div>
+$intro$items$more</div>
+""")
+
+HTML_PRODUCT = Template("""<div class="product">
+<div class="product-name">$name</div>
+<div class="product-price">💰 $price</div>
+$stock<a href="$link" class="product-link">查看详情 →</a>
+</div>
+""")
+
+HTML_PRICE_CHANGE = Template("""<div class="product">
+<div class="product-name">$name</div>
+<div class="product-price">📉 <span style="text-decoration: line-through; color: #95a5a6;">$old_price</span> → $new_price</div>
+$stock<a href="$link" class="product-link">查看详情 →</a>
+</div>
+""")
+
+HTML_REMOVED = Template("""<div class="product"><div class="product-name">$name</div></div>
+""")
+
+HTML_MORE = Template("""<p style="color: #7f8c8d;">... 还有 $count 个商品</p>
+""")
+
+HTML_STOCK = Template("""<div style="color: #7f8c8d; font-size: 14px; margin-bottom: 8px;">📏 有货尺码: $sizes</div>
+""")
+
+HTML_REMOVED_INTRO = '<p style="color: #7f8c8d;">以下商品可能已售罄：</p>\n'
+
+
+def _esc(value, default='N/A'):
+    """转义外部数据，空值使用默认值"""
+    if value is None or value == '':
+        value = default
+    return html.escape(str(value), quote=True)
+
+
+def _html_stock(product):
+    """详情页补充的有货尺码（见 detail_crawler.py），没有时为空"""
+    sizes = (product.get('details') or {}).get('sizes')
+    return HTML_STOCK.substitute(sizes=_esc(', '.join(sizes))) if sizes else ''
+
+
+def _html_section(emoji, title, items, render, limit, intro=''):
+    shown = items if limit is None else items[:limit]
+    hidden = len(items) - len(shown)
+    return HTML_SECTION.substitute(
+        emoji=emoji,
+        title=title,
+        count=len(items),
+        intro=intro,
+        items=''.join(render(item) for item in shown),
+        more=HTML_MORE.substitute(count=hidden) if hidden > 0 else '',
+    )
+
+
+def _render_html_product(product):
+    return HTML_PRODUCT.substitute(
+        name=_esc(product.get('name')),
+        price=_esc(product.get('price')),
+        stock=_html_stock(product),
+        link=_esc(product.get('link'), '#'),
+    )
+
+
+def _render_html_price_change(change):
+    product = change['product']
+    return HTML_PRICE_CHANGE.substitute(
+        name=_esc(product.get('name')),
+        old_price=_esc(change.get('old_price')),
+        new_price=_esc(change.get('new_price')),
+        stock=_html_stock(product),
+        link=_esc(product.get('link'), '#'),
+    )
+
+
+def _render_html_removed(product):
+    return HTML_REMOVED.substitute(name=_esc(product.get('name')))
+
+
+def render_html_email(changes, limit=10, timestamp=None):
+    """渲染 HTML 邮件（monitor.py 变化格式），limit=None 表示不截断"""
+    sections = []
+    if changes.get('added'):
+        sections.append(_html_section('🆕', '新增商品', changes['added'],
+                                      _render_html_product, limit))
+    if changes.get('price_changes'):
+        sections.append(_html_section('💰', '价格变化', changes['price_changes'],
+                                      _render_html_price_change, limit))
+    if changes.get('removed'):
+        sections.append(_html_section('📦', '下架商品', changes['removed'],
+                                      _render_html_removed, limit, intro=HTML_REMOVED_INTRO))
+
+    return HTML_PAGE.substitute(
+        css=EMAIL_CSS,
+        timestamp=_esc(timestamp or datetime.now().strftime('%Y-%m-%d %H:%M:%S')),
+        sections=''.join(sections),
+    )
+
+
+# ============================================
+# 纯文本（邮件 / SNS / 通用 Webhook）
+# ============================================
+
+SEPARATOR = '=' * 50
+
+TEXT_HEADER = Template("""
+Arc'teryx Outlet 监控报告
+$separator
+
+监控时间: $timestamp
+
+📊 统计信息:
+  • 总商品数: $total_products
+  • 新商品: $new_count 🆕
+  • 价格变化: $price_changed_count 💰
+  • 已下架: $removed_count 📤
+
+""")
+
+TEXT_NEW_PRODUCT = Template("""
+$idx. $name
+   价格: $price
+   链接: $link
+""")
+
+TEXT_PRICE_CHANGE = Template("""
+$idx. $name
+   $old_price → $new_price
+   链接: $link
+""")
+
+TEXT_REMOVED = Template("""$idx. $name ($price)
+""")
+
+TEXT_FOOTER = Template("""
+$separator
+监控网址: $url
+""")
+
+
+def render_text_body(changes, url="https://outlet.arcteryx.com/ca/zh/c/mens",
+                     new_limit=15, price_limit=10, removed_limit=10):
+    """渲染纯文本正文（monitor_selenium.py 变化格式），limit=None 表示不截断"""
+    stats = changes['statistics']
+    parts = [TEXT_HEADER.substitute(separator=SEPARATOR, timestamp=changes['timestamp'], **stats)]
+
+    new_products = changes.get('new_products') or []
+    if new_products:
+        parts.append("\n🆕 新增商品:\n" + SEPARATOR + "\n")
+        shown = new_products if new_limit is None else new_products[:new_limit]
+        parts.extend(
+            TEXT_NEW_PRODUCT.substitute(idx=idx, name=p['name'], price=p['price'], link=p['link'])
+            for idx, p in enumerate(shown, 1)
+        )
+        if len(new_products) > len(shown):
+            parts.append(f"\n... 还有 {len(new_products) - len(shown)} 个新商品\n")
+
+    price_changes = changes.get('price_changes') or []
+    if price_changes:
+        parts.append("\n\n💰 价格变化:\n" + SEPARATOR + "\n")
+        shown = price_changes if price_limit is None else price_changes[:price_limit]
+        parts.extend(
+            TEXT_PRICE_CHANGE.substitute(idx=idx, name=c['name'], old_price=c['old_price'],
+                                         new_price=c['new_price'], link=c['link'])
+            for idx, c in enumerate(shown, 1)
+        )
+
+    removed = changes.get('removed_products') or []
+    if removed:
+        parts.append("\n\n📤 已下架商品:\n" + SEPARATOR + "\n")
+        shown = removed if removed_limit is None else removed[:removed_limit]
+        parts.extend(
+            TEXT_REMOVED.substitute(idx=idx, name=p['name'], price=p['price'])
+            for idx, p in enumerate(shown, 1)
+        )
+
+    parts.append(TEXT_FOOTER.substitute(separator=SEPARATOR, url=url))
+    return ''.join(parts)
+
+
+# ============================================
+# Webhook
+# ============================================
+
+def _escape_slack(text):
+    """Slack mrkdwn 只需要转义 & < >"""
+    return str(text).replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
+
+
+SLACK_PRODUCT = Template("• <$link|$name>\n  $price\n")
+
+
+def render_slack_products(products, limit=5):
+    """渲染 Slack 商品列表"""
+    shown = products if limit is None else products[:limit]
+    return ''.join(
+        SLACK_PRODUCT.substitute(link=_escape_slack(p['link']), name=_escape_slack(p['name']),
+                                 price=_escape_slack(p['price']))
+        for p in shown
+    )
@@ -0,0 +1,294 @@
+#!/usr/bin/env python3
+"""
+运行剖析 - 监控脚本的 --profile cpu|mem|browser 选项
+
+每次运行把结果写入 profiles/<时间>_<脚本>/：
+- cpu：cProfile 统计（cpu.prof，可用 snakeviz 打开）和耗时最多的函数（cpu_top.txt）
+- mem：tracemalloc 分配最多的代码位置（mem_top.txt / mem_top.json）
+- browser：CDP Performance.getMetrics 指标，以及页面加载的资源时间线，
+  导出为 Chrome trace 格式（browser_trace.json，可在 chrome://tracing 或 Perfetto 中打开）
+
+对比两次运行：python3 profiling.py compare profiles/A profiles/B
+"""
+
+import os
+import json
+import time
+import logging
+import argparse
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+PROFILES_DIR = 'profiles'
+PROFILE_MODES = ('cpu', 'mem', 'browser')
+
+# 页面导航与所有资源的时间线
+BROWSER_TIMELINE_JS = """
+return performance.getEntries().map(function (e) {
+    return {
+        name: e.name,
+        type: e.entryType,
+        start: e.startTime,
+        duration: e.duration,
+        transferSize: e.transferSize || 0,
+        initiator: e.initiatorType || ''
+    };
+});
+"""
+
+
+def add_profile_argument(parser):
+    """给入口脚本的 argparse 添加 --profile 选项"""
+    parser.add_argument(
+        '--profile',
+        type=parse_modes,
+        default=set(),
+        help='剖析模式，可用逗号组合: cpu,mem,browser（结果写入 profiles/ 目录）'
+    )
+
+
+def parse_modes(value):
+    """解析 --profile 参数"""
+    modes = {m.strip() for m in (value or '').split(',') if m.strip()}
+    unknown = modes - set(PROFILE_MODES)
+    if unknown:
+        raise argparse.ArgumentTypeError(f"未知的剖析模式: {', '.join(sorted(unknown))}（可选 {', '.join(PROFILE_MODES)}）")
+    return modes
+
+
+class ProfileSession:
+    """一次运行的剖析会话"""
+
+    def __init__(self, modes, variant, base_dir=PROFILES_DIR):
+        self.modes = set(modes)
+        self.variant = variant
+        self.output_dir = os.path.join(
+            base_dir, f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{variant}")
+        self.summary = {'variant': variant, 'modes': sorted(self.modes)}
+        self._profiler = None
+        self._start = None
+
+    @property
+    def enabled(self):
+        return bool(self.modes)
+
+    def __enter__(self):
+        if not self.enabled:
+            return self
+        os.makedirs(self.output_dir, exist_ok=True)
+        self._start = time.monotonic()
+
+        if 'mem' in self.modes:
+            import tracemalloc
+            tracemalloc.start(25)
+
+        if 'cpu' in self.modes:
+            import cProfile
+            self._profiler = cProfile.Profile()
+            self._profiler.enable()
+
+        logger.info(f"🔬 剖析已开启（{', '.join(sorted(self.modes))}），结果目录: {self.output_dir}")
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if not self.enabled:
+            return False
+
+        if self._profiler:
+            self._profiler.disable()
+            self._dump_cpu()
+
+        if 'mem' in self.modes:
+            self._dump_mem()
+
+        self.summary['wall_seconds'] = round(time.monotonic() - self._start, 3)
+        self._write_json('summary.json', self.summary)
+        logger.info(f"🔬 剖析结果已保存到 {self.output_dir}")
+        return False
+
+    def _write_json(self, name, data):
+        with open(os.path.join(self.output_dir, name), 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+
+    def _dump_cpu(self):
+        import io
+        import pstats
+
+        self._profiler.dump_stats(os.path.join(self.output_dir, 'cpu.prof'))
+
+        buffer = io.StringIO()
+        stats = pstats.Stats(self._profiler, stream=buffer)
+        stats.sort_stats('cumulative').print_stats(40)
+        with open(os.path.join(self.output_dir, 'cpu_top.txt'), 'w', encoding='utf-8') as f:
+            f.write(buffer.getvalue())
+
+        top = []
+        for (filename, line, func), (cc, nc, tt, ct, callers) in stats.stats.items():
+            top.append({'function': f"{os.path.basename(filename)}:{line}({func})",
+                        'calls': nc, 'self_seconds': round(tt, 4), 'cumulative_seconds': round(ct, 4)})
+        top.sort(key=lambda item: item['cumulative_seconds'], reverse=True)
+        self.summary['cpu'] = {'total_seconds': round(stats.total_tt, 4), 'top': top[:40]}
+
+    def _dump_mem(self):
+        import tracemalloc
+
+        snapshot = tracemalloc.take_snapshot()
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        snapshot = snapshot.filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+        ))
+        stats = snapshot.statistics('lineno')[:30]
+
+        top = [{'site': str(stat.traceback[0]), 'size_bytes': stat.size, 'count': stat.count}
+               for stat in stats]
+        with open(os.path.join(self.output_dir, 'mem_top.txt'), 'w', encoding='utf-8') as f:
+            f.write(f"当前 {current / 1024:.1f} KiB，峰值 {peak / 1024:.1f} KiB\n\n")
+            for item in top:
+                f.write(f"{item['size_bytes'] / 1024:>10.1f} KiB  {item['count']:>7}  {item['site']}\n")
+        self._write_json('mem_top.json', top)
+        self.summary['mem'] = {'current_bytes': current, 'peak_bytes': peak, 'top': top}
+
+    def capture_browser(self, driver, label='page'):
+        """页面加载后采集浏览器性能指标和资源时间线"""
+        if 'browser' not in self.modes:
+            return
+
+        metrics = {}
+        try:
+            driver.execute_cdp_cmd('Performance.enable', {})
+            result = driver.execute_cdp_cmd('Performance.getMetrics', {})
+            metrics = {m['name']: m['value'] for m in result.get('metrics', [])}
+        except Exception as e:
+            logger.warning(f"获取 CDP 性能指标失败: {e}")
+
+        timeline = []
+        try:
+            timeline = driver.execute_script(BROWSER_TIMELINE_JS) or []
+        except Exception as e:
+            logger.warning(f"获取资源时间线失败: {e}")
+
+        # Chrome trace 格式：每个资源一个完整事件（ph=X，单位微秒）
+        trace_events = [{
+            'name': entry['name'][-120:],
+            'cat': entry['type'],
+            'ph': 'X',
+            'ts': int(entry['start'] * 1000),
+            'dur': int(entry['duration'] * 1000),
+            'pid': 1,
+            'tid': entry['initiator'] or entry['type'],
+            'args': {'transferSize': entry['transferSize']},
+        } for entry in timeline]
+
+        self._write_json(f'browser_metrics_{label}.json', metrics)
+        self._write_json(f'browser_trace_{label}.json', {'traceEvents': trace_events})
+        self.summary.setdefault('browser', {})[label] = {
+            'metrics': metrics,
+            'resources': len(timeline),
+            'transfer_bytes': sum(entry['transferSize'] for entry in timeline),
+        }
+
+
+_current = ProfileSession((), 'none')
+
+
+def start_session(modes, variant):
+    """根据 --profile 参数创建会话（未开启时返回一个空会话）"""
+    global _current
+    _current = ProfileSession(modes, variant)
+    return _current
+
+
+def capture_browser(driver, label='page'):
+    """在当前会话中采集浏览器性能数据"""
+    _current.capture_browser(driver, label)
+
+
+# ============================================
+# 对比两次运行
+# ============================================
+
+def _load_summary(path):
+    with open(os.path.join(path, 'summary.json'), 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def _delta(a, b):
+    if a is None or b is None:
+        return ''
+    diff = b - a
+    pct = f" ({diff / a * 100:+.0f}%)" if a else ''
+    return f"{diff:+.3f}{pct}"
+
+
+def compare(path_a, path_b, limit=15):
+    """打印两次运行的剖析差异"""
+    a, b = _load_summary(path_a), _load_summary(path_b)
+    print(f"A: {path_a}\nB: {path_b}\n")
+    print(f"总耗时: {a.get('wall_seconds')}s → {b.get('wall_seconds')}s  {_delta(a.get('wall_seconds'), b.get('wall_seconds'))}")
+
+    if 'cpu' in a and 'cpu' in b:
+        print("\n⏱️  CPU（累计耗时变化最大的函数）")
+        cum_a = {item['function']: item['cumulative_seconds'] for item in a['cpu']['top']}
+        cum_b = {item['function']: item['cumulative_seconds'] for item in b['cpu']['top']}
+        names = sorted(set(cum_a) | set(cum_b),
+                       key=lambda n: abs(cum_b.get(n, 0) - cum_a.get(n, 0)), reverse=True)
+        for name in names[:limit]:
+            print(f"  {cum_a.get(name, 0):>9.3f}s → {cum_b.get(name, 0):>9.3f}s  {name}")
+
+    if 'mem' in a and 'mem' in b:
+        print("\n🧠 内存")
+        print(f"  峰值: {a['mem']['peak_bytes'] / 1024:.0f} KiB → {b['mem']['peak_bytes'] / 1024:.0f} KiB")
+        size_a = {item['site']: item['size_bytes'] for item in a['mem']['top']}
+        size_b = {item['site']: item['size_bytes'] for item in b['mem']['top']}
+        sites = sorted(set(size_a) | set(size_b),
+                       key=lambda s: abs(size_b.get(s, 0) - size_a.get(s, 0)), reverse=True)
+        for site in sites[:limit]:
+            print(f"  {size_a.get(site, 0) / 1024:>9.1f} → {size_b.get(site, 0) / 1024:>9.1f} KiB  {site}")
+
+    if 'browser' in a and 'browser' in b:
+        print("\n🌐 浏览器")
+        for label in sorted(set(a['browser']) & set(b['browser'])):
+            page_a, page_b = a['browser'][label], b['browser'][label]
+            print(f"  [{label}] 资源数 {page_a['resources']} → {page_b['resources']}，"
+                  f"传输 {page_a['transfer_bytes'] / 1024:.0f} → {page_b['transfer_bytes'] / 1024:.0f} KiB")
+            for key in ('TaskDuration', 'ScriptDuration', 'LayoutDuration', 'RecalcStyleDuration',
+                        'JSHeapUsedSize', 'Nodes', 'Documents'):
+                va, vb = page_a['metrics'].get(key), page_b['metrics'].get(key)
+                if va is not None or vb is not None:
+                    print(f"    {key:<22} {va} → {vb}  {_delta(va, vb)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='剖析结果查看工具')
+    sub = parser.add_subparsers(dest='command')
+
+    sub.add_parser('list', help='列出已有的剖析结果')
+
+    compare_parser = sub.add_parser('compare', help='对比两次运行')
+    compare_parser.add_argument('run_a')
+    compare_parser.add_argument('run_b')
+    compare_parser.add_argument('-n', type=int, default=15, help='每项最多显示几行')
+
+    args = parser.parse_args()
+
+    if args.command == 'compare':
+        compare(args.run_a, args.run_b, args.n)
+    elif args.command == 'list':
+        if not os.path.isdir(PROFILES_DIR):
+            print("还没有剖析结果")
+            return
+        for name in sorted(os.listdir(PROFILES_DIR)):
+            path = os.path.join(PROFILES_DIR, name)
+            if os.path.exists(os.path.join(path, 'summary.json')):
+                summary = _load_summary(path)
+                print(f"{path}  {','.join(summary.get('modes', []))}  {summary.get('wall_seconds')}s")
+    else:
+        parser.print_help()
+
+
+if __name__ == "__main__":
+    main()
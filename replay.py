@@ -0,0 +1,366 @@
+#!/usr/bin/env python3
+"""
+回放模式 - 不启动浏览器，对录制的页面快照重新跑一遍解析、对比、存储和通知渲染
+
+输入目录下的文件按时间顺序处理：
+- .html / .htm：离线解析商品卡片（与 monitor.py 在浏览器中使用的选择器一致），
+  没有卡片时再尝试 __NEXT_DATA__ 中的商品列表
+- .json：monitor.py 的 baseline 格式（{'products': [...]}）、商品列表或 __NEXT_DATA__
+- 以上文件都可以是 .gz / .zst 压缩的
+- 快照归档目录（data/snapshots，见 snapshot_archive.py）：按 index.jsonl 中的时间回放
+
+时间取文件名中的 YYYYmmdd_HHMMSS，其次 JSON 中的 timestamp 字段，最后用文件修改时间。
+解析可以用多个进程并行（--jobs），对比按时间顺序串行进行。
+
+输出到 --output 目录（默认 data/replay）：
+- baseline.json：最后一个快照的商品
+- history.json：每个有变化的快照一条记录（monitor_selenium.py 的历史格式）
+- notifications/：--render 时渲染的 HTML 邮件和纯文本正文
+
+用法：
+    python3 replay.py data/snapshots --jobs 4 --render
+    python3 replay.py snapshots/ --ledger               # 经过通知去重账本，验证抑制效果
+    python3 replay.py snapshots/ --backfill data/history.json
+"""
+
+import os
+import re
+import json
+import time
+import logging
+from datetime import datetime
+from html.parser import HTMLParser
+from urllib.parse import urljoin
+
+from atomic_io import read_json, write_json
+from change_events import has_changes
+from next_data import find_parsed, products_from_html, to_products
+from snapshot_archive import SnapshotArchive, read_object
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_OUTPUT = os.path.join('data', 'replay')
+DEFAULT_BASE_URL = 'https://outlet.arcteryx.com/ca/zh/c/mens'
+SNAPSHOT_SUFFIXES = ('.html', '.htm', '.json')
+
+COMPRESSED_SUFFIX = re.compile(r'\.(gz|zst)$')
+TIMESTAMP_PATTERN = re.compile(r'(\d{8})[_T-]?(\d{6})')
+
+VOID_TAGS = {'area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input', 'link',
+             'meta', 'source', 'track', 'wbr'}
+
+
+# ============================================
+# 离线解析
+# ============================================
+
+class TileParser(HTMLParser):
+    """从列表页 HTML 中提取商品卡片：链接、名称（.product-tile-name 或图片 alt）和价格"""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.tiles = []
+        self.depth = 0
+        self._tile = None
+        self._tile_depth = None
+        self._capture = None
+        self._capture_depth = None
+
+    def _new_tile(self):
+        self._tile = {'link': None, 'name': [], 'price': [], 'alt': None}
+        self.tiles.append(self._tile)
+
+    def handle_starttag(self, tag, attrs):
+        attrs = dict(attrs)
+        classes = attrs.get('class') or ''
+        if tag not in VOID_TAGS:
+            self.depth += 1
+
+        if tag == 'div' and ('qa--grid-product-tile' in classes
+                             or attrs.get('data-testid') == 'product-card'):
+            self._new_tile()
+            self._tile_depth = self.depth
+        elif tag == 'a' and '/shop/mens/' in (attrs.get('href') or ''):
+            # 没有卡片容器的页面：每个商品链接单独算一个
+            if self._tile_depth is None:
+                self._new_tile()
+            if not self._tile['link']:
+                self._tile['link'] = attrs['href']
+        elif self._tile is not None:
+            if tag == 'img' and not self._tile['alt']:
+                self._tile['alt'] = attrs.get('alt')
+            elif self._capture is None and 'product-tile-name' in classes:
+                self._capture, self._capture_depth = 'name', self.depth
+            elif self._capture is None and 'qa--product-tile__prices' in classes:
+                self._capture, self._capture_depth = 'price', self.depth
+
+    def handle_endtag(self, tag):
+        if tag in VOID_TAGS:
+            return
+        if self._capture and self.depth <= self._capture_depth:
+            self._capture = None
+        if self._tile_depth is not None and self.depth <= self._tile_depth:
+            self._tile_depth = None
+            self._tile = None
+        self.depth -= 1
+
+    def handle_data(self, data):
+        if self._capture and data.strip():
+            self._tile[self._capture].append(data.strip())
+
+
+def parse_html_products(html, base_url=DEFAULT_BASE_URL, timestamp=None):
+    """离线解析列表页 HTML，返回 monitor.py 格式的商品列表"""
+    parser = TileParser()
+    parser.feed(html)
+    parser.close()
+
+    products = []
+    seen = set()
+    for tile in parser.tiles:
+        if not tile['link']:
+            continue
+        link = urljoin(base_url, tile['link'])
+        if link in seen:
+            continue
+        seen.add(link)
+        product_id = link.rstrip('/').split('/')[-1]
+        price = ' '.join(tile['price'])
+        products.append({
+            'id': product_id,
+            'name': ' '.join(tile['name']) or tile['alt'] or product_id,
+            'price': price or None,
+            'link': link,
+            'timestamp': timestamp,
+        })
+
+    if not products:
+        products = products_from_html(html, timestamp)
+    return products
+
+
+def parse_json_products(data, timestamp=None):
+    """从 baseline / 商品列表 / __NEXT_DATA__ JSON 中取出商品"""
+    if isinstance(data, dict) and isinstance(data.get('products'), list):
+        return data['products']
+    if isinstance(data, list):
+        return data
+
+    items, _ = find_parsed(data)
+    return to_products(items, timestamp)
+
+
+def snapshot_time(path, data=None):
+    """快照时间：文件名 > JSON timestamp 字段 > 修改时间"""
+    match = TIMESTAMP_PATTERN.search(os.path.basename(path))
+    if match:
+        try:
+            return datetime.strptime(''.join(match.groups()), '%Y%m%d%H%M%S')
+        except ValueError:
+            pass
+    if isinstance(data, dict) and data.get('timestamp'):
+        try:
+            return datetime.fromisoformat(data['timestamp'])
+        except (TypeError, ValueError):
+            pass
+    return datetime.fromtimestamp(os.path.getmtime(path))
+
+
+def parse_snapshot(item, base_url=DEFAULT_BASE_URL):
+    """解析一个快照（在子进程中运行）
+
+    item 为 (文件路径, 时间)，时间为 None 时从文件推断。
+    返回 (path, 时间 ISO 字符串, 商品列表, 错误)。
+    """
+    path, timestamp = item
+    try:
+        text = read_object(path)
+        if COMPRESSED_SUFFIX.sub('', path).endswith('.json'):
+            data = json.loads(text)
+            timestamp = timestamp or snapshot_time(path, data).isoformat()
+            products = parse_json_products(data, timestamp)
+        else:
+            timestamp = timestamp or snapshot_time(path).isoformat()
+            products = parse_html_products(text, base_url, timestamp)
+        return path, timestamp, products, None
+    except Exception as e:
+        return path, None, [], f"{type(e).__name__}: {e}"
+
+
+def find_snapshots(paths):
+    """展开目录，返回 [(文件路径, 时间或 None)]
+
+    快照归档目录（含 index.jsonl）按索引展开，时间取自索引。
+    """
+    items = []
+    files = []
+    for path in paths:
+        if os.path.isfile(os.path.join(path, 'index.jsonl')):
+            archive = SnapshotArchive(path)
+            items.extend((os.path.join(path, r['path']), r['timestamp']) for r in archive.records())
+        elif os.path.isdir(path):
+            for root, _, names in os.walk(path):
+                files.extend(os.path.join(root, name) for name in names)
+        else:
+            files.append(path)
+    items.extend((f, None) for f in sorted(files)
+                 if COMPRESSED_SUFFIX.sub('', f).endswith(SNAPSHOT_SUFFIXES))
+    return items
+
+
+def parse_all(items, jobs=1, base_url=DEFAULT_BASE_URL):
+    """解析全部快照，jobs > 1 时用进程池并行，返回按时间排序的结果"""
+    if jobs > 1 and len(items) > 1:
+        from concurrent.futures import ProcessPoolExecutor
+        from functools import partial
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            results = list(pool.map(partial(parse_snapshot, base_url=base_url), items,
+                                    chunksize=max(1, len(items) // (jobs * 4))))
+    else:
+        results = [parse_snapshot(item, base_url) for item in items]
+
+    for path, _, _, error in results:
+        if error:
+            logger.warning(f"跳过 {path}: {error}")
+    return sorted((r for r in results if not r[3]), key=lambda r: r[1])
+
+
+# ============================================
+# 对比、存储和渲染
+# ============================================
+
+def to_history_record(changes, timestamp, total_products):
+    """把 monitor.py 的变化格式转换为 monitor_selenium.py 的历史记录格式"""
+    return {
+        'timestamp': timestamp,
+        'new_products': changes['added'],
+        'removed_products': changes['removed'],
+        'price_changes': [{
+            'name': c['product'].get('name'),
+            'old_price': c['old_price'],
+            'new_price': c['new_price'],
+            'link': c['product'].get('link'),
+        } for c in changes['price_changes']],
+        'statistics': {
+            'total_products': total_products,
+            'new_count': len(changes['added']),
+            'removed_count': len(changes['removed']),
+            'price_changed_count': len(changes['price_changes']),
+        },
+    }
+
+
+def render_notifications(changes, record, output_dir):
+    """渲染 HTML 邮件和纯文本正文（不发送）"""
+    from notification_templates import render_html_email, render_text_body
+
+    stamp = datetime.fromisoformat(record['timestamp']).strftime('%Y%m%d_%H%M%S')
+    directory = os.path.join(output_dir, 'notifications')
+    os.makedirs(directory, exist_ok=True)
+    with open(os.path.join(directory, f"{stamp}.html"), 'w', encoding='utf-8') as f:
+        f.write(render_html_email(changes, timestamp=record['timestamp']))
+    with open(os.path.join(directory, f"{stamp}.txt"), 'w', encoding='utf-8') as f:
+        f.write(render_text_body(record))
+
+
+def replay(snapshots, output_dir=DEFAULT_OUTPUT, render=False, use_ledger=False):
+    """按时间顺序对比解析好的快照，返回历史记录列表"""
+    from monitor_core import compare_products, save_data
+
+    os.makedirs(output_dir, exist_ok=True)
+    ledger = None
+    if use_ledger:
+        from alert_ledger import NotificationLedger
+        ledger_file = os.path.join(output_dir, 'notification_ledger.json')
+        if os.path.exists(ledger_file):
+            os.remove(ledger_file)
+        ledger = NotificationLedger(filename=ledger_file)
+
+    history = []
+    previous = None
+    for path, timestamp, products, _ in snapshots:
+        if not products:
+            logger.warning(f"{path} 中没有商品，跳过")
+            continue
+        if previous is None:
+            previous = products
+            continue
+
+        changes = compare_products(previous, products)
+        previous = products
+        if ledger:
+            now = datetime.fromisoformat(timestamp)
+            changes = ledger.filter_changes(changes, products, now=now)
+            # 回放中视为全部发送成功
+            ledger.record_sent(changes, now=now)
+        if not has_changes(changes):
+            continue
+
+        record = to_history_record(changes, timestamp, len(products))
+        record['source'] = path
+        history.append(record)
+        if render:
+            render_notifications(changes, record, output_dir)
+
+    if ledger:
+        ledger.save()
+    if previous is not None:
+        save_data(previous, os.path.join(output_dir, 'baseline.json'))
+    with open(os.path.join(output_dir, 'history.json'), 'w', encoding='utf-8') as f:
+        json.dump(history, f, ensure_ascii=False, indent=2)
+    return history
+
+
+def backfill_history(records, filename):
+    """把回放得到的记录合并进已有的历史文件（按时间去重、排序）"""
+    existing = read_json(filename, [])
+
+    merged = {r['timestamp']: r for r in existing}
+    added = 0
+    for record in records:
+        if record['timestamp'] not in merged:
+            record = {k: v for k, v in record.items() if k != 'source'}
+            merged[record['timestamp']] = record
+            added += 1
+
+    write_json(filename, [merged[k] for k in sorted(merged)])
+    return added
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description='离线回放录制的页面快照')
+    parser.add_argument('paths', nargs='+', help='快照文件或目录')
+    parser.add_argument('-o', '--output', default=DEFAULT_OUTPUT, help='输出目录')
+    parser.add_argument('-j', '--jobs', type=int, default=1, help='并行解析的进程数')
+    parser.add_argument('--base-url', default=DEFAULT_BASE_URL, help='解析相对链接用的页面地址')
+    parser.add_argument('--render', action='store_true', help='渲染每次变化的通知内容')
+    parser.add_argument('--ledger', action='store_true', help='经过通知去重账本（使用快照时间）')
+    parser.add_argument('--backfill', metavar='HISTORY', help='把变化记录合并进历史文件')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    files = find_snapshots(args.paths)
+    if not files:
+        parser.error('没有找到快照文件')
+
+    started = time.perf_counter()
+    snapshots = parse_all(files, args.jobs, args.base_url)
+    parsed = time.perf_counter()
+    history = replay(snapshots, args.output, render=args.render, use_ledger=args.ledger)
+    finished = time.perf_counter()
+
+    print(f"快照: {len(snapshots)}/{len(files)}，有变化: {len(history)}")
+    print(f"解析: {parsed - started:.2f}s（{len(files) / max(parsed - started, 1e-9):.0f} 个/秒，"
+          f"{args.jobs} 进程）  对比和存储: {finished - parsed:.2f}s")
+    print(f"结果: {args.output}")
+
+    if args.backfill:
+        added = backfill_history(history, args.backfill)
+        print(f"已向 {args.backfill} 补充 {added} 条记录")
+
+
+if __name__ == "__main__":
+    main()
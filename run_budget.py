@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+"""
+运行时间预算 - 整次运行的截止时间，按阶段分配
+
+以前各处的超时各自为政（页面加载 90 秒、WebDriverWait 20 秒、固定的 sleep、SMTP 没有超时），
+一次运行可能持续好几分钟，和下一次 cron 撞在一起。现在每次运行有一个总截止时间，
+按比例分给各阶段（启动、抓取、提取、保存、补充详情、通知）：
+- 进入阶段时按剩余时间和之后阶段的比例分配，前面阶段省下的时间自动留给后面
+- budget.timeout(默认值) 把各处的超时限制在本阶段剩余时间内
+- budget.sleep() / budget.has_time() 让可选的步骤（等待渲染、滚动、重试、补充详情）在时间不够时降级跳过
+
+用法与 run_metrics 相同，在 main() 中 start() 后通过 current() 取得：
+    budget = run_budget.start()
+    with budget.phase('fetch'):
+        driver.set_page_load_timeout(budget.timeout(90))
+        budget.sleep(20)
+
+配置（环境变量）：
+- RUN_DEADLINE_SECONDS：整次运行的时间上限，默认 600
+- RUN_PHASE_BUDGETS：各阶段的比例，例如 "fetch=0.5,notify=0.2"，未写的阶段使用默认值
+"""
+
+import os
+import time
+import logging
+from contextlib import contextmanager
+
+import run_metrics
+
+logger = logging.getLogger(__name__)
+
+RUN_DEADLINE_SECONDS = float(os.getenv('RUN_DEADLINE_SECONDS', '600'))
+
+# 阶段按执行顺序排列
+DEFAULT_SHARES = {
+    'startup': 0.15,
+    'fetch': 0.40,
+    'extract': 0.10,
+    'save': 0.05,
+    'enrich': 0.10,
+    'notify': 0.20,
+}
+
+
+def parse_shares(text):
+    """解析 "fetch=0.5,notify=0.2" 形式的阶段比例"""
+    shares = dict(DEFAULT_SHARES)
+    for item in (text or '').split(','):
+        if '=' not in item:
+            continue
+        name, value = item.split('=', 1)
+        try:
+            shares[name.strip()] = float(value)
+        except ValueError:
+            logger.warning(f"忽略无效的阶段比例: {item}")
+    return shares
+
+
+class RunBudget:
+    """一次运行的时间预算"""
+
+    def __init__(self, deadline_seconds=RUN_DEADLINE_SECONDS, shares=None):
+        self.total = deadline_seconds
+        self.shares = shares or parse_shares(os.getenv('RUN_PHASE_BUDGETS'))
+        self._start = time.monotonic()
+        self._deadline = self._start + deadline_seconds
+        self._phase = None
+        self._phase_deadline = self._deadline
+        self._started_phases = set()
+
+    @property
+    def current_phase(self):
+        return self._phase
+
+    def remaining(self):
+        """整次运行剩余的秒数"""
+        return self._deadline - time.monotonic()
+
+    def phase_remaining(self):
+        """当前阶段剩余的秒数（不在任何阶段中时为整次运行剩余）"""
+        return min(self._phase_deadline, self._deadline) - time.monotonic()
+
+    def _allot(self, name):
+        """按剩余时间和之后各阶段的比例分配本阶段的时间"""
+        remaining = max(0.0, self.remaining())
+        if name not in self.shares:
+            return remaining
+        pending = [n for n in self.shares if n not in self._started_phases or n == name]
+        weight = sum(self.shares[n] for n in pending)
+        return remaining * self.shares[name] / weight if weight else remaining
+
+    @contextmanager
+    def phase(self, name):
+        """进入一个阶段，结束时记录是否超出分配的时间"""
+        allotted = self._allot(name)
+        self._started_phases.add(name)
+        previous = (self._phase, self._phase_deadline)
+        started = time.monotonic()
+        self._phase, self._phase_deadline = name, started + allotted
+        try:
+            yield self
+        finally:
+            used = time.monotonic() - started
+            self._phase, self._phase_deadline = previous
+            if used > allotted + 1:
+                run_metrics.current().set('budget_overrun_seconds', round(used - allotted, 1), phase=name)
+                logger.warning(f"⏳ 阶段 {name} 用时 {used:.0f}s，超出预算 {allotted:.0f}s")
+
+    def timeout(self, default, minimum=1.0):
+        """把一个超时限制在本阶段剩余时间内，至少 minimum 秒"""
+        return max(minimum, min(default, self.phase_remaining()))
+
+    def has_time(self, seconds):
+        """本阶段是否还有 seconds 秒"""
+        return self.phase_remaining() >= seconds
+
+    def degrade(self, step, reason='时间预算不足'):
+        """记录一次降级"""
+        run_metrics.current().add('budget_degraded', 1, phase=self._phase or 'run', step=step)
+        logger.warning(f"⏳ {reason}，跳过 {step}（阶段 {self._phase or 'run'}，"
+                       f"剩余 {max(0.0, self.phase_remaining()):.0f}s）")
+
+    def sleep(self, seconds, step='wait'):
+        """等待 seconds 秒，但不超过本阶段剩余时间"""
+        available = max(0.0, self.phase_remaining())
+        if available < seconds:
+            self.degrade(step, reason=f"等待 {seconds:g}s 超出预算，缩短为 {available:.0f}s")
+        time.sleep(min(seconds, available))
+
+
+class _Unlimited(RunBudget):
+    """未调用 start() 时使用：没有时间限制"""
+
+    def __init__(self):
+        super().__init__(float('inf'), shares={})
+
+
+_current = _Unlimited()
+
+
+def start(deadline_seconds=RUN_DEADLINE_SECONDS, shares=None):
+    """开始一次运行的时间预算"""
+    global _current
+    _current = RunBudget(deadline_seconds, shares)
+    run_metrics.current().set('run_deadline_seconds', deadline_seconds)
+    return _current
+
+
+def current():
+    """当前运行的时间预算"""
+    return _current
+
+
+def finish():
+    """结束当前运行的时间预算"""
+    global _current
+    budget = _current
+    _current = _Unlimited()
+    return budget
@@ -0,0 +1,349 @@
+#!/usr/bin/env python3
+"""
+运行计时与指标导出
+
+每个监控脚本在 main() 中调用 start_run()，用 span() 包住各个阶段
+（启动浏览器、driver.get、等待、提取、对比、保存、通知），结束时 finish_run()：
+- 追加一行 JSON 到 logs/run_metrics.jsonl
+- 设置了 METRICS_TEXTFILE 时写出 Prometheus 文本格式（node_exporter textfile collector），
+  每个脚本一个文件（METRICS_TEXTFILE=.../arcmon.prom 时写 .../arcmon_<脚本>.prom），
+  紧接着运行的 send_notification.py 不会覆盖 monitor.py 的指标
+
+也可以用 `python3 run_metrics.py serve --port 9108` 把最近一次的指标以 HTTP 暴露给 Prometheus。
+"""
+
+import os
+import json
+import time
+import logging
+from contextlib import contextmanager
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+METRICS_LOG = os.path.join('logs', 'run_metrics.jsonl')
+METRICS_TEXTFILE = os.getenv('METRICS_TEXTFILE', '')
+METRIC_PREFIX = 'arcmon'
+
+
+def process_tree_rss(root_pids):
+    """通过 /proc 统计一个或多个进程树（包括所有子孙进程）的 RSS 字节数，非 Linux 返回 None
+
+    多棵树有重叠时每个进程只计一次。
+    """
+    if isinstance(root_pids, int):
+        root_pids = [root_pids]
+    root_pids = [pid for pid in root_pids or () if pid]
+    if not root_pids or not os.path.isdir('/proc'):
+        return None
+
+    children = {}
+    rss_pages = {}
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f'/proc/{entry}/stat', 'r') as f:
+                stat = f.read()
+            # comm 字段可能包含空格，从最后一个 ')' 之后开始切分
+            fields = stat[stat.rindex(')') + 2:].split()
+            ppid = int(fields[1])
+            rss_pages[int(entry)] = int(fields[21])
+            children.setdefault(ppid, []).append(int(entry))
+        except (OSError, ValueError, IndexError):
+            continue
+
+    stack = [pid for pid in root_pids if pid in rss_pages]
+    if not stack:
+        return None
+
+    page_size = os.sysconf('SC_PAGE_SIZE')
+    total = 0
+    seen = set()
+    while stack:
+        pid = stack.pop()
+        if pid in seen:
+            continue
+        seen.add(pid)
+        total += rss_pages.get(pid, 0) * page_size
+        stack.extend(children.get(pid, []))
+    return total
+
+
+def driver_pids(driver):
+    """WebDriver 对应的进程号：chromedriver 和 Chrome 浏览器
+
+    undetected_chromedriver 直接启动 Chrome（driver.browser_pid），浏览器不是 chromedriver 的子进程，
+    两棵进程树都要统计。
+    """
+    pids = []
+    try:
+        pids.append(driver.service.process.pid)
+    except Exception:
+        pass
+    browser_pid = getattr(driver, 'browser_pid', None)
+    if browser_pid and browser_pid not in pids:
+        pids.append(browser_pid)
+    return pids
+
+
+# 页面及其所有资源实际传输的字节数
+BYTES_FETCHED_JS = (
+    "return performance.getEntries()"
+    ".reduce(function (sum, e) { return sum + (e.transferSize || 0); }, 0);"
+)
+
+
+def textfile_path(variant, textfile=METRICS_TEXTFILE):
+    """某个脚本的 Prometheus 文本文件路径：arcmon.prom → arcmon_<脚本>.prom"""
+    base, ext = os.path.splitext(textfile)
+    return f'{base}_{variant}{ext or ".prom"}'
+
+
+def merge_prometheus(texts):
+    """合并多个脚本的文本文件，同一指标的 TYPE 行只保留一次，样本放在一起"""
+    types = {}
+    samples = {}
+    for text in texts:
+        for line in text.splitlines():
+            if line.startswith('# TYPE '):
+                name = line.split()[2]
+                types.setdefault(name, line)
+                samples.setdefault(name, [])
+            elif line and not line.startswith('#'):
+                name = line.split('{', 1)[0].split(' ', 1)[0]
+                samples.setdefault(name, []).append(line)
+    lines = []
+    for name, family in samples.items():
+        if name in types:
+            lines.append(types[name])
+        lines.extend(family)
+    return '\n'.join(lines) + '\n' if lines else ''
+
+
+class RunMetrics:
+    """一次运行的计时和指标"""
+
+    def __init__(self, variant):
+        self.variant = variant
+        self.started_at = datetime.now()
+        self._start = time.monotonic()
+        self.spans = {}
+        self.values = {}
+        self.status = 'running'
+
+    @contextmanager
+    def span(self, name):
+        """计时一个阶段，同名阶段多次出现时累加"""
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.spans[name] = self.spans.get(name, 0.0) + time.monotonic() - start
+
+    def set(self, name, value, **labels):
+        """记录一个数值指标，可带标签（例如 channel='email'）"""
+        key = (name, tuple(sorted(labels.items())))
+        self.values[key] = value
+
+    def add(self, name, value, **labels):
+        """累加一个数值指标"""
+        key = (name, tuple(sorted(labels.items())))
+        self.values[key] = self.values.get(key, 0) + value
+
+    def peak(self, name, value, **labels):
+        """只保留最大值（例如内存峰值）"""
+        if value is None:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        self.values[key] = max(self.values.get(key, 0), value)
+
+    def total(self, *names):
+        """几个阶段的总耗时"""
+        return round(sum(self.spans.get(name, 0.0) for name in names), 3)
+
+    def sample_chrome_rss(self, driver):
+        """采样浏览器进程树内存并记录峰值"""
+        rss = process_tree_rss(driver_pids(driver))
+        self.peak('chrome_rss_bytes', rss)
+        return rss
+
+    def sample_page(self, driver):
+        """页面加载后采样传输字节数和浏览器内存"""
+        try:
+            self.add('bytes_fetched', int(driver.execute_script(BYTES_FETCHED_JS) or 0))
+        except Exception as e:
+            logger.debug(f"获取传输字节数失败: {e}")
+        self.sample_chrome_rss(driver)
+
+    def record(self):
+        """生成本次运行的 JSON 记录"""
+        values = {}
+        for (name, labels), value in self.values.items():
+            if labels:
+                values.setdefault(name, {})[','.join(f'{k}={v}' for k, v in labels)] = value
+            else:
+                values[name] = value
+        return {
+            'variant': self.variant,
+            'started_at': self.started_at.isoformat(),
+            'status': self.status,
+            'duration_seconds': round(time.monotonic() - self._start, 3),
+            'phases': {name: round(seconds, 3) for name, seconds in self.spans.items()},
+            'values': values,
+        }
+
+    def to_prometheus(self, record):
+        """转换为 Prometheus 文本格式"""
+        variant = f'variant="{self.variant}"'
+        lines = [
+            f'# TYPE {METRIC_PREFIX}_run_duration_seconds gauge',
+            f'{METRIC_PREFIX}_run_duration_seconds{{{variant}}} {record["duration_seconds"]}',
+            f'# TYPE {METRIC_PREFIX}_run_success gauge',
+            f'{METRIC_PREFIX}_run_success{{{variant}}} {1 if record["status"] == "ok" else 0}',
+            f'# TYPE {METRIC_PREFIX}_last_run_timestamp_seconds gauge',
+            f'{METRIC_PREFIX}_last_run_timestamp_seconds{{{variant}}} {int(time.time())}',
+            f'# TYPE {METRIC_PREFIX}_phase_duration_seconds gauge',
+        ]
+        for phase, seconds in record['phases'].items():
+            lines.append(f'{METRIC_PREFIX}_phase_duration_seconds{{{variant},phase="{phase}"}} {seconds}')
+
+        for (name, labels), value in sorted(self.values.items()):
+            if value is None:
+                continue
+            label_text = ''.join(f',{k}="{v}"' for k, v in labels)
+            lines.append(f'{METRIC_PREFIX}_{name}{{{variant}{label_text}}} {value}')
+        return '\n'.join(lines) + '\n'
+
+    def finish(self, status='ok'):
+        """写出 JSON 记录和 Prometheus 文本文件"""
+        self.status = status
+        record = self.record()
+
+        try:
+            os.makedirs(os.path.dirname(METRICS_LOG), exist_ok=True)
+            with open(METRICS_LOG, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(record, ensure_ascii=False) + '\n')
+        except Exception as e:
+            logger.warning(f"写入运行指标失败: {e}")
+
+        if METRICS_TEXTFILE:
+            try:
+                # textfile collector 要求原子替换，避免读到写了一半的文件
+                textfile = textfile_path(self.variant)
+                tmp_file = textfile + '.tmp'
+                with open(tmp_file, 'w', encoding='utf-8') as f:
+                    f.write(self.to_prometheus(record))
+                os.replace(tmp_file, textfile)
+                # 以前所有脚本共用的文件：与新文件中的序列重复，node_exporter 会报错
+                if os.path.exists(METRICS_TEXTFILE):
+                    os.remove(METRICS_TEXTFILE)
+            except Exception as e:
+                logger.warning(f"写入 Prometheus 指标失败: {e}")
+
+        phases = ', '.join(f'{name} {seconds:.1f}s' for name, seconds in record['phases'].items())
+        logger.info(f"⏱️  本次运行 {record['duration_seconds']:.1f}s（{phases}）")
+        return record
+
+
+class _NullMetrics(RunMetrics):
+    """未调用 start_run() 时使用，不写任何文件"""
+
+    def finish(self, status='ok'):
+        return self.record()
+
+
+_current = _NullMetrics('none')
+
+
+def start_run(variant):
+    """开始记录一次运行"""
+    global _current
+    _current = RunMetrics(variant)
+    return _current
+
+
+def current():
+    """当前运行的指标对象"""
+    return _current
+
+
+def span(name):
+    """计时当前运行的一个阶段"""
+    return _current.span(name)
+
+
+def finish_run(status='ok'):
+    """结束当前运行并导出指标"""
+    global _current
+    record = _current.finish(status)
+    _current = _NullMetrics('none')
+    return record
+
+
+def serve(port, textfile):
+    """以 HTTP 暴露各脚本的 Prometheus 文本文件（合并为一份）"""
+    import glob
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+
+    pattern = textfile_path('*', textfile)
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path != '/metrics':
+                self.send_error(404)
+                return
+            texts = []
+            for path in sorted(glob.glob(pattern)):
+                try:
+                    with open(path, 'r', encoding='utf-8') as f:
+                        texts.append(f.read())
+                except OSError:
+                    continue
+            body = merge_prometheus(texts).encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    print(f"Prometheus 指标: http://0.0.0.0:{port}/metrics （读取 {pattern}）")
+    HTTPServer(('0.0.0.0', port), Handler).serve_forever()
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description='运行指标工具')
+    sub = parser.add_subparsers(dest='command')
+
+    serve_parser = sub.add_parser('serve', help='以 HTTP 暴露 Prometheus 指标')
+    serve_parser.add_argument('--port', type=int, default=9108)
+    serve_parser.add_argument('--textfile', default=METRICS_TEXTFILE or 'logs/arcmon.prom')
+
+    show_parser = sub.add_parser('show', help='显示最近几次运行的阶段耗时')
+    show_parser.add_argument('-n', type=int, default=10)
+
+    args = parser.parse_args()
+
+    if args.command == 'serve':
+        serve(args.port, args.textfile)
+    elif args.command == 'show':
+        if not os.path.exists(METRICS_LOG):
+            print("还没有运行记录")
+            return
+        with open(METRICS_LOG, 'r', encoding='utf-8') as f:
+            records = [json.loads(line) for line in f if line.strip()][-args.n:]
+        for record in records:
+            phases = ', '.join(f'{k} {v:.1f}s' for k, v in record['phases'].items())
+            print(f"{record['started_at']}  {record['variant']:<10} {record['status']:<6} "
+                  f"{record['duration_seconds']:>6.1f}s  {phases}")
+    else:
+        parser.print_help()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+学习到的 CSS 选择器缓存
+
+monitor_optimized.py 的 parse_products 和 monitor_selenium.py 的 fetch_and_parse_products
+每次运行都按顺序尝试一串选择器；解析每个商品时名称和价格也逐个尝试，
+每次没匹配上都是一次 WebDriver 往返。页面结构很少变化，所以记住每个目标上匹配成功的选择器：
+- 下次运行先试记住的选择器，匹配就不再尝试其余的；其余选择器保持手写的优先顺序
+- 记住的选择器不再匹配时自动回退到完整列表，并记住新匹配的选择器（重新学习）
+
+不按本次运行的命中次数重新排序：个别商品缺少 .price 时会让更宽泛的 [class*="price"] 命中，
+如果把它提到前面，后面所有商品都会取到原价和折扣价的外层容器，价格文字变化导致误报变价。
+
+状态保存在 data/selector_cache.json，按 目标 URL → 用途（如 optimized.name）记录。
+
+用法：
+    cache = SelectorCache()
+    names = cache.strategy(url, 'optimized.name', NAME_SELECTORS)
+    for selector in names:
+        ...
+        if matched:
+            names.matched(selector)
+            break
+        names.missed(selector)
+    cache.save()
+"""
+
+import os
+import logging
+from collections import Counter
+from datetime import datetime
+
+import run_metrics
+from atomic_io import read_json, write_json
+
+logger = logging.getLogger(__name__)
+
+SELECTOR_CACHE_FILE = os.path.join('data', 'selector_cache.json')
+SELECTOR_CACHE_ENABLED = os.getenv('SELECTOR_CACHE', '1') != '0'
+
+
+class SelectorStrategy:
+    """一组候选选择器的尝试顺序：记住的在前，其余保持原始顺序"""
+
+    def __init__(self, role, candidates, learned=None):
+        self.role = role
+        self.candidates = list(candidates)
+        self.learned = learned if learned in self.candidates else None
+        self.hits = Counter()
+        self.misses = 0
+
+    def __iter__(self):
+        if not self.learned:
+            return iter(self.candidates)
+        return iter([self.learned] + [s for s in self.candidates if s != self.learned])
+
+    def matched(self, selector):
+        self.hits[selector] += 1
+
+    def missed(self, selector):
+        self.misses += 1
+
+    def best(self):
+        """本次运行应当记住的选择器：记住的仍然匹配时保留它，否则取匹配最多的；没有匹配返回 None"""
+        if self.learned and self.hits[self.learned]:
+            return self.learned
+        return self.hits.most_common(1)[0][0] if self.hits else None
+
+
+class SelectorCache:
+    """按目标记录匹配成功的选择器"""
+
+    def __init__(self, filename=SELECTOR_CACHE_FILE, enabled=SELECTOR_CACHE_ENABLED):
+        self.filename = filename
+        self.enabled = enabled
+        self.strategies = {}
+        self.state = {}
+        if enabled:
+            try:
+                self.state = read_json(filename, {})
+            except Exception as e:
+                logger.warning(f"加载选择器缓存失败，重新学习: {e}")
+
+    def strategy(self, target, role, candidates):
+        """取得某个用途的选择器尝试顺序（同一次运行中同一用途返回同一个对象）"""
+        key = (target, role)
+        if key not in self.strategies:
+            learned = self.state.get(target, {}).get(role, {}).get('selector') if self.enabled else None
+            self.strategies[key] = SelectorStrategy(role, candidates, learned)
+        return self.strategies[key]
+
+    def save(self):
+        """记住本次匹配的选择器，记录未命中的尝试次数"""
+        metrics = run_metrics.current()
+        changed = False
+        for (target, role), strategy in self.strategies.items():
+            if strategy.misses:
+                metrics.add('selector_misses', strategy.misses, role=role)
+            best = strategy.best()
+            # 本次什么都没匹配时保留原来记住的选择器（多半是页面没加载出来）
+            if not best:
+                continue
+            if strategy.learned and best != strategy.learned:
+                logger.info(f"选择器 {role} 已变化，重新学习: {strategy.learned} → {best}")
+                metrics.add('selector_relearned', 1, role=role)
+            elif not strategy.learned:
+                logger.info(f"学习到选择器 {role}: {best}")
+            self.state.setdefault(target, {})[role] = {
+                'selector': best,
+                'hits': strategy.hits[best],
+                'updated': datetime.now().isoformat(),
+            }
+            changed = True
+
+        if self.enabled and changed:
+            try:
+                write_json(self.filename, self.state)
+            except Exception as e:
+                logger.warning(f"保存选择器缓存失败: {e}")
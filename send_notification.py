@@ -10,8 +10,13 @@ from email.mime.multipart import MIMEMultipart
 import json
 import os
 import sys
-import requests
-from datetime import datetime
+from datetime import datetime, timedelta
+
+from notification_dispatcher import NotificationDispatcher
+from notification_templates import render_text_body, render_slack_products
+import run_metrics
+import run_budget
+from alert_latency import LatencyTracker
 
 
 class NotificationSender:
@@ -41,53 +46,10 @@ class NotificationSender:
     
     def generate_email_body(self):
         """生成邮件正文"""
-        stats = self.changes['statistics']
-        
-        body = f"""
-Arc'teryx Outlet 监控报告
-{'=' * 50}
-
-监控时间: {self.changes['timestamp']}
-
-📊 统计信息:
-  • 总商品数: {stats['total_products']}
-  • 新商品: {stats['new_count']} 🆕
-  • 价格变化: {stats['price_changed_count']} 💰
-  • 已下架: {stats['removed_count']} 📤
-
-"""
-        
-        # 新商品
-        if self.changes.get('new_products'):
-            body += "\n🆕 新增商品:\n" + "=" * 50 + "\n"
-            for idx, product in enumerate(self.changes['new_products'][:15], 1):
-                body += f"\n{idx}. {product['name']}\n"
-                body += f"   价格: {product['price']}\n"
-                body += f"   链接: {product['link']}\n"
-            
-            if len(self.changes['new_products']) > 15:
-                body += f"\n... 还有 {len(self.changes['new_products']) - 15} 个新商品\n"
-        
-        # 价格变化
-        if self.changes.get('price_changes'):
-            body += "\n\n💰 价格变化:\n" + "=" * 50 + "\n"
-            for idx, change in enumerate(self.changes['price_changes'][:10], 1):
-                body += f"\n{idx}. {change['name']}\n"
-                body += f"   {change['old_price']} → {change['new_price']}\n"
-                body += f"   链接: {change['link']}\n"
-        
-        # 下架商品
-        if self.changes.get('removed_products'):
-            body += "\n\n📤 已下架商品:\n" + "=" * 50 + "\n"
-            for idx, product in enumerate(self.changes['removed_products'][:10], 1):
-                body += f"{idx}. {product['name']} ({product['price']})\n"
-        
-        body += "\n" + "=" * 50 + "\n"
-        body += "监控网址: https://outlet.arcteryx.com/ca/zh/c/mens\n"
-        
-        return body
+        return render_text_body(self.changes)
     
-    def send_email(self, sender_email, sender_password, receiver_email):
+    def send_email(self, sender_email, sender_password, receiver_email,
+                   smtp_server=None, smtp_port=None, timeout=30):
         """发送邮件通知"""
         if not self.has_changes():
             print("ℹ️  没有变化，跳过邮件通知")
@@ -115,9 +77,14 @@ Arc'teryx Outlet 监控报告
             
             # 发送邮件
             print("正在发送邮件...")
-            server = smtplib.SMTP('smtp.gmail.com', 587)
-            server.starttls()
-            server.login(sender_email, sender_password)
+            smtp_server = smtp_server or os.getenv('SMTP_SERVER', 'smtp.gmail.com')
+            smtp_port = smtp_port or int(os.getenv('SMTP_PORT', '587'))
+            server = smtplib.SMTP(smtp_server, smtp_port, timeout=run_budget.current().timeout(timeout))
+            # 本地测试用的 SMTP 替身通常不支持 STARTTLS
+            if os.getenv('SMTP_STARTTLS', '1') != '0':
+                server.starttls()
+            if sender_password:
+                server.login(sender_email, sender_password)
             server.send_message(msg)
             server.quit()
             
@@ -128,7 +95,7 @@ Arc'teryx Outlet 监控报告
             print(f"❌ 邮件发送失败: {e}")
             return False
     
-    def send_webhook(self, webhook_url, webhook_type="slack"):
+    def send_webhook(self, webhook_url, webhook_type="slack", timeout=10):
         """发送 Webhook 通知（Slack/Discord/企业微信）"""
         if not self.has_changes():
             print("ℹ️  没有变化，跳过 Webhook 通知")
@@ -163,9 +130,7 @@ Arc'teryx Outlet 监控报告
                 
                 # 添加新商品详情
                 if self.changes.get('new_products'):
-                    products_text = ""
-                    for product in self.changes['new_products'][:5]:
-                        products_text += f"• <{product['link']}|{product['name']}>\n  {product['price']}\n"
+                    products_text = render_slack_products(self.changes['new_products'])
                     
                     message["blocks"].append({
                         "type": "section",
@@ -215,9 +180,12 @@ Arc'teryx Outlet 监控报告
                     "text": self.generate_email_body()
                 }
             
-            # 发送 Webhook
+            # 发送 Webhook（按需导入 requests，只发邮件时不加载）
+            import requests
+            
             print(f"正在发送 {webhook_type} Webhook...")
-            response = requests.post(webhook_url, json=message, timeout=10)
+            response = requests.post(webhook_url, json=message,
+                                     timeout=run_budget.current().timeout(timeout))
             response.raise_for_status()
             
             print(f"✓ Webhook 通知发送成功")
@@ -227,7 +195,7 @@ Arc'teryx Outlet 监控报告
             print(f"❌ Webhook 发送失败: {e}")
             return False
     
-    def send_aws_sns(self, topic_arn, region='us-east-1'):
+    def send_aws_sns(self, topic_arn, region='us-east-1', timeout=None):
         """发送 AWS SNS 通知"""
         if not self.has_changes():
             print("ℹ️  没有变化，跳过 SNS 通知")
@@ -235,8 +203,13 @@ Arc'teryx Outlet 监控报告
         
         try:
             import boto3
+            from botocore.config import Config
             
-            sns = boto3.client('sns', region_name=region)
+            config = None
+            if timeout:
+                config = Config(connect_timeout=timeout, read_timeout=timeout,
+                                retries={'max_attempts': 1})
+            sns = boto3.client('sns', region_name=region, config=config)
             
             stats = self.changes['statistics']
             subject = f"Arc'teryx Outlet 更新 - {stats['new_count']}个新商品"
@@ -269,6 +242,10 @@ def main():
     parser.add_argument('--sns', type=str, help='AWS SNS Topic ARN')
     parser.add_argument('--changes-file', type=str, default='data/changes.json',
                        help='变化文件路径')
+    parser.add_argument('--timeout', type=float, default=30,
+                       help='每个渠道的截止时间（秒），默认30秒')
+    parser.add_argument('--retries', type=int, default=1,
+                       help='每个渠道失败后的重试次数，默认1次')
     
     args = parser.parse_args()
     
@@ -278,7 +255,9 @@ def main():
         print("❌ 无法加载变化数据")
         sys.exit(1)
     
-    success = False
+    # 所有渠道并发发送，互不阻塞
+    dispatcher = NotificationDispatcher(default_timeout=args.timeout,
+                                        default_retries=args.retries)
     
     # 邮件通知
     if args.email:
@@ -289,16 +268,48 @@ def main():
         if not sender_email or not sender_password:
             print("❌ 请设置环境变量: SENDER_EMAIL, SENDER_PASSWORD")
         else:
-            success = sender.send_email(sender_email, sender_password, receiver_email) or success
+            dispatcher.add_channel('email', lambda timeout: sender.send_email(
+                sender_email, sender_password, receiver_email, timeout=timeout))
     
     # Webhook 通知
     if args.webhook:
-        success = sender.send_webhook(args.webhook, args.webhook_type) or success
+        dispatcher.add_channel(f'webhook:{args.webhook_type}', lambda timeout: sender.send_webhook(
+            args.webhook, args.webhook_type, timeout=timeout))
     
     # SNS 通知
     if args.sns:
         region = os.getenv('AWS_REGION', 'us-east-1')
-        success = sender.send_aws_sns(args.sns, region) or success
+        dispatcher.add_channel('sns', lambda timeout: sender.send_aws_sns(
+            args.sns, region, timeout=timeout))
+    
+    # 没有变化时不分发：各渠道会返回 False，分发器会把它当成失败重试并记为 error
+    if dispatcher.channels and not sender.has_changes():
+        print("ℹ️  没有变化，跳过通知")
+        sys.exit(0)
+    
+    metrics = run_metrics.start_run('notify')
+    dispatch_started = datetime.now()
+    with run_metrics.span('notify'):
+        summary = dispatcher.dispatch()
+    dispatcher.print_summary(summary)
+    success = any(result['success'] for result in summary.values())
+    for name, result in summary.items():
+        metrics.set('notification_latency_seconds', round(result['latency'], 3), channel=name)
+        metrics.set('notification_success', int(result['success']), channel=name)
+    if summary:
+        run_metrics.finish_run('ok' if success else 'error')
+    
+    # 记录每个渠道的送达时间，用于统计端到端延迟
+    tracker = LatencyTracker()
+    tracker.observe(sender.changes,
+                    observed_at=datetime.fromisoformat(sender.changes['timestamp']),
+                    poll_interval=sender.changes.get('poll_interval_seconds'),
+                    fetch_seconds=sender.changes.get('fetch_seconds'))
+    for name, result in summary.items():
+        if result['success']:
+            tracker.delivered(sender.changes, name,
+                              delivered_at=dispatch_started + timedelta(seconds=result['latency']))
+    tracker.save()
     
     # 如果没有指定任何通知方式，显示帮助
     if not any([args.email, args.webhook, args.sns]):
@@ -45,6 +45,11 @@ else
 fi
 echo ""
 
+# 预先准备打过补丁的 chromedriver（之后每次运行直接复用，无需联网）
+echo "准备 chromedriver..."
+python3 driver_cache.py warm || echo "⚠️  chromedriver 准备失败，首次运行时会自动重试"
+echo ""
+
 # 创建必要的目录
 echo "创建数据目录..."
 mkdir -p data
@@ -0,0 +1,294 @@
+#!/usr/bin/env python3
+"""
+原始页面快照归档 - 按内容寻址、压缩、去重
+
+每次抓取的页面源码都存一份，供 replay.py 回放和排查解析问题，代替以前覆盖写的
+page_source.html / next_data_debug.json：
+- 对象按原始内容的 sha256 命名，内容相同的页面只存一份
+- 安装了 zstandard 时用 zstd 压缩，否则用 gzip
+- index.jsonl 每次抓取一行：时间、目标 URL、脚本、对象哈希、原始和压缩后大小
+- 保留策略：超过保留天数或总大小上限时删除最旧的记录和不再被引用的对象
+- 归档和保留策略都持有 index.lock 上的文件锁，重叠运行的监控脚本（cron 重叠、monitor 和 replay）
+  不会丢掉对方刚追加的索引行，也不会删掉对方正在写入的对象
+
+目录结构：
+    data/snapshots/index.jsonl
+    data/snapshots/index.lock
+    data/snapshots/objects/ab/abcdef....html.zst
+
+配置（环境变量）：
+- SNAPSHOT_ARCHIVE：设为 0 关闭
+- SNAPSHOT_DIR：归档目录，默认 data/snapshots
+- SNAPSHOT_KEEP_DAYS：保留天数，默认 30
+- SNAPSHOT_MAX_MB：压缩后的总大小上限，默认 200
+"""
+
+import os
+import json
+import gzip
+import hashlib
+import logging
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_ARCHIVE = os.getenv('SNAPSHOT_ARCHIVE', '1') != '0'
+SNAPSHOT_DIR = os.getenv('SNAPSHOT_DIR', os.path.join('data', 'snapshots'))
+SNAPSHOT_KEEP_DAYS = float(os.getenv('SNAPSHOT_KEEP_DAYS', '30'))
+SNAPSHOT_MAX_MB = float(os.getenv('SNAPSHOT_MAX_MB', '200'))
+
+ZSTD_LEVEL = 10
+GZIP_LEVEL = 6
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:
+    import fcntl
+except ImportError:  # Windows：没有文件锁，只能依赖不重叠运行
+    fcntl = None
+
+
+def compress(data):
+    """压缩数据，返回 (压缩后的字节, 扩展名)"""
+    if zstandard is not None:
+        return zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(data), '.zst'
+    return gzip.compress(data, compresslevel=GZIP_LEVEL, mtime=0), '.gz'
+
+
+def decompress(data, path):
+    if path.endswith('.zst'):
+        if zstandard is None:
+            raise RuntimeError(f"读取 {path} 需要安装 zstandard")
+        return zstandard.ZstdDecompressor().decompress(data)
+    if path.endswith('.gz'):
+        return gzip.decompress(data)
+    return data
+
+
+def read_object(path):
+    """读取并解压一个对象文件，返回文本"""
+    with open(path, 'rb') as f:
+        return decompress(f.read(), path).decode('utf-8', errors='replace')
+
+
+class SnapshotArchive:
+    """内容寻址的快照归档"""
+
+    def __init__(self, directory=SNAPSHOT_DIR, keep_days=SNAPSHOT_KEEP_DAYS, max_mb=SNAPSHOT_MAX_MB):
+        self.directory = directory
+        self.keep_days = keep_days
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self.index_file = os.path.join(directory, 'index.jsonl')
+        # 索引会被 os.replace 替换，锁放在单独的文件上
+        self.lock_file = os.path.join(directory, 'index.lock')
+
+    @contextmanager
+    def _locked(self):
+        """跨进程的排他锁，保护索引和对象目录"""
+        if fcntl is None:
+            yield
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        with open(self.lock_file, 'a') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _object_path(self, digest, kind, suffix):
+        return os.path.join(self.directory, 'objects', digest[:2], f"{digest}.{kind}{suffix}")
+
+    def _find_object(self, digest, kind):
+        for suffix in ('.zst', '.gz'):
+            path = self._object_path(digest, kind, suffix)
+            if os.path.exists(path):
+                return path
+        return None
+
+    def add(self, content, target=None, variant=None, kind='html', timestamp=None):
+        """归档一份内容，返回索引记录；内容已存在时只追加索引"""
+        data = content.encode('utf-8') if isinstance(content, str) else content
+        digest = hashlib.sha256(data).hexdigest()
+        with self._locked():
+            return self._add(data, digest, target, variant, kind, timestamp)
+
+    def _add(self, data, digest, target, variant, kind, timestamp):
+        path = self._find_object(digest, kind)
+        deduplicated = path is not None
+        if not deduplicated:
+            compressed, suffix = compress(data)
+            path = self._object_path(digest, kind, suffix)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_file = path + '.tmp'
+            with open(tmp_file, 'wb') as f:
+                f.write(compressed)
+            os.replace(tmp_file, path)
+
+        record = {
+            'timestamp': (timestamp or datetime.now()).isoformat(),
+            'target': target,
+            'variant': variant,
+            'kind': kind,
+            'sha256': digest,
+            'size': len(data),
+            'stored_size': os.path.getsize(path),
+            'path': os.path.relpath(path, self.directory),
+            'deduplicated': deduplicated,
+        }
+        with open(self.index_file, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(record, ensure_ascii=False) + '\n')
+        return record
+
+    def records(self):
+        """索引中的全部记录（按时间顺序）"""
+        if not os.path.exists(self.index_file):
+            return []
+        records = []
+        with open(self.index_file, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    records.append(json.loads(line))
+                except ValueError:
+                    continue
+        return sorted(records, key=lambda r: r['timestamp'])
+
+    def read(self, record):
+        return read_object(os.path.join(self.directory, record['path']))
+
+    def apply_retention(self, now=None):
+        """删除过期记录，超过大小上限时继续删除最旧的记录，再清理没有引用的对象"""
+        with self._locked():
+            return self._apply_retention(now)
+
+    def _apply_retention(self, now):
+        records = self.records()
+        if not records:
+            return 0
+
+        cutoff = ((now or datetime.now()) - timedelta(days=self.keep_days)).isoformat()
+        kept = [r for r in records if r['timestamp'] >= cutoff]
+
+        # 每个对象只计一次大小
+        sizes = {r['path']: r['stored_size'] for r in kept}
+        total = sum(sizes.values())
+        while kept and total > self.max_bytes:
+            oldest = kept.pop(0)
+            if not any(r['path'] == oldest['path'] for r in kept):
+                total -= sizes.pop(oldest['path'])
+
+        removed = len(records) - len(kept)
+        if removed:
+            tmp_file = self.index_file + '.tmp'
+            with open(tmp_file, 'w', encoding='utf-8') as f:
+                for record in kept:
+                    f.write(json.dumps(record, ensure_ascii=False) + '\n')
+            os.replace(tmp_file, self.index_file)
+
+        referenced = {os.path.join(self.directory, r['path']) for r in kept}
+        objects_dir = os.path.join(self.directory, 'objects')
+        for root, _, names in os.walk(objects_dir):
+            for name in names:
+                path = os.path.join(root, name)
+                # .tmp 是正在写入的对象（没有锁的平台上可能来自另一个进程）
+                if name.endswith('.tmp'):
+                    continue
+                if path not in referenced:
+                    os.remove(path)
+        return removed
+
+    def summary(self):
+        records = self.records()
+        objects = {r['path']: r for r in records}
+        raw = sum(r['size'] for r in records)
+        stored = sum(r['stored_size'] for r in objects.values())
+        return {
+            'records': len(records),
+            'objects': len(objects),
+            'raw_bytes': raw,
+            'stored_bytes': stored,
+            'first': records[0]['timestamp'] if records else None,
+            'last': records[-1]['timestamp'] if records else None,
+        }
+
+
+def archive_page(content, variant, target=None, kind='html'):
+    """监控脚本调用：归档一次抓取的内容并执行保留策略，失败只记录警告"""
+    if not SNAPSHOT_ARCHIVE or not content:
+        return None
+    try:
+        archive = SnapshotArchive()
+        os.makedirs(archive.directory, exist_ok=True)
+        record = archive.add(content, target=target, variant=variant, kind=kind)
+        archive.apply_retention()
+        logger.info(f"页面快照已归档 {record['sha256'][:12]}"
+                    f"（{record['size'] / 1024:.0f} KB → {record['stored_size'] / 1024:.0f} KB"
+                    f"{'，与之前相同' if record['deduplicated'] else ''}）")
+        return record
+    except Exception as e:
+        logger.warning(f"归档页面快照失败: {e}")
+        return None
+
+
+def archive_driver(driver, variant):
+    """归档浏览器当前页面的源码"""
+    if not SNAPSHOT_ARCHIVE:
+        return None
+    try:
+        content, target = driver.page_source, driver.current_url
+    except Exception as e:
+        logger.warning(f"读取页面源码失败: {e}")
+        return None
+    return archive_page(content, variant, target=target)
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description='原始页面快照归档')
+    sub = parser.add_subparsers(dest='command')
+    sub.add_parser('stats', help='归档概况')
+    list_parser = sub.add_parser('list', help='列出最近的快照')
+    list_parser.add_argument('-n', type=int, default=20)
+    export_parser = sub.add_parser('export', help='解压快照到目录（文件名带时间，可直接交给 replay.py）')
+    export_parser.add_argument('dest')
+    export_parser.add_argument('--since', help='只导出此时间之后的快照（ISO 格式）')
+    sub.add_parser('prune', help='立即执行保留策略')
+    args = parser.parse_args()
+
+    archive = SnapshotArchive()
+    if args.command == 'stats':
+        summary = archive.summary()
+        ratio = summary['stored_bytes'] / summary['raw_bytes'] if summary['raw_bytes'] else 0
+        print(f"快照: {summary['records']}，对象: {summary['objects']}（{summary['first']} ~ {summary['last']}）")
+        print(f"原始 {summary['raw_bytes'] / 1024 / 1024:.1f} MB → 存储 {summary['stored_bytes'] / 1024 / 1024:.1f} MB"
+              f"（{ratio:.1%}），上限 {archive.max_bytes / 1024 / 1024:.0f} MB，保留 {archive.keep_days:g} 天")
+        print(f"压缩: {'zstd' if zstandard is not None else 'gzip'}")
+    elif args.command == 'list':
+        for record in archive.records()[-args.n:]:
+            print(f"{record['timestamp'][:19]}  {record['variant'] or '-':<10} {record['sha256'][:12]}  "
+                  f"{record['size'] / 1024:>6.0f} KB  {record['target'] or ''}")
+    elif args.command == 'export':
+        os.makedirs(args.dest, exist_ok=True)
+        count = 0
+        for record in archive.records():
+            if args.since and record['timestamp'] < args.since:
+                continue
+            stamp = datetime.fromisoformat(record['timestamp']).strftime('%Y%m%d_%H%M%S')
+            name = f"{stamp}_{record['variant'] or 'page'}_{record['sha256'][:8]}.{record['kind']}"
+            with open(os.path.join(args.dest, name), 'w', encoding='utf-8') as f:
+                f.write(archive.read(record))
+            count += 1
+        print(f"已导出 {count} 个快照到 {args.dest}")
+    elif args.command == 'prune':
+        print(f"删除了 {archive.apply_retention()} 条记录")
+    else:
+        parser.print_help()
+
+
+if __name__ == "__main__":
+    main()
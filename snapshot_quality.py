@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+"""
+抓取结果质量检查 - 防止懒加载不完整的结果覆盖基准
+
+懒加载只渲染出 36 个卡片中的 12 个时，如果直接覆盖 baseline.json，下一次运行会把其余 24 个
+报告为"新品"，通知随之泛滥。保存前先检查本次的商品数量：
+- 与最近正常运行的商品数量分布比较（中位数和 MAD）
+- 与页面标明的商品总数比较（__NEXT_DATA__ 中的 totalCount 或"N 件商品"之类的文字）
+
+数量明显偏少时视为不完整：
+- merge（默认）：与上次的基准合并，缺失的商品保留原样，不报告为下架，可见商品的新增和变价照常处理
+- reject：丢弃本次结果，不对比也不保存
+
+连续多次都偏少且数量接近时，认为商品确实减少了，接受新的数量水平。
+
+配置（环境变量）：
+- SNAPSHOT_MIN_RATIO：低于期望数量的多少比例视为不完整，默认 0.7
+- SNAPSHOT_ACTION：merge 或 reject，默认 merge
+- SNAPSHOT_CONFIRM_RUNS：连续多少次偏少后接受新水平，默认 3
+"""
+
+import os
+import re
+import logging
+import statistics
+from datetime import datetime
+
+import run_metrics
+from atomic_io import read_json, write_json
+from change_events import product_key
+
+logger = logging.getLogger(__name__)
+
+QUALITY_FILE = os.path.join('data', 'snapshot_quality.json')
+SNAPSHOT_MIN_RATIO = float(os.getenv('SNAPSHOT_MIN_RATIO', '0.7'))
+SNAPSHOT_ACTION = os.getenv('SNAPSHOT_ACTION', 'merge')
+SNAPSHOT_CONFIRM_RUNS = int(os.getenv('SNAPSHOT_CONFIRM_RUNS', '3'))
+
+HISTORY_SIZE = 30
+MIN_HISTORY = 3
+
+ACTION_ACCEPT = 'accept'
+ACTION_MERGE = 'merge'
+ACTION_REJECT = 'reject'
+
+TOTAL_JSON_PATTERN = re.compile(
+    r'"(?:totalCount|totalResults|total_count|numFound|productCount|totalProducts|totalHits)"\s*:\s*(\d+)')
+TOTAL_TEXT_PATTERN = re.compile(
+    r'(\d+)\s*(?:件商品|个商品|款商品|个结果|项结果|(?:items|products|results)\b)', re.I)
+
+
+def advertised_total(*texts):
+    """从 __NEXT_DATA__ 或页面文字中找出标明的商品总数，找不到返回 None"""
+    for text in texts:
+        if not text:
+            continue
+        match = TOTAL_JSON_PATTERN.search(text) or TOTAL_TEXT_PATTERN.search(text)
+        if match:
+            return int(match.group(1))
+    return None
+
+
+ADVERTISED_TOTAL_SCRIPT = """
+var nextData = document.getElementById('__NEXT_DATA__');
+return [nextData ? nextData.textContent : '', document.body ? document.body.innerText.slice(0, 20000) : ''];
+"""
+
+
+def advertised_total_from_driver(driver):
+    """浏览器当前页面标明的商品总数"""
+    try:
+        next_data, text = driver.execute_script(ADVERTISED_TOTAL_SCRIPT)
+    except Exception as e:
+        logger.debug(f"读取商品总数失败: {e}")
+        return None
+    return advertised_total(next_data, text)
+
+
+def merge_products(current, previous):
+    """本次抓到的商品为准，补上上次有、本次缺失的商品"""
+    seen = {product_key(p) for p in current}
+    return list(current) + [p for p in previous if product_key(p) not in seen]
+
+
+class SnapshotQualityGate:
+    """按脚本记录正常运行的商品数量，判断本次结果是否完整"""
+
+    def __init__(self, variant, filename=QUALITY_FILE, min_ratio=SNAPSHOT_MIN_RATIO,
+                 action=SNAPSHOT_ACTION, confirm_runs=SNAPSHOT_CONFIRM_RUNS):
+        self.variant = variant
+        self.filename = filename
+        self.min_ratio = min_ratio
+        self.action = action if action in (ACTION_MERGE, ACTION_REJECT) else ACTION_MERGE
+        self.confirm_runs = max(1, confirm_runs)
+        self.state = self._load()
+        self.entry = self.state.setdefault(variant, {'counts': [], 'suspicious': []})
+
+    def _load(self):
+        try:
+            return read_json(self.filename, {})
+        except Exception as e:
+            logger.warning(f"加载数量历史失败，重新开始: {e}")
+            return {}
+
+    def save(self):
+        try:
+            write_json(self.filename, self.state)
+        except Exception as e:
+            logger.error(f"保存数量历史失败: {e}")
+
+    def threshold(self, previous_count=None):
+        """最低可接受的商品数量，没有参考时返回 None
+
+        取 min_ratio × 中位数 与 中位数 - 3 × 标准差估计 中较低的一个，
+        商品数量本来就波动较大时不会误判。
+        """
+        counts = self.entry['counts']
+        if len(counts) >= MIN_HISTORY:
+            median = statistics.median(counts)
+            mad = statistics.median(abs(c - median) for c in counts)
+            return min(self.min_ratio * median, median - 3 * 1.4826 * mad)
+        if previous_count:
+            return self.min_ratio * previous_count
+        return None
+
+    def evaluate(self, count, previous_count=None, advertised=None):
+        """返回 (是否可疑, 原因)"""
+        if advertised and count < self.min_ratio * advertised:
+            return True, f"页面标明 {advertised} 个商品，只抓到 {count} 个"
+        threshold = self.threshold(previous_count)
+        if threshold is not None and count < threshold:
+            return True, f"抓到 {count} 个商品，低于正常水平（下限 {threshold:.0f}）"
+        return False, None
+
+    def _record(self, count):
+        self.entry['counts'] = (self.entry['counts'] + [count])[-HISTORY_SIZE:]
+        self.entry['suspicious'] = []
+        self.entry['updated'] = datetime.now().isoformat()
+
+    def _level_shift(self, count):
+        """连续多次偏少且数量接近时，认为商品确实减少了"""
+        recent = self.entry['suspicious'][-(self.confirm_runs - 1):] if self.confirm_runs > 1 else []
+        if len(recent) < self.confirm_runs - 1:
+            return False
+        values = recent + [count]
+        return max(values) - min(values) <= max(2, 0.1 * max(values))
+
+    def check(self, products, previous, advertised=None):
+        """检查本次结果，返回 (要对比和保存的商品列表, 动作)
+
+        动作为 reject 时返回的商品列表为 None，调用方应跳过对比和保存。
+        """
+        count = len(products)
+        metrics = run_metrics.current()
+        if advertised:
+            metrics.set('products_advertised', advertised)
+
+        suspicious, reason = self.evaluate(count, len(previous) if previous else None, advertised)
+        if suspicious and self._level_shift(count):
+            logger.warning(f"⚠️  连续 {self.confirm_runs} 次商品数量偏少（{reason}），接受新的数量水平")
+            self.entry['counts'] = []
+            suspicious = False
+
+        if not suspicious:
+            self._record(count)
+            self.save()
+            return products, ACTION_ACCEPT
+
+        self.entry['suspicious'] = (self.entry['suspicious'] + [count])[-self.confirm_runs:]
+        self.save()
+        metrics.add('snapshot_suspicious', 1, action=self.action)
+
+        if not previous:
+            # 没有可以合并的基准，只能先接受
+            logger.warning(f"⚠️  抓取结果可能不完整：{reason}（没有基准可合并，仍然保存）")
+            return products, ACTION_ACCEPT
+        if self.action == ACTION_REJECT:
+            logger.warning(f"⚠️  抓取结果可能不完整：{reason}，丢弃本次结果，保留原基准")
+            return None, ACTION_REJECT
+
+        merged = merge_products(products, previous)
+        logger.warning(f"⚠️  抓取结果可能不完整：{reason}，与基准合并"
+                       f"（保留 {len(merged) - count} 个本次缺失的商品）")
+        return merged, ACTION_MERGE
+
+
+def guard_snapshot(products, previous, variant, advertised=None):
+    """监控脚本在对比和保存前调用，返回 (商品列表或 None, 动作)"""
+    return SnapshotQualityGate(variant).check(products, previous, advertised)
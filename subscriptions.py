@@ -0,0 +1,277 @@
+#!/usr/bin/env python3
+"""
+多订阅者监控规则 - 把每个人的规则编译成索引，快速匹配变化事件
+
+订阅文件（默认 data/subscribers.json）格式示例：
+
+[
+  {
+    "email": "alice@example.com",
+    "keywords": ["beta", "夹克"],
+    "max_price": 400,
+    "min_discount": 0.3,
+    "categories": ["jackets"],
+    "events": ["added", "price_change"]
+  }
+]
+
+所有条件都是可选的；未填写的条件视为不限制。
+"""
+
+import os
+import re
+import json
+import bisect
+import logging
+
+from change_events import (
+    EVENT_ADDED, EVENT_REMOVED, EVENT_PRICE_CHANGE,
+    iter_change_events, events_to_changes, parse_prices, discount_ratio,
+)
+
+logger = logging.getLogger(__name__)
+
+SUBSCRIBERS_FILE = os.getenv('SUBSCRIBERS_FILE', os.path.join('data', 'subscribers.json'))
+
+ALL_EVENTS = (EVENT_ADDED, EVENT_REMOVED, EVENT_PRICE_CHANGE)
+
+# 商品类别关键词（名称中出现即归类）
+CATEGORY_KEYWORDS = {
+    'jackets': ['jacket', 'hoody', 'hoodie', 'parka', 'shell', 'coat', '夹克', '外套', '连帽', '大衣'],
+    'pants': ['pant', 'pants', 'short', 'shorts', 'bib', '裤'],
+    'tops': ['shirt', 'tee', 'top', 'polo', 'crew', 'zip neck', '衬衫', 'T恤', '上衣'],
+    'fleece': ['fleece', 'kyanite', 'delta', '抓绒'],
+    'insulated': ['atom', 'cerium', 'thorium', 'down', '羽绒', '保暖'],
+    'footwear': ['shoe', 'boot', 'sylan', 'norvan', 'kragg', '鞋'],
+    'accessories': ['hat', 'toque', 'cap', 'glove', 'belt', 'bag', 'pack', '帽', '手套', '腰带', '包'],
+}
+
+ASCII_WORD = re.compile(r'[a-z0-9]+')
+# 英文按三字母片段索引：关键词可能只是单词的一部分（"gore" 出现在 "goretex" 中）
+ASCII_GRAM = 3
+CJK_CHAR = re.compile(r'[一-鿿]')
+
+
+def _is_ascii(text):
+    return all(ord(ch) < 128 for ch in text)
+
+
+def _keyword_key(keyword):
+    """关键词在倒排索引中的键：英文取第一个单词的前三个字母，中文取前两个字
+
+    返回 None 表示无法索引（英文单词不足三个字母等），这类关键词逐个按子串检查。
+    """
+    if _is_ascii(keyword):
+        words = ASCII_WORD.findall(keyword)
+        if not words or len(words[0]) < ASCII_GRAM:
+            return None
+        return words[0][:ASCII_GRAM]
+    chars = CJK_CHAR.findall(keyword)
+    if not chars:
+        return None
+    return ''.join(chars[:2])
+
+
+def _name_grams(name):
+    """商品名称的检索单元：英文单词中的三字母片段 + 中文单字和双字"""
+    grams = set()
+    for word in ASCII_WORD.findall(name):
+        grams.update(word[i:i + ASCII_GRAM] for i in range(len(word) - ASCII_GRAM + 1))
+    chars = CJK_CHAR.findall(name)
+    grams.update(chars)
+    for i in range(len(chars) - 1):
+        grams.add(chars[i] + chars[i + 1])
+    return grams
+
+
+def product_categories(product):
+    """推断商品类别"""
+    if product.get('category'):
+        return {str(product['category']).lower()}
+
+    name = (product.get('name') or '').lower()
+    return {
+        category
+        for category, words in CATEGORY_KEYWORDS.items()
+        if any(word.lower() in name for word in words)
+    }
+
+
+def load_subscribers(filename=SUBSCRIBERS_FILE):
+    """加载订阅者列表，文件不存在时返回空列表"""
+    if not os.path.exists(filename):
+        return []
+    try:
+        with open(filename, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        return data.get('subscribers', []) if isinstance(data, dict) else data
+    except Exception as e:
+        logger.error(f"加载订阅文件失败: {e}")
+        return []
+
+
+class SubscriptionIndex:
+    """订阅规则索引
+
+    - 关键词：倒排索引，只检查商品名称命中的订阅者；无法索引的短关键词单独逐个检查
+    - 最高价 / 最低折扣：按阈值排序，用二分查找取满足条件的前缀或后缀
+    - 类别和事件类型：倒排索引
+    没有填写某个条件的订阅者放在该维度的"通配"集合中。
+    """
+
+    def __init__(self, subscribers):
+        self.subscribers = [s for s in subscribers if s.get('email')]
+        self.keyword_index = {}
+        self.keyword_wild = set()
+        self.keyword_scan = set()
+        self.category_index = {}
+        self.category_wild = set()
+        self.event_index = {event: set() for event in ALL_EVENTS}
+        self.price_wild = set()
+        self.discount_wild = set()
+
+        max_prices = []
+        min_discounts = []
+
+        for sid, sub in enumerate(self.subscribers):
+            keywords = [k.lower() for k in sub.get('keywords') or [] if k]
+            if keywords:
+                for keyword in keywords:
+                    key = _keyword_key(keyword)
+                    if key:
+                        self.keyword_index.setdefault(key, set()).add(sid)
+                    else:
+                        self.keyword_scan.add(sid)
+            else:
+                self.keyword_wild.add(sid)
+
+            categories = [c.lower() for c in sub.get('categories') or [] if c]
+            if categories:
+                for category in categories:
+                    self.category_index.setdefault(category, set()).add(sid)
+            else:
+                self.category_wild.add(sid)
+
+            for event in sub.get('events') or ALL_EVENTS:
+                if event in self.event_index:
+                    self.event_index[event].add(sid)
+
+            if sub.get('max_price') is not None:
+                max_prices.append((float(sub['max_price']), sid))
+            else:
+                self.price_wild.add(sid)
+
+            if sub.get('min_discount') is not None:
+                min_discounts.append((float(sub['min_discount']), sid))
+            else:
+                self.discount_wild.add(sid)
+
+        max_prices.sort()
+        min_discounts.sort()
+        self._max_price_keys = [p for p, _ in max_prices]
+        self._max_price_sids = [sid for _, sid in max_prices]
+        self._min_discount_keys = [d for d, _ in min_discounts]
+        self._min_discount_sids = [sid for _, sid in min_discounts]
+        self._keywords = [
+            [k.lower() for k in sub.get('keywords') or [] if k]
+            for sub in self.subscribers
+        ]
+
+    def _keyword_candidates(self, name):
+        lowered = name.lower()
+        hits = set(self.keyword_wild)
+        checked = set()
+        for gram in _name_grams(lowered):
+            checked.update(self.keyword_index.get(gram, ()))
+        checked |= self.keyword_scan
+        # 索引只按片段粗筛，这里确认完整关键词确实出现在名称中
+        for sid in checked - hits:
+            if any(k in lowered for k in self._keywords[sid]):
+                hits.add(sid)
+        return hits
+
+    def _price_candidates(self, price):
+        if price is None:
+            return set(self.price_wild)
+        start = bisect.bisect_left(self._max_price_keys, price)
+        return self.price_wild.union(self._max_price_sids[start:])
+
+    def _discount_candidates(self, discount):
+        end = bisect.bisect_right(self._min_discount_keys, discount)
+        return self.discount_wild.union(self._min_discount_sids[:end])
+
+    def _category_candidates(self, product):
+        hits = set(self.category_wild)
+        for category in product_categories(product):
+            hits |= self.category_index.get(category, set())
+        return hits
+
+    def match_event(self, event):
+        """返回匹配该事件的订阅者编号集合"""
+        product = event['product']
+        candidates = self.event_index.get(event['type'], set())
+        if not candidates:
+            return set()
+
+        price_text = event.get('new_price') or product.get('price')
+        current_price, _ = parse_prices(price_text)
+        discount = discount_ratio(price_text)
+        # 降价事件用新旧价格计算折扣
+        if event['type'] == EVENT_PRICE_CHANGE:
+            old_price, _ = parse_prices(event.get('old_price'))
+            if old_price and current_price and old_price > current_price:
+                discount = max(discount, 1 - current_price / old_price)
+
+        # 先算代价低的维度，候选集为空时尽早结束
+        for narrow in (
+            lambda: self._price_candidates(current_price),
+            lambda: self._discount_candidates(discount),
+            lambda: self._category_candidates(product),
+            lambda: self._keyword_candidates(product.get('name') or ''),
+        ):
+            candidates = candidates & narrow()
+            if not candidates:
+                break
+        return candidates
+
+    def build_digests(self, changes):
+        """为每个订阅者生成个性化的变化摘要
+
+        返回 {email: changes}，只包含有匹配事件的订阅者。
+        """
+        matched = {}
+        for event in iter_change_events(changes):
+            for sid in self.match_event(event):
+                matched.setdefault(sid, []).append(event)
+
+        return {
+            self.subscribers[sid]['email']: events_to_changes(events)
+            for sid, events in matched.items()
+        }
+
+
+def send_subscriber_digests(changes, filename=SUBSCRIBERS_FILE, on_sent=None, on_failed=None):
+    """按订阅规则给每个订阅者发送一封摘要邮件
+
+    返回 None 表示没有配置订阅文件（调用方应回退到单收件人通知），
+    否则返回成功发送的邮件数量。on_sent(email, digest) 在每封邮件发送成功后调用，
+    on_failed(email, digest) 在发送失败后调用。
+    """
+    subscribers = load_subscribers(filename)
+    if not subscribers:
+        return None
+
+    from email_notifier import send_change_notification
+
+    digests = SubscriptionIndex(subscribers).build_digests(changes)
+    logger.info(f"订阅匹配: {len(digests)}/{len(subscribers)} 个订阅者有相关变化")
+
+    sent = 0
+    for email, digest in digests.items():
+        if send_change_notification(digest, receiver_email=email):
+            sent += 1
+            if on_sent:
+                on_sent(email, digest)
+        elif on_failed:
+            on_failed(email, digest)
+    return sent
@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+"""
+HTTP 响应缓存测试 - 对本地模拟网站（mock_server.py）的详情页验证 TTL、ETag / 304 和并发访问
+
+    python3 -m pytest test_http_cache.py
+    python3 test_http_cache.py
+"""
+
+import time
+import shutil
+import tempfile
+import unittest
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+import mock_server
+from http_cache import HTTPCache
+
+
+class UrllibResponse:
+    def __init__(self, status_code, content, headers):
+        self.status_code = status_code
+        self.content = content
+        self.headers = headers
+
+
+class UrllibSession:
+    """与 requests.Session 接口相同的最小会话（HTTPCache 只用到 headers 和 get）"""
+
+    def __init__(self):
+        self.headers = {'Accept': 'text/html', 'Accept-Language': 'zh-CN'}
+
+    def get(self, url, timeout=30, headers=None):
+        request = urllib.request.Request(url, headers=headers or {})
+        try:
+            with urllib.request.urlopen(request, timeout=timeout) as response:
+                return UrllibResponse(response.status, response.read(), dict(response.headers))
+        except urllib.error.HTTPError as e:
+            return UrllibResponse(e.code, e.read(), dict(e.headers))
+
+
+def make_session():
+    try:
+        import requests
+    except ImportError:
+        return UrllibSession()
+    return requests.Session()
+
+
+class HTTPCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.catalog = mock_server.MockCatalog(size=20)
+        self.server = mock_server.start_server(self.catalog)
+        self.base = self.server.url.split('/ca/')[0]
+        self.slugs = [p['id'] for p in self.catalog.snapshot()]
+        self.tmp = tempfile.mkdtemp()
+        self.session = make_session()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+    def url(self, slug):
+        return f"{self.base}{mock_server.DETAIL_PREFIX}{slug}"
+
+    def cache(self):
+        return HTTPCache(cache_dir=self.tmp, default_ttl=300)
+
+    def requests_seen(self, total):
+        """服务器写完响应后才计数，等计数追上客户端"""
+        deadline = time.monotonic() + 2
+        while sum(self.catalog.requests.values()) < total and time.monotonic() < deadline:
+            time.sleep(0.01)
+        return dict(self.catalog.requests)
+
+    def test_fresh_entry_served_without_request(self):
+        cache = self.cache()
+        first = cache.fetch(self.session, self.url(self.slugs[0]))
+        second = cache.fetch(self.session, self.url(self.slugs[0]))
+        self.assertFalse(first.from_cache)
+        self.assertTrue(second.from_cache)
+        self.assertEqual(first.content, second.content)
+        self.assertEqual(self.requests_seen(1), {'200': 1})
+        self.assertEqual(cache.stats['hits'], 1)
+
+    def test_expired_entry_revalidated_with_etag(self):
+        self.catalog.configure(max_age=0)
+        cache = self.cache()
+        first = cache.fetch(self.session, self.url(self.slugs[0]))
+        second = cache.fetch(self.session, self.url(self.slugs[0]))
+        self.assertTrue(second.from_cache)
+        self.assertEqual(first.content, second.content)
+        self.assertEqual(self.requests_seen(2), {'200': 1, '304': 1})
+        self.assertEqual(cache.stats['revalidated'], 1)
+
+    def test_changed_page_refetched(self):
+        self.catalog.configure(max_age=0)
+        cache = self.cache()
+        cache.fetch(self.session, self.url(self.slugs[0]))
+        # 降价让详情页内容和 ETag 都变化
+        self.catalog.products[self.slugs[0]]['price'] += 1
+        second = cache.fetch(self.session, self.url(self.slugs[0]))
+        self.assertFalse(second.from_cache)
+        self.assertEqual(self.requests_seen(2), {'200': 2})
+
+    def test_no_cache_and_must_revalidate_always_revalidate(self):
+        for cache_control in ('no-cache', 'must-revalidate', 'private, no-cache'):
+            with self.subTest(cache_control=cache_control):
+                self.catalog.reset()
+                self.catalog.configure(cache_control=cache_control)
+                cache = HTTPCache(cache_dir=tempfile.mkdtemp(dir=self.tmp), default_ttl=300)
+                cache.fetch(self.session, self.url(self.slugs[0]))
+                second = cache.fetch(self.session, self.url(self.slugs[0]))
+                self.assertTrue(second.from_cache)
+                self.assertEqual(self.requests_seen(2), {'200': 1, '304': 1})
+
+    def test_no_store_not_cached_regardless_of_case(self):
+        for cache_control in ('no-store', 'No-Store', 'private, NO-STORE'):
+            with self.subTest(cache_control=cache_control):
+                self.catalog.reset()
+                self.catalog.configure(cache_control=cache_control)
+                cache = HTTPCache(cache_dir=tempfile.mkdtemp(dir=self.tmp), default_ttl=300)
+                cache.fetch(self.session, self.url(self.slugs[0]))
+                second = cache.fetch(self.session, self.url(self.slugs[0]))
+                self.assertFalse(second.from_cache)
+                self.assertEqual(len(cache.index), 0)
+                self.assertEqual(self.requests_seen(2), {'200': 2})
+
+    def test_index_persisted_across_runs(self):
+        cache = self.cache()
+        cache.fetch(self.session, self.url(self.slugs[0]))
+        cache.save()
+        again = self.cache().fetch(self.session, self.url(self.slugs[0]))
+        self.assertTrue(again.from_cache)
+        self.assertEqual(self.requests_seen(1), {'200': 1})
+
+    def test_concurrent_fetches_counted(self):
+        self.catalog.configure(max_age=0)
+        cache = self.cache()
+        urls = [self.url(slug) for slug in self.slugs] * 5
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            list(pool.map(lambda url: cache.fetch(self.session, url), urls))
+        stats = cache.stats
+        self.assertEqual(stats['hits'] + stats['revalidated'] + stats['misses'], len(urls))
+        self.assertEqual(sum(self.requests_seen(len(urls)).values()), len(urls))
+        self.assertEqual(len(cache.index), len(self.slugs))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+"""
+通知分发测试 - 对本地 SMTP / HTTP 替身并发发送，不访问外部服务
+
+    python3 -m pytest test_notification_dispatcher.py
+    python3 test_notification_dispatcher.py
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import tempfile
+import threading
+import unittest
+import subprocess
+import socketserver
+import importlib.util
+from email import message_from_bytes
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+
+from notification_dispatcher import NotificationDispatcher
+from send_notification import NotificationSender
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def sample_changes(new_count=1):
+    """monitor_selenium.py 格式的变化"""
+    new_products = [{'name': f'Beta Jacket #{i}', 'price': 'CA$400.00',
+                     'link': f'http://127.0.0.1/shop/beta-{i}'} for i in range(new_count)]
+    return {
+        'timestamp': datetime.now().isoformat(),
+        'statistics': {'total_products': 10, 'new_count': new_count,
+                       'price_changed_count': 0, 'removed_count': 0},
+        'new_products': new_products,
+        'price_changes': [],
+        'removed_products': [],
+    }
+
+
+class SMTPStub(socketserver.StreamRequestHandler):
+    """最小的 SMTP 替身：接受一封邮件并记录 DATA 内容"""
+
+    def reply(self, line):
+        self.wfile.write(line.encode() + b'\r\n')
+
+    def handle(self):
+        self.reply('220 localhost ESMTP stub')
+        while True:
+            line = self.rfile.readline().decode('utf-8', 'replace').strip()
+            if not line:
+                return
+            command = line.split(' ', 1)[0].upper()
+            if command in ('EHLO', 'HELO'):
+                self.reply('250 localhost')
+            elif command == 'DATA':
+                self.reply('354 end with .')
+                data = []
+                while True:
+                    chunk = self.rfile.readline()
+                    if chunk in (b'.\r\n', b'.\n', b''):
+                        break
+                    data.append(chunk)
+                self.server.messages.append(b''.join(data))
+                self.reply('250 queued')
+            elif command == 'QUIT':
+                self.reply('221 bye')
+                return
+            else:
+                self.reply('250 ok')
+
+
+class WebhookStub(BaseHTTPRequestHandler):
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        self.server.payloads.append(json.loads(body))
+        self.send_response(200)
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+class DispatcherTest(unittest.TestCase):
+
+    def setUp(self):
+        self.smtp = socketserver.ThreadingTCPServer(('127.0.0.1', 0), SMTPStub)
+        self.smtp.daemon_threads = True
+        self.smtp.messages = []
+        self.http = ThreadingHTTPServer(('127.0.0.1', 0), WebhookStub)
+        self.http.payloads = []
+        for server in (self.smtp, self.http):
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+
+        self.tmp = tempfile.mkdtemp()
+        self.changes_file = os.path.join(self.tmp, 'changes.json')
+
+    def tearDown(self):
+        for server in (self.smtp, self.http):
+            server.shutdown()
+            server.server_close()
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+    def sender(self, changes):
+        with open(self.changes_file, 'w', encoding='utf-8') as f:
+            json.dump(changes, f, ensure_ascii=False)
+        return NotificationSender(self.changes_file)
+
+    def test_email_and_webhook_sent_concurrently(self):
+        sender = self.sender(sample_changes())
+        dispatcher = NotificationDispatcher(default_timeout=10, default_retries=0)
+        smtp_port = self.smtp.server_address[1]
+        with mock.patch.dict(os.environ, {'SMTP_STARTTLS': '0'}):
+            dispatcher.add_channel('email', lambda timeout: sender.send_email(
+                'monitor@example.com', '', 'me@example.com',
+                smtp_server='127.0.0.1', smtp_port=smtp_port, timeout=timeout))
+            if importlib.util.find_spec('requests'):
+                url = f'http://127.0.0.1:{self.http.server_address[1]}/hook'
+                dispatcher.add_channel('webhook', lambda timeout: sender.send_webhook(
+                    url, 'slack', timeout=timeout))
+            summary = dispatcher.dispatch()
+
+        self.assertTrue(all(result['success'] for result in summary.values()), summary)
+        self.assertEqual(len(self.smtp.messages), 1)
+        body = message_from_bytes(self.smtp.messages[0]).get_payload()[0].get_payload(decode=True)
+        self.assertIn('Beta Jacket #0', body.decode('utf-8'))
+        if 'webhook' in summary:
+            self.assertEqual(len(self.http.payloads), 1)
+            self.assertIn('blocks', self.http.payloads[0])
+
+    def test_failed_channel_is_retried(self):
+        sender = self.sender(sample_changes())
+        dispatcher = NotificationDispatcher(default_timeout=10, default_retries=1, retry_backoff=0.01)
+        # 没有服务在监听的端口
+        with socketserver.TCPServer(('127.0.0.1', 0), SMTPStub) as closed:
+            port = closed.server_address[1]
+        dispatcher.add_channel('email', lambda timeout: sender.send_email(
+            'monitor@example.com', '', 'me@example.com',
+            smtp_server='127.0.0.1', smtp_port=port, timeout=timeout))
+        summary = dispatcher.dispatch()
+        self.assertFalse(summary['email']['success'])
+        self.assertEqual(summary['email']['attempts'], 2)
+
+    def test_hung_channel_does_not_block(self):
+        dispatcher = NotificationDispatcher(default_retries=0)
+        dispatcher.add_channel('hung', lambda timeout: time.sleep(60), timeout=0.2)
+        dispatcher.add_channel('fast', lambda timeout: True, timeout=5)
+        started = time.monotonic()
+        summary = dispatcher.dispatch()
+        self.assertLess(time.monotonic() - started, 5)
+        self.assertFalse(summary['hung']['success'])
+        self.assertTrue(summary['fast']['success'])
+
+    def test_hung_channel_does_not_block_exit(self):
+        script = (
+            "import time\n"
+            "from notification_dispatcher import NotificationDispatcher\n"
+            "d = NotificationDispatcher(default_retries=0)\n"
+            "d.add_channel('hung', lambda timeout: time.sleep(60), timeout=0.2)\n"
+            "d.dispatch()\n"
+        )
+        started = time.monotonic()
+        subprocess.run([sys.executable, '-c', script], cwd=HERE, check=True, timeout=30)
+        self.assertLess(time.monotonic() - started, 10)
+
+    def test_no_changes_is_not_a_failure(self):
+        self.sender(sample_changes(new_count=0))
+        env = dict(os.environ, SENDER_EMAIL='monitor@example.com', SENDER_PASSWORD='x',
+                   SMTP_SERVER='127.0.0.1', SMTP_PORT=str(self.smtp.server_address[1]))
+        result = subprocess.run(
+            [sys.executable, os.path.join(HERE, 'send_notification.py'), '--email',
+             '--changes-file', self.changes_file],
+            cwd=self.tmp, env=env, capture_output=True, text=True, timeout=30)
+        self.assertEqual(result.returncode, 0, result.stdout + result.stderr)
+        self.assertIn('没有变化', result.stdout)
+        self.assertEqual(self.smtp.messages, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
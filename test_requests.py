@@ -3,10 +3,11 @@
 使用 requests 测试
 """
 
-import requests
 import re
 import json
 
+from http_session import get_session
+
 def test_with_requests():
     print("=" * 60)
     print("使用 requests 测试")
@@ -14,18 +15,12 @@ def test_with_requests():
     
     url = "https://outlet.arcteryx.com/ca/zh/c/mens"
     
-    headers = {
-        'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
-        'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,*/*;q=0.8',
-        'Accept-Language': 'zh-CN,zh;q=0.9,en;q=0.8',
-        'Accept-Encoding': 'gzip, deflate, br',
-        'Connection': 'keep-alive',
-        'Upgrade-Insecure-Requests': '1',
-    }
+    # 共享 Session 自带浏览器请求头，只在装了 brotli 时声明 br
+    session = get_session()
     
     try:
         print(f"\n请求: {url}")
-        response = requests.get(url, headers=headers, timeout=30)
+        response = session.get(url, headers={'Upgrade-Insecure-Requests': '1'}, timeout=30)
         print(f"✓ 状态码: {response.status_code}")
         print(f"✓ 内容长度: {len(response.text)} 字符")
         
@@ -9,6 +9,8 @@ from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 
+from driver_cache import chrome_major_version, cached_driver_path
+
 def test_with_undetected():
     print("=" * 60)
     print("使用 undetected-chromedriver 测试")
@@ -22,7 +24,13 @@ def test_with_undetected():
         options.headless = True
         options.add_argument('--window-size=1920,1080')
         
-        driver = uc.Chrome(options=options, version_main=141)  # 指定Chrome版本
+        version_main = chrome_major_version()
+        driver_path = cached_driver_path(version_main)
+        if driver_path:
+            driver = uc.Chrome(options=options, version_main=version_main,
+                               driver_executable_path=driver_path)
+        else:
+            driver = uc.Chrome(options=options, version_main=version_main)
         driver.set_page_load_timeout(60)
         
         print("✓ 浏览器已启动")